@@ -1,33 +1,129 @@
-from flask import Flask, request, jsonify
+from flask import Blueprint, Flask, Response, current_app, g, request, jsonify, stream_with_context
 from flask_cors import CORS
 from flask_sqlalchemy import SQLAlchemy
-from datetime import datetime
-import requests
+from sqlalchemy.exc import IntegrityError
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from datetime import date, datetime, timedelta
+from functools import partial
+import csv
+import math
 import os
+import threading
+import time
 
-app = Flask(__name__)
+from bulk import BulkImportError, iter_csv_rows, iter_export, iter_ndjson_rows, upsert_hospitals
+from cache import TileRefresher, create_last_good_store, create_tile_cache
+from database import ReadRouter, configure_engines
+from events import CLOSED, Event, EventBroker, format_sse
+from geo import bounding_box, haversine_m
+from metrics import Metrics, MetricsMiddleware
+from notifications import create_dispatcher
+from opening_hours import ALWAYS_OPEN, ScheduleCache, is_open, minute_of_week
+from overpass import (
+    OverpassError, OverpassTimeout, build_overpass_query, create_overpass_client, parse_facilities
+)
+from pagination import PaginationError, keyset_page, listing_etag
+from prefetch import load_prefetched_tiles
+from ranking import decode_cursor, parse_types, rank_facilities
+from ratelimit import ClientRateLimiter, ConcurrencyLimiter, LimitExceeded
+from routing import SpeedModel, nearest_facilities
+from scheduling import (
+    SchedulingError, booked_per_slot, iter_slots, parse_date, parse_local_datetime, parse_rules, parse_timezone,
+    slot_for
+)
+from schema import LazySchema
+from search import create_search_index, facility_document
+from serializers import RowSerializer, dumps, dumps_bytes, loads
+from snapshot import FacilitySnapshot, SnapshotError
+from spatial import GridIndex
+from streaming import iter_json_response, iter_ndjson
+from writebehind import create_write_behind, decode_row
 
-# Load configuration
-try:
-    from config import Config
-    app.config.from_object(Config)
-    CORS(app, origins=Config.ALLOWED_ORIGINS)
-except ImportError:
-    # Fallback if config.py doesn't exist
-    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///database.db'
-    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-    CORS(app)
+db = SQLAlchemy()
+metrics = Metrics()
+schema = LazySchema(db)
+api = Blueprint('api', __name__)
 
-db = SQLAlchemy(app)
+# Per-process services, built by create_app()
+read_db = None
+nearby_cache = None
+last_good = None
+tile_refresher = None
+overpass_client = None
+emergency_broker = None
+hospital_index = None
+opening_schedules = None
+search_index = None
+notification_dispatcher = None
+write_behind = None
+id_allocators = {}
+background_pending = False
+background_lock = threading.Lock()
+facility_snapshot = None
+snapshot_lock = threading.Lock()
+
+# Admission control: per-client rate limit and a cap on in-flight requests with
+# slots reserved for priority writes, so a burst of searches cannot tie up every worker
+client_limiter = None
+request_limiter = None
+# Writes that always get a worker, and endpoints that bypass both limits
+PRIORITY_ENDPOINTS = {'api.create_appointment', 'api.create_emergency_alert'}
+UNLIMITED_ENDPOINTS = {'api.health_check', 'api.get_metrics', 'api.stream_emergencies'}
+# Endpoints that never touch the database, so they do not wait for schema setup
+SCHEMALESS_ENDPOINTS = {'api.health_check', 'api.get_metrics'}
+
+metrics.registry.gauge('nearby_cache_hits', 'Nearby tile cache hits since start',
+                       lambda: nearby_cache.stats().get('hits'))
+metrics.registry.gauge('nearby_cache_misses', 'Nearby tile cache misses since start',
+                       lambda: nearby_cache.stats().get('misses'))
+metrics.registry.gauge('nearby_cache_hit_ratio', 'Nearby tile cache hit ratio since start',
+                       lambda: nearby_cache.stats().get('hit_ratio'))
+metrics.registry.gauge('nearby_cache_bytes', 'Bytes held by the nearby tile cache',
+                       lambda: nearby_cache.stats().get('bytes'))
+metrics.registry.gauge('nearby_cache_prefetch_hits', 'Nearby tile lookups answered from the prefetch artifact',
+                       lambda: nearby_cache.stats().get('prefetch_hits'))
+metrics.registry.gauge('overpass_coalesced_requests', 'Overpass queries served by an identical in-flight query',
+                       lambda: overpass_client.stats()['coalesced'])
+metrics.registry.gauge('overpass_mirror_latency_seconds', 'Smoothed response time per Overpass mirror',
+                       lambda: {url: latency for url, latency in overpass_client.stats()['latency'].items()
+                                if latency is not None},
+                       labelnames=('mirror',))
+metrics.registry.gauge('rate_limited_requests', 'Requests rejected by the per-client rate limit',
+                       lambda: client_limiter.rejected)
+metrics.registry.gauge('shed_requests', 'Requests rejected because too many were in flight',
+                       lambda: request_limiter.rejected)
+metrics.registry.gauge('hospital_index_points', 'Custom hospitals in the in-memory spatial index',
+                       lambda: len(hospital_index))
+metrics.registry.gauge('search_documents', 'Facilities in the /api/search index',
+                       lambda: len(search_index))
+metrics.registry.gauge('opening_hours_compiled', 'opening_hours values compiled into weekly bitmaps since start',
+                       lambda: opening_schedules.compiled)
+metrics.registry.gauge('write_behind_pending', 'Journaled appointment rows not yet inserted',
+                       lambda: write_behind.pending() if write_behind is not None else 0)
+metrics.registry.gauge('write_behind_flushed', 'Journaled rows inserted by the write-behind flusher since start',
+                       lambda: write_behind.flushed if write_behind is not None else 0)
+metrics.registry.gauge('nearby_refreshes_pending', 'Tile fetches running or queued in the background',
+                       lambda: tile_refresher.pending())
+emergency_routing = metrics.registry.histogram(
+    'emergency_routing_seconds', 'Time to find the nearest capable facilities for an alert', ('outcome',))
 
 # Models
 class Appointment(db.Model):
+    __table_args__ = (
+        db.Index('ix_appointment_created_id', 'created_at', 'id'),
+        # Interval lookups: overlapping appointments start within max duration before the range
+        db.Index('ix_appointment_hospital_start', 'hospital_id', 'start_at'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
     phone = db.Column(db.String(20), nullable=False)
-    date = db.Column(db.String(50), nullable=False)
+    date = db.Column(db.String(50), nullable=False)  # as submitted; start_at is the typed time
     reason = db.Column(db.String(200), nullable=False)
-    facility_name = db.Column(db.String(200))
+    facility_name = db.Column(db.String(200), index=True)
+    hospital_id = db.Column(db.Integer, db.ForeignKey('hospital.id'))
+    start_at = db.Column(db.DateTime)  # local time at the facility
+    end_at = db.Column(db.DateTime)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
     def to_dict(self):
@@ -38,15 +134,21 @@ class Appointment(db.Model):
             'date': self.date,
             'reason': self.reason,
             'facility_name': self.facility_name,
+            'hospital_id': self.hospital_id,
+            'start_at': self.start_at.isoformat() if self.start_at else None,
+            'end_at': self.end_at.isoformat() if self.end_at else None,
             'created_at': self.created_at.isoformat()
         }
 
 class EmergencyAlert(db.Model):
+    __table_args__ = (db.Index('ix_emergency_alert_created_id', 'created_at', 'id'),)
+
     id = db.Column(db.Integer, primary_key=True)
     latitude = db.Column(db.Float, nullable=False)
     longitude = db.Column(db.Float, nullable=False)
     message = db.Column(db.String(500))
     user_info = db.Column(db.String(200))
+    nearest_facilities = db.Column(db.Text)  # JSON list of routes from routing.py, None if not computed
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
     def to_dict(self):
@@ -56,12 +158,15 @@ class EmergencyAlert(db.Model):
             'longitude': self.longitude,
             'message': self.message,
             'user_info': self.user_info,
+            'nearest_facilities': loads(self.nearest_facilities),
             'created_at': self.created_at.isoformat()
         }
 
 class Hospital(db.Model):
+    __table_args__ = (db.Index('ix_hospital_lat_lon', 'latitude', 'longitude'),)
+
     id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String(200), nullable=False)
+    name = db.Column(db.String(200), nullable=False, index=True)
     type = db.Column(db.String(50), nullable=False)  # hospital, clinic, pharmacy, etc.
     latitude = db.Column(db.Float, nullable=False)
     longitude = db.Column(db.Float, nullable=False)
@@ -89,103 +194,703 @@ class Hospital(db.Model):
             'created_at': self.created_at.isoformat()
         }
 
-# Create tables
-with app.app_context():
-    db.create_all()
+class CapacityRule(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    hospital_id = db.Column(db.Integer, db.ForeignKey('hospital.id'), nullable=False, index=True)
+    weekday = db.Column(db.Integer)  # 0 = Monday ... 6 = Sunday; NULL for every day without its own rules
+    opens_at = db.Column(db.Time, nullable=False)
+    closes_at = db.Column(db.Time, nullable=False)
+    slot_minutes = db.Column(db.Integer, nullable=False, default=30)
+    capacity = db.Column(db.Integer, nullable=False, default=1)  # overlapping appointments per slot
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'hospital_id': self.hospital_id,
+            'weekday': self.weekday,
+            'opens_at': self.opens_at.strftime('%H:%M'),
+            'closes_at': self.closes_at.strftime('%H:%M'),
+            'slot_minutes': self.slot_minutes,
+            'capacity': self.capacity
+        }
+
+class NotificationOutbox(db.Model):
+    __table_args__ = (db.Index('ix_notification_outbox_due', 'status', 'next_attempt_at'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    channel = db.Column(db.String(20), nullable=False)  # sms, email, push
+    recipient = db.Column(db.String(200), nullable=False)
+    subject = db.Column(db.String(200))
+    body = db.Column(db.Text, nullable=False)
+    alert_id = db.Column(db.Integer, db.ForeignKey('emergency_alert.id'), index=True)
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending, sending, sent, dead
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    last_error = db.Column(db.String(500))
+    next_attempt_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'channel': self.channel,
+            'recipient': self.recipient,
+            'subject': self.subject,
+            'alert_id': self.alert_id,
+            'status': self.status,
+            'attempts': self.attempts,
+            'last_error': self.last_error,
+            'created_at': self.created_at.isoformat(),
+            'sent_at': self.sent_at.isoformat() if self.sent_at else None
+        }
+
+class IdBlock(db.Model):
+    """Next id not yet reserved per table, for write-behind inserts (see writebehind.py)"""
+    name = db.Column(db.String(100), primary_key=True)
+    next_id = db.Column(db.Integer, nullable=False)
+
+class JournalSegment(db.Model):
+    """Write-behind journal segments already inserted, so a replay after a crash skips them"""
+    token = db.Column(db.String(32), primary_key=True)
+    applied_at = db.Column(db.DateTime, nullable=False, index=True)
+
+class ChangeCounter(db.Model):
+    """Per-table version bumped with every write, so other workers can tell their in-memory copies are stale"""
+    name = db.Column(db.String(100), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+# Listing serializers: same output as to_dict(), built from projected columns without ORM objects
+appointment_serializer = RowSerializer(
+    Appointment,
+    ('id', 'name', 'phone', 'date', 'reason', 'facility_name', 'hospital_id', 'start_at', 'end_at', 'created_at')
+)
+alert_serializer = RowSerializer(
+    EmergencyAlert, ('id', 'latitude', 'longitude', 'message', 'user_info', 'nearest_facilities', 'created_at'),
+    transforms={'nearest_facilities': loads}
+)
+hospital_serializer = RowSerializer(
+    Hospital,
+    ('id', 'name', 'type', 'latitude', 'longitude', 'address', 'phone',
+     'opening_hours', 'website', 'description', 'is_featured', 'created_at'),
+    transforms={'id': lambda value: f'custom_{value}'},
+    defaults={'address': 'Address not available', 'phone': 'N/A', 'opening_hours': 'N/A',
+              'website': '', 'description': ''}
+)
+
+def create_app(config_object=None):
+    """
+    Build the Flask app and this process's services.
+
+    Nothing here touches the database: the schema is created or migrated on
+    the first request that needs it (see schema.py), and the Overpass HTTP
+    session and NumPy are imported on first use. Background threads (the
+    notification dispatcher and the write-behind flusher) start on the first
+    request as well, and not at all when BACKGROUND_THREADS is off.
+    """
+    global read_db, nearby_cache, last_good, tile_refresher, overpass_client, emergency_broker
+    global hospital_index, opening_schedules, search_index, notification_dispatcher
+    global client_limiter, request_limiter, write_behind, id_allocators, background_pending
+
+    app = Flask(__name__)
+    expose_headers = ['X-Total-Count', 'X-Next-Cursor', 'X-Stale', 'X-Degraded', 'Retry-After']
+
+    # Load configuration
+    try:
+        from config import Config
+        app.config.from_object(config_object or Config)
+        CORS(app, origins=app.config.get('ALLOWED_ORIGINS', '*'), expose_headers=expose_headers)
+    except ImportError:
+        # Fallback if config.py doesn't exist
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///database.db'
+        app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+        CORS(app, expose_headers=expose_headers)
+
+    db.init_app(app)
+    metrics.slow_threshold = app.config.get('SLOW_REQUEST_THRESHOLD', 1.0)
+    with app.app_context():
+        configure_engines(db, app.config)
+        for engine in db.engines.values():
+            metrics.watch_engine(engine)
+    read_db = ReadRouter(db, app)
+    if app.config.get('METRICS_ENABLED', True):
+        app.wsgi_app = MetricsMiddleware(app.wsgi_app, metrics)
+
+    nearby_cache = create_tile_cache(app.config)
+    load_prefetched_tiles(nearby_cache, app.config)
+    last_good = create_last_good_store(app.config)
+    tile_refresher = TileRefresher(
+        workers=app.config.get('OVERPASS_MAX_CONCURRENCY', 4),
+        max_pending=app.config.get('NEARBY_REFRESH_MAX_PENDING', 32)
+    )
+    overpass_client = create_overpass_client(app.config)
+    emergency_broker = EventBroker(app.config.get('EMERGENCY_STREAM_QUEUE_SIZE', 100))
+    hospital_index = GridIndex(app.config.get('HOSPITAL_INDEX_CELL_DEG', 0.05))
+    opening_schedules = ScheduleCache(app.config.get('OPENING_HOURS_CACHE_SIZE', 50000))
+    search_index = create_search_index(app.config)
+    notification_dispatcher = create_dispatcher(app, db, NotificationOutbox, prepare=ensure_background_schema)
+
+    client_limiter = ClientRateLimiter(app.config.get('RATE_LIMIT_PER_IP', 5.0), app.config.get('RATE_LIMIT_BURST', 20))
+    request_limiter = ConcurrencyLimiter(
+        app.config.get('MAX_INFLIGHT_REQUESTS', 64),
+        reserved=app.config.get('PRIORITY_RESERVED_REQUESTS', 8)
+    )
+
+    write_behind, id_allocators = None, {}
+    if app.config.get('BACKGROUND_THREADS', True):
+        write_behind, id_allocators = create_write_behind(
+            app, db, flush_journaled_rows, IdBlock.__table__, [Appointment.__table__]
+        )
+    elif app.config.get('WRITE_BEHIND_ENABLED', False):
+        app.logger.warning('WRITE_BEHIND_ENABLED is ignored without BACKGROUND_THREADS; appointments are inserted directly')
+    background_pending = True
+
+    app.register_blueprint(api)
+    return app
+
+def fetch_overpass_facilities(lat, lon, radius):
+    """Query the Overpass API for facilities within radius meters of a point"""
+    query = build_overpass_query(lat, lon, radius, timeout=current_app.config.get('OVERPASS_TIMEOUT', 30))
+    with metrics.track_upstream():
+        return overpass_client.query(query, parse=parse_facilities)
+
+def get_snapshot():
+    """Load the offline facility snapshot on first use, or None if there is none"""
+    global facility_snapshot
+    if facility_snapshot is None:
+        path = current_app.config.get('NEARBY_SNAPSHOT_PATH', 'facilities.snap')
+        with snapshot_lock:
+            if facility_snapshot is None and os.path.exists(path):
+                facility_snapshot = FacilitySnapshot.load(path)
+    return facility_snapshot
+
+def refresh_tile(app, tile):
+    """Fetch a tile from Overpass and record it in the cache and last-known-good store"""
+    # Runs on a refresher thread, outside the request that asked for it; the refresher's
+    # pool size is the cap on concurrent Overpass calls
+    with app.app_context():
+        facilities = fetch_overpass_facilities(tile.center_lat, tile.center_lon, tile.fetch_radius)
+    nearby_cache.set(tile, facilities)
+    opening_schedules.invalidate(facility['id'] for facility in facilities)
+    search_index.add_many(facility_document(facility) for facility in facilities)
+    if last_good is not None:
+        last_good.set(tile, facilities)
+    return facilities
+
+def local_fallback_facilities(lat, lon, radius):
+    """Facilities from the offline snapshot, if one is loaded; custom hospitals are added by the caller"""
+    try:
+        snapshot = get_snapshot()
+    except SnapshotError:
+        return []
+    if snapshot is None:
+        return []
+    return snapshot.facilities_within(lat, lon, radius)
+
+def nearby_source_facilities(lat, lon, radius):
+    """
+    Return (facilities, stale, degraded) covering the search circle from the
+    configured NEARBY_SOURCE.
+
+    stale: an expired cached or last-known-good result was served while a
+    background refresh runs. degraded: Overpass gave no answer within
+    NEARBY_UPSTREAM_BUDGET seconds (or failed) and only local data is returned.
+    """
+    source = current_app.config.get('NEARBY_SOURCE', 'overpass')
+    if source in ('local', 'hybrid'):
+        snapshot = get_snapshot()
+        if snapshot is not None and (source == 'local' or snapshot.covers(lat, lon, radius)):
+            return snapshot.facilities_within(lat, lon, radius), False, False
+        if source == 'local':
+            raise SnapshotError('Local facility snapshot is not available')
+
+    # Serve from the tile cache when a covering search was made recently;
+    # the tile may extend past the search circle, ranking trims it exactly
+    tile = nearby_cache.tile_for(lat, lon, radius)
+    facilities = nearby_cache.get(tile)
+    if facilities is not None:
+        return facilities, False, False
+
+    refresh_key = tile.key or (lat, lon, radius)
+    refresh = partial(refresh_tile, current_app._get_current_object(), tile)
+    stale = nearby_cache.get_stale(tile)
+    if stale is None and last_good is not None:
+        record = last_good.get(tile)
+        stale = record[0] if record is not None else None
+    if stale is not None:
+        # Stale-while-revalidate: answer now, refresh in the background
+        try:
+            tile_refresher.submit(refresh_key, refresh)
+        except LimitExceeded:
+            pass
+        return stale, True, False
+
+    # Nothing to fall back on: wait for Overpass, but only for the foreground budget.
+    # A fetch that outlives the budget keeps running and fills the cache for later requests.
+    try:
+        future = tile_refresher.submit(refresh_key, refresh)
+        with metrics.upstream_wait():
+            facilities = future.result(timeout=current_app.config.get('NEARBY_UPSTREAM_BUDGET', 5.0))
+        return facilities, False, False
+    except (FutureTimeoutError, LimitExceeded, OverpassError):
+        if not current_app.config.get('NEARBY_DEGRADED_FALLBACK', True):
+            raise
+        return local_fallback_facilities(lat, lon, radius), False, True
+
+def ensure_background_schema():
+    """Schema setup for background threads, which run outside any request; needs an app context"""
+    if current_app.config.get('SCHEMA_AUTO_MIGRATE', True):
+        schema.ensure()
+
+def row_values(instance):
+    """Column values of a model instance, keyed by column name"""
+    return {column.name: getattr(instance, column.key) for column in instance.__table__.columns}
+
+def journal_insert(instance):
+    """Give a new row an allocated id and journal it for the write-behind flusher"""
+    table = instance.__table__.name
+    instance.id = id_allocators[table].next_id()
+    write_behind.submit(table, row_values(instance))
+
+def flush_journaled_rows(records):
+    """
+    Insert a batch of journaled rows in one transaction, recording their
+    journal segments as applied. Runs on the write-behind thread; records of
+    segments applied before (a replayed batch that had committed) are skipped.
+    """
+    ensure_background_schema()
+    tokens = sorted({record['segment'] for record in records})
+    applied = set()
+    for start in range(0, len(tokens), 500):
+        applied.update(token for token, in db.session.query(JournalSegment.token)
+                       .filter(JournalSegment.token.in_(tokens[start:start + 500])))
+
+    models = {'appointment': Appointment}
+    rows_by_model = {}
+    for record in records:
+        if record['segment'] in applied:
+            continue
+        model = models[record['table']]
+        rows_by_model.setdefault(model, []).append(decode_row(model.__table__, record['values']))
+
+    for model, rows in rows_by_model.items():
+        ids = [row['id'] for row in rows]
+        taken = set()
+        for start in range(0, len(ids), 500):
+            taken.update(row_id for row_id, in db.session.query(model.id).filter(model.id.in_(ids[start:start + 500])))
+        for row in rows:
+            if row['id'] in taken:
+                # Never applied, yet its id is in use (ids handed out twice): keep the row under a new id
+                new_id = id_allocators[model.__tablename__].next_id()
+                current_app.logger.error('Journaled %s %s collides with an existing row; inserted as %s',
+                                         model.__tablename__, row['id'], new_id)
+                row['id'] = new_id
+        db.session.execute(db.insert(model), rows)
+        # Allocated ids do not follow commit order, so listings take their ETag from this counter
+        bump_version(model.__tablename__)
+    now = datetime.utcnow()
+    new_tokens = [token for token in tokens if token not in applied]
+    if new_tokens:
+        db.session.execute(db.insert(JournalSegment), [{'token': token, 'applied_at': now} for token in new_tokens])
+    # A receipt only matters until its segment file is deleted, normally right after this commit
+    cutoff = now - timedelta(days=current_app.config.get('WRITE_BEHIND_RECEIPT_DAYS', 30))
+    db.session.execute(db.delete(JournalSegment).where(JournalSegment.applied_at < cutoff))
+    db.session.commit()
+
+def enqueue_emergency_notifications(alert):
+    """Queue SMS, email and push notifications for an alert in the current transaction"""
+    text = f'Emergency alert #{alert.id} at {alert.latitude}, {alert.longitude}: {alert.message}'
+    if alert.user_info:
+        text += f' ({alert.user_info})'
+    queued = [
+        notification_dispatcher.enqueue(
+            'sms', current_app.config.get('TWILIO_EMERGENCY_PHONE'), text, alert_id=alert.id),
+        notification_dispatcher.enqueue(
+            'email', current_app.config.get('SENDGRID_EMERGENCY_EMAIL'), text,
+            subject=f'Emergency alert #{alert.id}', alert_id=alert.id),
+        notification_dispatcher.enqueue(
+            'push', current_app.config.get('FIREBASE_EMERGENCY_TOPIC'), text,
+            subject='Emergency alert', alert_id=alert.id),
+    ]
+    return [message for message in queued if message is not None]
+
+def emergency_sources():
+    """
+    In-process facility sources for emergency routing; none of them waits on
+    Overpass, and each yields facilities one at a time so the routing budget
+    is checked inside a source too
+    """
+    def custom_hospitals(lat, lon, radius):
+        # A projected bounding-box query, never a grid rebuild or ORM objects for every hospital around
+        rows = (hospital_serializer.query(db.session)
+                .filter(Hospital.type == 'hospital', hospital_box_filter(lat, lon, radius))
+                .yield_per(100))
+        for row in rows:
+            yield hospital_serializer.encode(row)
+
+    def offline_snapshot(lat, lon, radius):
+        try:
+            snapshot = get_snapshot()
+        except SnapshotError:
+            return
+        if snapshot is not None:
+            yield from snapshot.iter_facilities_within(lat, lon, radius, types={'hospital'})
+
+    def cached_tiles(lat, lon, radius):
+        # Hospitals do not move, so an expired tile is as good as a fresh one here
+        return nearby_cache.get_stale(nearby_cache.tile_for(lat, lon, radius)) or []
+
+    return [custom_hospitals, offline_snapshot, cached_tiles]
+
+def route_emergency(lat, lon):
+    """
+    Return (routes, complete) for the nearest hospitals able to take an
+    emergency, within EMERGENCY_ROUTING_BUDGET seconds
+    """
+    config = current_app.config
+    require_24_7 = config.get('EMERGENCY_REQUIRE_24_7', True)
+
+    def accept(facility):
+        return facility.get('type') == 'hospital' and (
+            not require_24_7 or opening_schedules.get(facility['id'], facility.get('opening_hours')) == ALWAYS_OPEN)
+
+    return nearest_facilities(
+        lat, lon, emergency_sources(), accept, SpeedModel.from_config(config),
+        limit=config.get('EMERGENCY_NEAREST_COUNT', 3),
+        radii=config.get('EMERGENCY_ROUTING_RADII', [5000, 15000, 50000]),
+        budget=config.get('EMERGENCY_ROUTING_BUDGET', 0.25)
+    )
+
+def requested_open_minute():
+    """
+    Minute of the week an open_now=true or open_at= filter asks about, or
+    None without a filter. Times are local wall-clock time, like opening_hours;
+    open_now reads the clock in the client's tz= (IANA name or UTC offset),
+    else OPENING_HOURS_TIMEZONE, else the server's local time.
+    """
+    open_at = request.args.get('open_at')
+    if open_at:
+        return minute_of_week(parse_local_datetime(open_at, 'open_at'))
+    if request.args.get('open_now', '').lower() == 'true':
+        if request.args.get('tz'):
+            return minute_of_week(datetime.now(parse_timezone(request.args['tz'], 'tz')))
+        zone = current_app.config.get('OPENING_HOURS_TIMEZONE')
+        if zone:
+            return minute_of_week(datetime.now(parse_timezone(zone, 'OPENING_HOURS_TIMEZONE')))
+        return minute_of_week(datetime.now())
+    return None
+
+def open_facilities(facilities, minute):
+    """Keep the facilities whose opening_hours say they are open at a minute of the week"""
+    schedules = opening_schedules
+    return [facility for facility in facilities
+            if is_open(schedules.get(facility['id'], facility.get('opening_hours')), minute)]
+
+def bump_version(name):
+    """Increment a change counter in the current transaction and return its new value; the caller commits"""
+    counter = ChangeCounter.__table__
+    increment = db.update(counter).where(counter.c.name == name).values(version=counter.c.version + 1)
+    if not db.session.execute(increment).rowcount:
+        try:
+            with db.session.begin_nested():
+                db.session.execute(db.insert(counter).values(name=name, version=1))
+        except IntegrityError:
+            # Another worker created the row first
+            db.session.execute(increment)
+    # The row stays locked until commit, so this is the version our write produced
+    return db.session.execute(db.select(counter.c.version).where(counter.c.name == name)).scalar_one()
+
+def hospitals_written(version):
+    """
+    After this worker committed a hospital write at `version` and applied it
+    to its in-memory copies, mark the copies that were current as current
+    again, so only writes by other workers cause a rebuild
+    """
+    if hospital_index.version == version - 1:
+        hospital_index.version = version
+    if search_index.pinned_version == version - 1:
+        search_index.pinned_version = version
+
+def publish_hospital_changes():
+    """Bump the hospital counter in its own transaction, after writes that committed in chunks"""
+    try:
+        bump_version('hospital')
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        current_app.logger.exception('Could not record hospital changes; other workers catch up after HOSPITAL_INDEX_REFRESH')
+
+def current_version(name):
+    """The change counter of a table: one primary key lookup"""
+    return db.session.query(ChangeCounter.version).filter(ChangeCounter.name == name).scalar() or 0
+
+def hospital_index_stale(built_at, built_version, version):
+    """True if an in-memory copy of the hospitals needs reloading"""
+    # The counter catches writes by other workers; the age bound also catches rows changed outside the app
+    refresh = current_app.config.get('HOSPITAL_INDEX_REFRESH', 300)
+    return built_at is None or built_version != version or time.time() - built_at > refresh
+
+def refresh_search_hospitals():
+    """Reload custom hospitals into the search index when another worker changed them or it is too old"""
+    version = current_version('hospital')
+    if hospital_index_stale(search_index.pinned_built_at, search_index.pinned_version, version):
+        built_at = time.time()
+        hospitals = hospital_serializer.encode_many(hospital_serializer.query(db.session))
+        search_index.replace_pinned((facility_document(hospital) for hospital in hospitals), built_at, version)
+
+def hospital_box_filter(lat, lon, radius):
+    """SQL condition for hospitals inside the bounding box of a circle, served by the (latitude, longitude) index"""
+    min_lat, min_lon, max_lat, max_lon = bounding_box(lat, lon, radius)
+    if min_lon < -180:
+        lon_filter = db.or_(Hospital.longitude >= min_lon + 360, Hospital.longitude <= max_lon)
+    elif max_lon > 180:
+        lon_filter = db.or_(Hospital.longitude >= min_lon, Hospital.longitude <= max_lon - 360)
+    else:
+        lon_filter = Hospital.longitude.between(min_lon, max_lon)
+    return db.and_(Hospital.latitude.between(min_lat, max_lat), lon_filter)
+
+def hospitals_within(lat, lon, radius):
+    """Return custom hospitals within radius meters of a point, nearest first"""
+    if current_app.config.get('HOSPITAL_SPATIAL_INDEX', 'grid') == 'grid':
+        # The version is read before the rows, so a write in between triggers another rebuild
+        version = current_version('hospital')
+        if hospital_index_stale(hospital_index.built_at, hospital_index.version, version):
+            hospital_index.rebuild(db.session.query(Hospital.id, Hospital.latitude, Hospital.longitude), version)
+
+        order = {hospital_id: rank for rank, (hospital_id, _) in enumerate(hospital_index.query_radius(lat, lon, radius))}
+        ids = list(order)
+        hospitals = []
+        for start in range(0, len(ids), 500):
+            hospitals.extend(Hospital.query.filter(Hospital.id.in_(ids[start:start + 500])).all())
+        hospitals.sort(key=lambda hospital: order[hospital.id])
+        return hospitals
+
+    # Bounding-box prefilter on the (latitude, longitude) index, then exact distance
+    candidates = Hospital.query.filter(hospital_box_filter(lat, lon, radius)).all()
+
+    hospitals = []
+    for hospital in candidates:
+        distance = haversine_m(lat, lon, hospital.latitude, hospital.longitude)
+        if distance <= radius:
+            hospitals.append((distance, hospital))
+    hospitals.sort(key=lambda item: item[0])
+    return [hospital for _, hospital in hospitals]
+
+def overlapping_appointments(hospital_id, start, end):
+    """Query appointments at a hospital whose [start_at, end_at) overlaps [start, end)"""
+    earliest = start - timedelta(minutes=current_app.config.get('APPOINTMENT_MAX_DURATION_MINUTES', 240))
+    return Appointment.query.filter(
+        Appointment.hospital_id == hospital_id,
+        Appointment.start_at >= earliest,
+        Appointment.start_at < end,
+        Appointment.end_at > start
+    )
+
+def requested_slot(data):
+    """
+    Return (hospital, start_at, end_at, capacity) for a booking request.
+
+    Without hospital_id the booking is unscheduled: only start_at is filled
+    in, when the date parses. With hospital_id the start must be a slot of
+    one of the hospital's capacity rules (any time when it has none), and the
+    hospital row is locked so concurrent bookings for it are serialized.
+    """
+    hospital_id = data.get('hospital_id')
+    if hospital_id is None:
+        if 'start_at' in data:
+            return None, parse_local_datetime(data['start_at'], 'start_at'), None, None
+        try:
+            return None, parse_local_datetime(data['date'], 'date'), None, None
+        except SchedulingError:
+            # Free-form dates are still accepted for unscheduled bookings
+            return None, None, None, None
+
+    if not isinstance(hospital_id, int):
+        raise SchedulingError('hospital_id must be an integer')
+    hospital = db.session.get(Hospital, hospital_id, with_for_update=True)
+    if hospital is None:
+        raise SchedulingError(f'Hospital {hospital_id} does not exist')
+    start_at = parse_local_datetime(data.get('start_at') or data.get('date'), 'start_at')
+
+    rules = CapacityRule.query.filter_by(hospital_id=hospital_id).all()
+    if not rules:
+        end_at = start_at + timedelta(minutes=current_app.config.get('APPOINTMENT_SLOT_MINUTES', 30))
+        return hospital, start_at, end_at, current_app.config.get('APPOINTMENT_DEFAULT_CAPACITY', 1)
+    slot = slot_for(rules, start_at)
+    if slot is None:
+        raise SchedulingError('start_at is not a bookable slot at this hospital')
+    return (hospital, start_at) + slot
+
+@api.before_request
+def label_route():
+    """Label request metrics by URL rule rather than raw path to keep series bounded"""
+    if request.url_rule is not None:
+        request.environ[MetricsMiddleware.ROUTE_KEY] = request.url_rule.rule
+
+def client_ip():
+    if current_app.config.get('RATE_LIMIT_TRUST_FORWARDED', False):
+        return request.access_route[0]
+    return request.remote_addr
+
+def limit_response(message, status, retry_after):
+    response = jsonify({'error': message})
+    response.status_code = status
+    response.headers['Retry-After'] = str(max(1, math.ceil(retry_after)))
+    return response
+
+@api.before_request
+def admit_request():
+    """Rate limit and shed ordinary requests; priority writes are always admitted into the reserved slots"""
+    if request.endpoint is None or request.endpoint in UNLIMITED_ENDPOINTS:
+        return None
+    if request.endpoint in PRIORITY_ENDPOINTS:
+        request_limiter.try_acquire(priority=True)
+        g.admitted = True
+        return None
+    wait = client_limiter.check(client_ip())
+    if wait:
+        return limit_response('Too many requests', 429, wait)
+    if not request_limiter.try_acquire(timeout=0):
+        return limit_response('Server is busy, try again shortly', 503, 1)
+    g.admitted = True
+    return None
+
+@api.before_request
+def start_background_work():
+    """Start the background threads on the first request rather than at import"""
+    global background_pending
+    if not background_pending:
+        return None
+    with background_lock:
+        if background_pending:
+            if write_behind is not None:
+                # Replays any journal left by a previous run before new rows
+                write_behind.start()
+            # Deliver outbox messages left pending or leased by a previous run without waiting for a new alert
+            notification_dispatcher.start()
+            background_pending = False
+    return None
+
+@api.before_request
+def ensure_schema():
+    """Create or migrate the schema on the first admitted request that may use the database"""
+    if request.endpoint not in SCHEMALESS_ENDPOINTS and current_app.config.get('SCHEMA_AUTO_MIGRATE', True):
+        schema.ensure()
+
+@api.teardown_request
+def release_request(exception=None):
+    if g.pop('admitted', False):
+        request_limiter.release()
 
 # API Routes
-@app.route('/api/nearby', methods=['GET'])
+@api.route('/api/nearby', methods=['GET'])
 def get_nearby_facilities():
     """Fetch nearby hospitals, clinics, and pharmacies using Overpass API"""
     try:
         lat = request.args.get('lat', type=float)
         lon = request.args.get('lon', type=float)
         radius = request.args.get('radius', default=10000, type=int)
+        types = parse_types(request.args.get('types'))
+        limit = request.args.get('limit', type=int)
+        cursor = request.args.get('cursor')
+        output_format = request.args.get('format', 'json')
+        open_minute = requested_open_minute()
 
         if not lat or not lon:
             return jsonify({'error': 'Latitude and longitude are required'}), 400
+        if limit is not None and limit < 1:
+            return jsonify({'error': 'limit must be a positive integer'}), 400
+        if output_format not in ('json', 'ndjson'):
+            return jsonify({'error': 'format must be json or ndjson'}), 400
+        if cursor:
+            try:
+                decode_cursor(cursor)
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
 
-        # Overpass API query - expanded to include more medical facilities
-        overpass_url = "http://overpass-api.de/api/interpreter"
-        query = f"""
-        [out:json];
-        (
-          node["amenity"="hospital"](around:{radius},{lat},{lon});
-          node["amenity"="clinic"](around:{radius},{lat},{lon});
-          node["amenity"="pharmacy"](around:{radius},{lat},{lon});
-          node["amenity"="doctors"](around:{radius},{lat},{lon});
-          node["amenity"="dentist"](around:{radius},{lat},{lon});
-          node["healthcare"="hospital"](around:{radius},{lat},{lon});
-          node["healthcare"="clinic"](around:{radius},{lat},{lon});
-          node["healthcare"="doctor"](around:{radius},{lat},{lon});
-          node["healthcare"="dentist"](around:{radius},{lat},{lon});
-          node["healthcare"="pharmacy"](around:{radius},{lat},{lon});
-          way["amenity"="hospital"](around:{radius},{lat},{lon});
-          way["amenity"="clinic"](around:{radius},{lat},{lon});
-          way["amenity"="pharmacy"](around:{radius},{lat},{lon});
-          way["amenity"="doctors"](around:{radius},{lat},{lon});
-          way["amenity"="dentist"](around:{radius},{lat},{lon});
-          way["healthcare"="hospital"](around:{radius},{lat},{lon});
-          way["healthcare"="clinic"](around:{radius},{lat},{lon});
-          way["healthcare"="doctor"](around:{radius},{lat},{lon});
-        );
-        out center;
-        """
-
-        response = requests.post(overpass_url, data={'data': query}, timeout=30)
-        
-        if response.status_code != 200:
-            return jsonify({'error': 'Failed to fetch data from Overpass API'}), 500
-
-        data = response.json()
-        facilities = []
-
-        for element in data.get('elements', []):
-            # Get coordinates
-            if element['type'] == 'node':
-                facility_lat = element['lat']
-                facility_lon = element['lon']
-            elif element['type'] == 'way' and 'center' in element:
-                facility_lat = element['center']['lat']
-                facility_lon = element['center']['lon']
-            else:
-                continue
-
-            tags = element.get('tags', {})
-            
-            # Determine facility type from tags
-            facility_type = tags.get('amenity') or tags.get('healthcare') or 'unknown'
-            
-            facility = {
-                'id': element['id'],
-                'name': tags.get('name', 'Unnamed Facility'),
-                'type': facility_type,
-                'latitude': facility_lat,
-                'longitude': facility_lon,
-                'address': tags.get('addr:street', '') + ' ' + tags.get('addr:housenumber', ''),
-                'phone': tags.get('phone', tags.get('contact:phone', 'N/A')),
-                'opening_hours': tags.get('opening_hours', 'N/A'),
-                'website': tags.get('website', tags.get('contact:website', ''))
-            }
-            facilities.append(facility)
-
-        # Add custom hospitals from database
-        custom_hospitals = Hospital.query.all()
+        facilities, stale, degraded = nearby_source_facilities(lat, lon, radius)
+        facilities = list(facilities)
+
+        # Add custom hospitals from database that fall inside the search radius
+        custom_hospitals = hospitals_within(lat, lon, radius)
         for hospital in custom_hospitals:
             facilities.append(hospital.to_dict())
+        if open_minute is not None:
+            facilities = open_facilities(facilities, open_minute)
 
-        return jsonify({
+        facilities, total, next_cursor = rank_facilities(
+            facilities, lat, lon, radius, types=types, limit=limit, cursor=cursor
+        )
+
+        # Stream the body instead of building the whole JSON string in memory
+        if output_format == 'ndjson':
+            response = Response(stream_with_context(iter_ndjson(facilities)), mimetype='application/x-ndjson')
+            response.headers['X-Total-Count'] = str(total)
+            if next_cursor:
+                response.headers['X-Next-Cursor'] = next_cursor
+            if stale:
+                response.headers['X-Stale'] = 'true'
+            if degraded:
+                response.headers['X-Degraded'] = 'true'
+            return response
+
+        meta = {
             'success': True,
             'count': len(facilities),
-            'facilities': facilities
-        })
+            'total': total,
+            'next_cursor': next_cursor,
+            'stale': stale,
+            'degraded': degraded
+        }
+        return Response(
+            stream_with_context(iter_json_response(meta, 'facilities', facilities)),
+            mimetype='application/json'
+        )
 
-    except requests.Timeout:
+    except LimitExceeded as e:
+        return limit_response('Nearby search is overloaded, try again shortly', 503, e.retry_after)
+    except (OverpassTimeout, FutureTimeoutError):
         return jsonify({'error': 'Request to Overpass API timed out'}), 504
+    except OverpassError as e:
+        return jsonify({'error': str(e)}), 500
+    except SnapshotError as e:
+        return jsonify({'error': str(e)}), 503
+    except SchedulingError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@api.route('/api/search', methods=['GET'])
+def search_facilities():
+    """Search custom hospitals and previously fetched facilities by name, address or description"""
+    try:
+        query = (request.args.get('q') or '').strip()
+        lat = request.args.get('lat', type=float)
+        lon = request.args.get('lon', type=float)
+        types = parse_types(request.args.get('types'))
+        limit = request.args.get('limit', default=current_app.config.get('SEARCH_DEFAULT_LIMIT', 20), type=int)
+        max_limit = current_app.config.get('SEARCH_MAX_LIMIT', 100)
+
+        if not query:
+            return jsonify({'error': 'q is required'}), 400
+        if len(query) > 100:
+            return jsonify({'error': 'q must be at most 100 characters'}), 400
+        if limit < 1 or limit > max_limit:
+            return jsonify({'error': f'limit must be between 1 and {max_limit}'}), 400
+        if (lat is None) != (lon is None):
+            return jsonify({'error': 'lat and lon must be given together'}), 400
+
+        refresh_search_hospitals()
+        results = search_index.search(query, lat, lon, limit=limit, types=types)
+        return Response(dumps_bytes({
+            'success': True,
+            'count': len(results),
+            'results': results
+        }), mimetype='application/json')
+
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/appointments', methods=['POST'])
+@api.route('/api/appointments', methods=['POST'])
 def create_appointment():
     """Create a new appointment"""
     try:
@@ -194,20 +899,47 @@ def create_appointment():
         if not data:
             return jsonify({'error': 'No data provided'}), 400
 
-        required_fields = ['name', 'phone', 'date', 'reason']
+        required_fields = ['name', 'phone', 'reason']
         for field in required_fields:
             if field not in data:
                 return jsonify({'error': f'{field} is required'}), 400
+        if 'date' not in data and 'start_at' not in data:
+            return jsonify({'error': 'date is required'}), 400
 
+        hospital, start_at, end_at, capacity = requested_slot(data)
         appointment = Appointment(
             name=data['name'],
             phone=data['phone'],
-            date=data['date'],
+            date=data.get('date') or start_at.isoformat(timespec='minutes'),
             reason=data['reason'],
-            facility_name=data.get('facility_name', 'N/A')
+            facility_name=data.get('facility_name', hospital.name if hospital else 'N/A'),
+            hospital_id=hospital.id if hospital else None,
+            start_at=start_at,
+            end_at=end_at,
+            created_at=datetime.utcnow()
         )
 
+        if write_behind is not None and hospital is None:
+            # No capacity to check: journal it and let the flusher insert it in a batch
+            journal_insert(appointment)
+            return jsonify({
+                'success': True,
+                'message': 'Appointment created successfully',
+                'appointment': appointment.to_dict()
+            }), 201
+
+        if write_behind is not None:
+            # Inserted now, but with an allocated id so it cannot collide with journaled rows
+            appointment.id = id_allocators['appointment'].next_id()
+            bump_version('appointment')
         db.session.add(appointment)
+        if hospital is not None:
+            # Insert first, then count: the write lock taken by the flush (or the
+            # hospital row lock) makes concurrent bookings see each other
+            db.session.flush()
+            if overlapping_appointments(hospital.id, start_at, end_at).count() > capacity:
+                db.session.rollback()
+                return jsonify({'error': 'This time slot is fully booked'}), 409
         db.session.commit()
 
         return jsonify({
@@ -216,11 +948,14 @@ def create_appointment():
             'appointment': appointment.to_dict()
         }), 201
 
+    except SchedulingError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/emergency', methods=['POST'])
+@api.route('/api/emergency', methods=['POST'])
 def create_emergency_alert():
     """Create an emergency alert"""
     try:
@@ -231,67 +966,176 @@ def create_emergency_alert():
 
         if 'latitude' not in data or 'longitude' not in data:
             return jsonify({'error': 'Location data is required'}), 400
+        try:
+            lat = float(data['latitude'])
+            lon = float(data['longitude'])
+        except (TypeError, ValueError):
+            return jsonify({'error': 'Latitude and longitude must be numbers'}), 400
+
+        # Routing runs before the transaction opens and can never fail the alert itself
+        routes = None
+        complete = False
+        if current_app.config.get('EMERGENCY_NEAREST_COUNT', 3) > 0:
+            started = time.perf_counter()
+            try:
+                routes, complete = route_emergency(lat, lon)
+                outcome = 'complete' if complete else 'partial'
+            except Exception:
+                outcome = 'error'
+            emergency_routing.observe(time.perf_counter() - started, outcome=outcome)
 
         alert = EmergencyAlert(
-            latitude=data['latitude'],
-            longitude=data['longitude'],
+            latitude=lat,
+            longitude=lon,
             message=data.get('message', 'Emergency alert triggered'),
-            user_info=data.get('user_info', '')
+            user_info=data.get('user_info', ''),
+            nearest_facilities=dumps(routes) if routes is not None else None
         )
 
         db.session.add(alert)
+        db.session.flush()
+        # Notifications are written to the outbox in the same transaction and sent in the background
+        notifications = enqueue_emergency_notifications(alert)
         db.session.commit()
+        emergency_broker.publish(alert.id, 'emergency', alert.to_dict())
+        if notifications:
+            notification_dispatcher.wake()
 
         return jsonify({
             'success': True,
             'message': 'Emergency alert sent successfully',
-            'alert': alert.to_dict()
+            'alert': alert.to_dict(),
+            'routing_complete': complete
         }), 201
 
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/admin/appointments', methods=['GET'])
+def admin_listing(model, serializer, key, query):
+    """Serve one keyset page of an append-only admin listing, honoring If-None-Match"""
+    # The tables are append-only, so the newest id (one index probe) identifies the page contents.
+    # Write-behind ids are allocated in blocks and can commit below it; those inserts bump a counter.
+    latest_id = read_db.query(db.func.max(model.id)).scalar() or 0
+    version = 0
+    if model is Appointment and write_behind is not None:
+        version = read_db.query(ChangeCounter.version).filter(ChangeCounter.name == 'appointment').scalar() or 0
+    etag = listing_etag(request.path, request.args, version, latest_id)
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+        response.set_etag(etag)
+        return response
+
+    rows, next_cursor = keyset_page(
+        query, model, request.args,
+        default_limit=current_app.config.get('ADMIN_PAGE_SIZE', 100),
+        max_limit=current_app.config.get('ADMIN_MAX_PAGE_SIZE', 1000)
+    )
+    response = Response(dumps_bytes({
+        'success': True,
+        'count': len(rows),
+        'next_cursor': next_cursor,
+        key: serializer.encode_many(rows)
+    }), mimetype='application/json')
+    response.set_etag(etag)
+    return response
+
+@api.route('/api/admin/appointments', methods=['GET'])
 def get_all_appointments():
-    """Get all appointments for admin dashboard"""
+    """Get appointments for admin dashboard, newest first, one page at a time"""
     try:
-        appointments = Appointment.query.order_by(Appointment.created_at.desc()).all()
-        return jsonify({
-            'success': True,
-            'count': len(appointments),
-            'appointments': [apt.to_dict() for apt in appointments]
-        })
+        query = appointment_serializer.query(read_db.session)
+        facility = request.args.get('facility')
+        if facility:
+            query = query.filter(Appointment.facility_name == facility)
+        hospital_id = request.args.get('hospital_id', type=int)
+        if hospital_id is not None:
+            query = query.filter(Appointment.hospital_id == hospital_id)
+        return admin_listing(Appointment, appointment_serializer, 'appointments', query)
+    except PaginationError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/admin/emergencies', methods=['GET'])
+@api.route('/api/admin/emergencies', methods=['GET'])
 def get_all_emergencies():
-    """Get all emergency alerts for admin dashboard"""
+    """Get emergency alerts for admin dashboard, newest first, one page at a time"""
     try:
-        alerts = EmergencyAlert.query.order_by(EmergencyAlert.created_at.desc()).all()
-        return jsonify({
-            'success': True,
-            'count': len(alerts),
-            'alerts': [alert.to_dict() for alert in alerts]
-        })
+        return admin_listing(EmergencyAlert, alert_serializer, 'alerts', alert_serializer.query(read_db.session))
+    except PaginationError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/hospitals', methods=['GET'])
+@api.route('/api/admin/emergencies/stream', methods=['GET'])
+def stream_emergencies():
+    """Push new emergency alerts to the admin dashboard as Server-Sent Events"""
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    try:
+        last_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        return jsonify({'error': 'Last-Event-ID must be an alert id'}), 400
+
+    # Subscribe before replaying so nothing committed in between is missed
+    subscription = emergency_broker.subscribe()
+    replay = []
+    if last_id is not None:
+        missed = (EmergencyAlert.query.filter(EmergencyAlert.id > last_id)
+                  .order_by(EmergencyAlert.id)
+                  .limit(current_app.config.get('EMERGENCY_STREAM_REPLAY_LIMIT', 500))
+                  .all())
+        replay = [Event(alert.id, 'emergency', alert.to_dict()) for alert in missed]
+    heartbeat = current_app.config.get('EMERGENCY_STREAM_HEARTBEAT', 15)
+
+    def generate():
+        try:
+            yield 'retry: 3000\n\n'
+            # Concurrent requests can publish out of id order, so live events are only
+            # checked against what the replay actually sent, not against the highest id
+            replayed = set()
+            for event in replay:
+                yield format_sse(event)
+                replayed.add(event.id)
+            while True:
+                event = subscription.get(timeout=heartbeat)
+                if event is CLOSED:
+                    break
+                if event is None:
+                    yield ': heartbeat\n\n'
+                elif event.id in replayed:
+                    replayed.discard(event.id)
+                else:
+                    yield format_sse(event)
+        finally:
+            emergency_broker.unsubscribe(subscription)
+
+    # Not wrapped in stream_with_context: the generator needs no request state,
+    # so the DB session is released as soon as the replay query is done
+    return Response(
+        generate(),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@api.route('/api/hospitals', methods=['GET'])
 def get_all_hospitals():
-    """Get all custom hospitals"""
+    """Get all custom hospitals, optionally only those open at a time"""
     try:
-        hospitals = Hospital.query.all()
-        return jsonify({
+        open_minute = requested_open_minute()
+        hospitals = hospital_serializer.encode_many(hospital_serializer.query(db.session))
+        if open_minute is not None:
+            hospitals = open_facilities(hospitals, open_minute)
+        return Response(dumps_bytes({
             'success': True,
             'count': len(hospitals),
-            'hospitals': [hospital.to_dict() for hospital in hospitals]
-        })
+            'hospitals': hospitals
+        }), mimetype='application/json')
+    except SchedulingError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/hospitals', methods=['POST'])
+@api.route('/api/hospitals', methods=['POST'])
 def create_hospital():
     """Create a new custom hospital"""
     try:
@@ -319,7 +1163,11 @@ def create_hospital():
         )
 
         db.session.add(hospital)
+        version = bump_version('hospital')
         db.session.commit()
+        hospital_index.insert(hospital.id, hospital.latitude, hospital.longitude)
+        search_index.add(*facility_document(hospital.to_dict()), pinned=True)
+        hospitals_written(version)
 
         return jsonify({
             'success': True,
@@ -331,7 +1179,66 @@ def create_hospital():
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/hospitals/<int:hospital_id>', methods=['PUT'])
+@api.route('/api/hospitals/bulk', methods=['POST'])
+def bulk_import_hospitals():
+    """Create or update many custom hospitals from a CSV or NDJSON upload"""
+    try:
+        input_format = request.args.get('format')
+        if input_format is None:
+            input_format = 'csv' if request.mimetype in ('text/csv', 'application/csv') else 'ndjson'
+        if input_format == 'csv':
+            rows = iter_csv_rows(request.stream)
+        elif input_format == 'ndjson':
+            rows = iter_ndjson_rows(request.stream)
+        else:
+            raise BulkImportError('format must be csv or ndjson')
+
+        on_conflict = request.args.get('on_conflict', 'update')
+        if on_conflict not in ('update', 'skip'):
+            raise BulkImportError('on_conflict must be update or skip')
+
+        summary = upsert_hospitals(
+            db.session, Hospital, rows,
+            chunk_size=current_app.config.get('BULK_CHUNK_SIZE', 1000),
+            on_conflict=on_conflict
+        )
+        # Coordinates changed wholesale; rebuild the indexes on the next lookup
+        publish_hospital_changes()
+        hospital_index.invalidate()
+        search_index.invalidate_pinned()
+
+        return jsonify(dict(summary, success=True))
+
+    except (BulkImportError, csv.Error, UnicodeDecodeError) as e:
+        db.session.rollback()
+        # Chunks before the failure are committed
+        publish_hospital_changes()
+        hospital_index.invalidate()
+        search_index.invalidate_pinned()
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        db.session.rollback()
+        # Chunks before the failure are committed
+        publish_hospital_changes()
+        hospital_index.invalidate()
+        search_index.invalidate_pinned()
+        return jsonify({'error': str(e)}), 500
+
+@api.route('/api/hospitals/export', methods=['GET'])
+def export_hospitals():
+    """Stream all custom hospitals as CSV or NDJSON"""
+    output_format = request.args.get('format', 'csv')
+    if output_format not in ('csv', 'ndjson'):
+        return jsonify({'error': 'format must be csv or ndjson'}), 400
+    mimetype = 'text/csv' if output_format == 'csv' else 'application/x-ndjson'
+    response = Response(
+        stream_with_context(iter_export(read_db.session, Hospital, output_format)),
+        mimetype=mimetype
+    )
+    response.headers['Content-Disposition'] = f'attachment; filename=hospitals.{output_format}'
+    return response
+
+@api.route('/api/hospitals/<int:hospital_id>', methods=['PUT'])
 def update_hospital(hospital_id):
     """Update a custom hospital"""
     try:
@@ -363,7 +1270,12 @@ def update_hospital(hospital_id):
         if 'is_featured' in data:
             hospital.is_featured = data['is_featured']
 
+        version = bump_version('hospital')
         db.session.commit()
+        hospital_index.insert(hospital.id, hospital.latitude, hospital.longitude)
+        opening_schedules.invalidate([f'custom_{hospital.id}'])
+        search_index.add(*facility_document(hospital.to_dict()), pinned=True)
+        hospitals_written(version)
 
         return jsonify({
             'success': True,
@@ -375,13 +1287,19 @@ def update_hospital(hospital_id):
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/hospitals/<int:hospital_id>', methods=['DELETE'])
+@api.route('/api/hospitals/<int:hospital_id>', methods=['DELETE'])
 def delete_hospital(hospital_id):
     """Delete a custom hospital"""
     try:
         hospital = Hospital.query.get_or_404(hospital_id)
+        CapacityRule.query.filter_by(hospital_id=hospital_id).delete()
         db.session.delete(hospital)
+        version = bump_version('hospital')
         db.session.commit()
+        hospital_index.remove(hospital_id)
+        opening_schedules.invalidate([f'custom_{hospital_id}'])
+        search_index.remove(f'custom_{hospital_id}')
+        hospitals_written(version)
 
         return jsonify({
             'success': True,
@@ -392,14 +1310,109 @@ def delete_hospital(hospital_id):
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/health', methods=['GET'])
+@api.route('/api/hospitals/<int:hospital_id>/capacity', methods=['GET'])
+def get_capacity_rules(hospital_id):
+    """List a custom hospital's capacity rules"""
+    if db.session.get(Hospital, hospital_id) is None:
+        return jsonify({'error': 'Hospital not found'}), 404
+    rules = CapacityRule.query.filter_by(hospital_id=hospital_id).order_by(
+        CapacityRule.weekday, CapacityRule.opens_at).all()
+    return jsonify({'success': True, 'rules': [rule.to_dict() for rule in rules]})
+
+@api.route('/api/hospitals/<int:hospital_id>/capacity', methods=['PUT'])
+def set_capacity_rules(hospital_id):
+    """Replace a custom hospital's capacity rules"""
+    try:
+        if db.session.get(Hospital, hospital_id) is None:
+            return jsonify({'error': 'Hospital not found'}), 404
+        data = request.get_json()
+
+        if not data or 'rules' not in data:
+            return jsonify({'error': 'rules is required'}), 400
+
+        rules = parse_rules(data['rules'], current_app.config.get('APPOINTMENT_MAX_DURATION_MINUTES', 240))
+        CapacityRule.query.filter_by(hospital_id=hospital_id).delete()
+        rules = [CapacityRule(hospital_id=hospital_id, **rule) for rule in rules]
+        db.session.add_all(rules)
+        db.session.commit()
+
+        return jsonify({
+            'success': True,
+            'message': 'Capacity rules updated successfully',
+            'rules': [rule.to_dict() for rule in rules]
+        })
+
+    except SchedulingError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+@api.route('/api/hospitals/<int:hospital_id>/availability', methods=['GET'])
+def get_availability(hospital_id):
+    """Free appointment slots at a custom hospital for a range of days"""
+    try:
+        first_day = parse_date(request.args.get('from', date.today().isoformat()), 'from')
+        last_day = parse_date(request.args.get('to', (first_day + timedelta(days=6)).isoformat()), 'to')
+        include_full = request.args.get('include_full', 'false').lower() == 'true'
+        max_days = current_app.config.get('APPOINTMENT_AVAILABILITY_MAX_DAYS', 31)
+        if last_day < first_day:
+            return jsonify({'error': 'to must not be before from'}), 400
+        if (last_day - first_day).days >= max_days:
+            return jsonify({'error': f'At most {max_days} days can be requested at once'}), 400
+        if db.session.get(Hospital, hospital_id) is None:
+            return jsonify({'error': 'Hospital not found'}), 404
+
+        rules = CapacityRule.query.filter_by(hospital_id=hospital_id).all()
+        range_start = datetime.combine(first_day, datetime.min.time())
+        range_end = datetime.combine(last_day + timedelta(days=1), datetime.min.time())
+        # One range scan on (hospital_id, start_at) covers every appointment touching the days
+        intervals = overlapping_appointments(hospital_id, range_start, range_end).with_entities(
+            Appointment.start_at, Appointment.end_at).order_by(Appointment.start_at)
+
+        slots = []
+        for start, end, capacity, booked in booked_per_slot(iter_slots(rules, first_day, last_day), intervals):
+            if booked < capacity or include_full:
+                slots.append({
+                    'start_at': start.isoformat(),
+                    'end_at': end.isoformat(),
+                    'capacity': capacity,
+                    'booked': booked,
+                    'available': max(0, capacity - booked)
+                })
+
+        return jsonify({
+            'success': True,
+            'hospital_id': hospital_id,
+            'from': first_day.isoformat(),
+            'to': last_day.isoformat(),
+            'count': len(slots),
+            'slots': slots
+        })
+
+    except SchedulingError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@api.route('/api/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
     return jsonify({
         'status': 'healthy',
-        'message': 'Nearby Hospital Facility Finder API is running'
+        'message': 'Nearby Hospital Facility Finder API is running',
+        'cache': nearby_cache.stats()
     })
 
+@api.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    """Request, database, upstream and cache metrics in the Prometheus text format"""
+    return Response(metrics.registry.render(), mimetype='text/plain; version=0.0.4')
+
+# The app served by index.py and wsgi.py and imported by the scripts
+app = create_app()
+
 if __name__ == '__main__':
     app.run(debug=True, port=5000)
 
@@ -0,0 +1,43 @@
+"""
+Serve the Flask app for the load driver in a separate process
+
+Configuration comes from the environment the driver sets (DATABASE_URL,
+OVERPASS_API_URL, ...). The schema is created by importing the app, the
+synthetic dataset is loaded, and "READY <port>" is printed once the server
+accepts connections.
+"""
+import argparse
+import logging
+import os
+import sys
+
+from werkzeug.serving import make_server
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from datasets import populate  # noqa: E402
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--port', type=int, default=0)
+    parser.add_argument('--appointments', type=int, default=0)
+    parser.add_argument('--alerts', type=int, default=0)
+    parser.add_argument('--hospitals', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    from app import app, db, schema
+
+    with app.app_context():
+        schema.ensure()
+        populate(db.engine, appointments=args.appointments, alerts=args.alerts, hospitals=args.hospitals)
+
+    # Per-request access logging would dominate the measurements
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    server = make_server('127.0.0.1', args.port, app, threaded=True)
+    print(f'READY {server.server_port}', flush=True)
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
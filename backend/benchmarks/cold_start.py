@@ -0,0 +1,111 @@
+"""
+Measure serverless cold start: importing the entry point and the first requests
+
+Each run starts a fresh interpreter against a new SQLite database, imports
+index.py (the Vercel entry point) and sends a health check, then a first
+database-backed request, through the test client. Reports the median and
+worst time of each phase, and with --importtime lists the modules that
+dominate import time as reported by `python -X importtime`.
+
+Usage:
+    python benchmarks/cold_start.py
+    python benchmarks/cold_start.py --runs 20 --importtime --top 25
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs in the child interpreter
+PROBE = '''
+import json, sys, time
+started = time.perf_counter()
+import index
+imported = time.perf_counter()
+client = index.app.test_client()
+client.get('/api/health')
+health = time.perf_counter()
+client.get('/api/admin/appointments')
+first_query = time.perf_counter()
+print(json.dumps({
+    'import': imported - started,
+    'health': health - imported,
+    'first_query': first_query - health,
+    'requests_imported': 'requests' in sys.modules,
+    'numpy_imported': 'numpy' in sys.modules,
+}))
+'''
+
+
+def child_env(workdir, run):
+    return dict(
+        os.environ,
+        DATABASE_URL='sqlite:///' + os.path.join(workdir, f'cold-{run}.db'),
+        NEARBY_LAST_GOOD_PATH=os.path.join(workdir, f'last-good-{run}.db'),
+        NEARBY_PREFETCH_PATH='',
+        METRICS_ENABLED='true',
+    )
+
+
+def probe(workdir, run):
+    output = subprocess.run(
+        [sys.executable, '-c', PROBE], cwd=BACKEND_DIR, env=child_env(workdir, run),
+        capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def import_profile(workdir, top):
+    """[(cumulative_us, self_us, module)] for the slowest top-level imports of index.py"""
+    stderr = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import index'], cwd=BACKEND_DIR,
+        env=child_env(workdir, 'importtime'), capture_output=True, text=True, check=True
+    ).stderr
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        # Nesting depth is the indentation of the module name
+        depth = (len(name) - len(name.lstrip())) // 2
+        rows.append((int(cumulative_us), int(self_us), name.strip(), depth))
+    rows.sort(reverse=True)
+    return rows[:top]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--importtime', action='store_true', help='Also list the slowest imports')
+    parser.add_argument('--top', type=int, default=15, help='Imports to list with --importtime')
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix='medihost-cold-')
+    try:
+        results = [probe(workdir, run) for run in range(args.runs)]
+        print(f"{'phase':<14} {'median ms':>10} {'max ms':>8}")
+        for phase in ('import', 'health', 'first_query'):
+            values = [result[phase] * 1000 for result in results]
+            print(f'{phase:<14} {statistics.median(values):>10.1f} {max(values):>8.1f}')
+        total = [sum(result[phase] for phase in ('import', 'health', 'first_query')) * 1000 for result in results]
+        print(f"{'total':<14} {statistics.median(total):>10.1f} {max(total):>8.1f}")
+        print(f"requests imported at startup: {results[0]['requests_imported']}, "
+              f"numpy: {results[0]['numpy_imported']}")
+
+        if args.importtime:
+            print()
+            print(f"{'cumulative ms':>13} {'self ms':>8}  module")
+            for cumulative_us, self_us, name, depth in import_profile(workdir, args.top):
+                print(f"{cumulative_us / 1000:>13.1f} {self_us / 1000:>8.1f}  {'  ' * depth}{name}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
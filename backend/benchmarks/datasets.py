@@ -0,0 +1,171 @@
+"""
+Synthetic appointments, emergency alerts and custom hospitals for benchmarks
+
+Rows are spread around the benchmark locations with a fixed seed, so two runs
+at the same scale produce the same tables. Inserts go through executemany in
+chunks, one transaction per chunk. When hospitals are generated, every one
+gets daily capacity rules and appointments are booked into their slots over
+the next 60 days (hospital ids are assumed to start at 1, as in a new table).
+
+Usage:
+    python benchmarks/datasets.py --database-url sqlite:////tmp/bench.db --scale medium
+    python benchmarks/datasets.py --appointments 1000000 --alerts 100000 --hospitals 50000
+"""
+import argparse
+import os
+import random
+import sys
+from datetime import datetime, time, timedelta
+
+from sqlalchemy import MetaData, Table, insert
+
+LOCATIONS = [
+    ('New York', 40.7128, -74.0060),
+    ('London', 51.5074, -0.1278),
+    ('Bengaluru', 12.9716, 77.5946),
+]
+
+SCALES = {
+    'small': {'appointments': 10_000, 'alerts': 2_000, 'hospitals': 1_000},
+    'medium': {'appointments': 100_000, 'alerts': 20_000, 'hospitals': 10_000},
+    'large': {'appointments': 1_000_000, 'alerts': 200_000, 'hospitals': 100_000},
+}
+
+HOSPITAL_TYPES = ['hospital', 'clinic', 'pharmacy', 'doctors', 'dentist']
+REASONS = ['Checkup', 'Follow-up', 'Vaccination', 'Consultation', 'Lab results']
+
+
+def jitter(rng, lat, lon, spread_deg=0.2):
+    return lat + rng.uniform(-spread_deg, spread_deg), lon + rng.uniform(-spread_deg, spread_deg)
+
+
+def hospital_rows(count, rng):
+    for n in range(count):
+        _, lat, lon = LOCATIONS[n % len(LOCATIONS)]
+        lat, lon = jitter(rng, lat, lon)
+        facility_type = rng.choice(HOSPITAL_TYPES)
+        yield {
+            'name': f'Bench {facility_type.title()} {n}',
+            'type': facility_type,
+            'latitude': lat,
+            'longitude': lon,
+            'address': f'{n} Benchmark Street',
+            'phone': f'+1 555 {n % 10000:04d}',
+            'opening_hours': '24/7' if n % 4 == 0 else 'Mo-Fr 08:00-18:00',
+            'website': '',
+            'description': '',
+            'is_featured': n % 50 == 0,
+            'created_at': datetime.utcnow()
+        }
+
+
+def appointment_rows(count, rng, facilities=500, start=None, hospitals=0):
+    start = start or datetime.utcnow() - timedelta(days=365)
+    step = timedelta(days=365) / max(count, 1)
+    today = datetime.combine(datetime.utcnow().date(), datetime.min.time())
+    for n in range(count):
+        row = {
+            'name': f'Patient {n}',
+            'phone': f'+1 555 {n % 10000:04d}',
+            'date': (start + timedelta(days=rng.randint(0, 400))).strftime('%Y-%m-%d %H:%M'),
+            'reason': rng.choice(REASONS),
+            'facility_name': f'Bench Hospital {rng.randrange(facilities)}',
+            'created_at': start + step * n
+        }
+        if hospitals:
+            # A 30 minute slot between 08:00 and 18:00 (see capacity_rule_rows)
+            slot_start = today + timedelta(days=rng.randrange(60), minutes=8 * 60 + 30 * rng.randrange(20))
+            row.update(hospital_id=rng.randrange(hospitals) + 1, start_at=slot_start,
+                       end_at=slot_start + timedelta(minutes=30))
+            row['date'] = slot_start.strftime('%Y-%m-%d %H:%M')
+        yield row
+
+
+def capacity_rule_rows(hospitals):
+    for hospital_id in range(1, hospitals + 1):
+        yield {'hospital_id': hospital_id, 'weekday': None, 'opens_at': time(8, 0), 'closes_at': time(18, 0),
+               'slot_minutes': 30, 'capacity': 4}
+
+
+def alert_rows(count, rng, start=None):
+    start = start or datetime.utcnow() - timedelta(days=365)
+    step = timedelta(days=365) / max(count, 1)
+    for n in range(count):
+        _, lat, lon = LOCATIONS[n % len(LOCATIONS)]
+        lat, lon = jitter(rng, lat, lon)
+        yield {
+            'latitude': lat,
+            'longitude': lon,
+            'message': 'Benchmark emergency',
+            'user_info': f'Patient {n}',
+            'created_at': start + step * n
+        }
+
+
+def insert_rows(engine, table, rows, chunk_size=10_000):
+    """Insert an iterable of dicts in chunks, keeping only the table's columns"""
+    columns = set(table.c.keys())
+    total = 0
+    chunk = []
+    for row in rows:
+        chunk.append({key: value for key, value in row.items() if key in columns})
+        if len(chunk) >= chunk_size:
+            with engine.begin() as connection:
+                connection.execute(insert(table), chunk)
+            total += len(chunk)
+            chunk = []
+    if chunk:
+        with engine.begin() as connection:
+            connection.execute(insert(table), chunk)
+        total += len(chunk)
+    return total
+
+
+def populate(engine, appointments=0, alerts=0, hospitals=0, seed=42):
+    """Fill the app's tables (which must already exist) and return the row counts"""
+    metadata = MetaData()
+    rng = random.Random(seed)
+    counts = {}
+    if hospitals:
+        counts['hospitals'] = insert_rows(engine, Table('hospital', metadata, autoload_with=engine),
+                                          hospital_rows(hospitals, rng))
+        counts['capacity_rules'] = insert_rows(engine, Table('capacity_rule', metadata, autoload_with=engine),
+                                               capacity_rule_rows(hospitals))
+    if appointments:
+        counts['appointments'] = insert_rows(engine, Table('appointment', metadata, autoload_with=engine),
+                                             appointment_rows(appointments, rng, hospitals=hospitals))
+    if alerts:
+        counts['alerts'] = insert_rows(engine, Table('emergency_alert', metadata, autoload_with=engine),
+                                       alert_rows(alerts, rng))
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--database-url', default=os.getenv('DATABASE_URL', 'sqlite:///benchmark.db'))
+    parser.add_argument('--scale', choices=sorted(SCALES), default='small')
+    parser.add_argument('--appointments', type=int)
+    parser.add_argument('--alerts', type=int)
+    parser.add_argument('--hospitals', type=int)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args(argv)
+
+    sizes = dict(SCALES[args.scale])
+    for key in sizes:
+        if getattr(args, key) is not None:
+            sizes[key] = getattr(args, key)
+
+    # Create the schema through the app so the tables match its models
+    os.environ['DATABASE_URL'] = args.database_url
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from app import db, app, schema  # noqa: E402
+
+    with app.app_context():
+        schema.ensure()
+        counts = populate(db.engine, seed=args.seed, **sizes)
+    for key, value in counts.items():
+        print(f'{key:<13} {value:>10,}')
+
+
+if __name__ == '__main__':
+    main()
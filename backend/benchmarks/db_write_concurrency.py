@@ -0,0 +1,115 @@
+"""
+Measure concurrent appointment inserts with default and tuned SQLite settings
+
+Each writer thread inserts rows one transaction at a time, the way
+POST /api/appointments does. The default engine uses SQLite's rollback
+journal; the tuned engine uses the options and pragmas the app applies
+(WAL, synchronous=NORMAL, busy_timeout). Reports throughput, commit
+latency percentiles and "database is locked" failures for each.
+
+Usage:
+    python benchmarks/db_write_concurrency.py
+    python benchmarks/db_write_concurrency.py --writers 16 --rows 200
+    python benchmarks/db_write_concurrency.py --url postgresql://localhost/medihost_bench
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import create_engine, delete, insert
+from sqlalchemy.exc import OperationalError
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import engine_options  # noqa: E402
+from database import apply_sqlite_pragmas  # noqa: E402
+
+
+def build_engine(url, tuned):
+    if not tuned:
+        return create_engine(url)
+    engine = create_engine(url, **engine_options(url))
+    apply_sqlite_pragmas(engine)
+    return engine
+
+
+def run_writers(engine, table, writers, rows):
+    latencies = []
+    failures = []
+    lock = threading.Lock()
+    barrier = threading.Barrier(writers)
+
+    def writer(worker):
+        local_latencies = []
+        local_failures = 0
+        barrier.wait()
+        for n in range(rows):
+            values = {
+                'name': f'Bench {worker}-{n}',
+                'phone': '555-0100',
+                'date': '2025-01-01 10:00',
+                'reason': 'Benchmark',
+                'facility_name': f'Facility {n % 50}',
+                'created_at': datetime.utcnow()
+            }
+            started = time.perf_counter()
+            try:
+                with engine.begin() as connection:
+                    connection.execute(insert(table), values)
+                local_latencies.append(time.perf_counter() - started)
+            except OperationalError:
+                local_failures += 1
+        with lock:
+            latencies.extend(local_latencies)
+            failures.append(local_failures)
+
+    threads = [threading.Thread(target=writer, args=(worker,)) for worker in range(writers)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - started, sorted(latencies), sum(failures)
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--url', help='Database URL (default: a fresh SQLite file per mode)')
+    parser.add_argument('--writers', type=int, default=8)
+    parser.add_argument('--rows', type=int, default=100, help='Rows inserted by each writer')
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix='medihost-bench-')
+    os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(workdir, 'app.db'))
+    from app import Appointment, db  # noqa: E402 -- imported after DATABASE_URL is set
+
+    table = Appointment.__table__
+    print(f"{'mode':<8} {'writers':>7} {'rows/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'locked':>7}")
+    for mode in ('default', 'tuned'):
+        url = args.url or 'sqlite:///' + os.path.join(workdir, f'{mode}.db')
+        engine = build_engine(url, tuned=(mode == 'tuned'))
+        db.metadata.create_all(engine, tables=[table])
+        with engine.begin() as connection:
+            connection.execute(delete(table).where(table.c.reason == 'Benchmark'))
+
+        elapsed, latencies, failures = run_writers(engine, table, args.writers, args.rows)
+        engine.dispose()
+        print(f"{mode:<8} {args.writers:>7} {len(latencies) / elapsed:>9.0f} "
+              f"{statistics.median(latencies) * 1000 if latencies else 0:>8.1f} "
+              f"{percentile(latencies, 0.95) * 1000:>8.1f} {percentile(latencies, 0.99) * 1000:>8.1f} "
+              f"{failures:>7}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+"""
+Compare ORM to_dict() serialization with the column-projection serializers
+
+For each listing model, fetches --rows rows and encodes them to JSON three
+ways: ORM objects + to_dict() + json.dumps (the previous path), projected
+row tuples + compiled encoder + json.dumps, and the same with orjson when it
+is installed. Reports rows per second for the fetch+encode round trip.
+
+Usage:
+    python benchmarks/listing_serialization.py
+    python benchmarks/listing_serialization.py --rows 100000 --repeat 5
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from datasets import populate  # noqa: E402
+
+
+def orm_path(session, model, serializer, rows):
+    objects = session.query(model).limit(rows).all()
+    return json.dumps([obj.to_dict() for obj in objects], separators=(',', ':'))
+
+
+def projection_stdlib(session, model, serializer, rows):
+    return json.dumps(serializer.encode_many(serializer.query(session).limit(rows)), separators=(',', ':'))
+
+
+def projection_orjson(session, model, serializer, rows):
+    import orjson
+    return orjson.dumps(serializer.encode_many(serializer.query(session).limit(rows)))
+
+
+def measure(app, db, path, model, serializer, rows, repeat):
+    timings = []
+    with app.app_context():
+        for _ in range(repeat):
+            session = db.session
+            started = time.perf_counter()
+            path(session, model, serializer, rows)
+            timings.append(time.perf_counter() - started)
+            # A fresh session per run so the ORM path pays for hydration every time
+            db.session.remove()
+    return rows / statistics.median(timings)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=20000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix='medihost-serialize-')
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(workdir, 'app.db')
+    import app as application  # noqa: E402 -- imported after DATABASE_URL is set
+    from serializers import orjson  # noqa: E402
+
+    app, db = application.app, application.db
+    with app.app_context():
+        application.schema.ensure()
+        populate(db.engine, appointments=args.rows, alerts=args.rows, hospitals=args.rows)
+
+    paths = [('orm + to_dict', orm_path), ('projection + json', projection_stdlib)]
+    if orjson is not None:
+        paths.append(('projection + orjson', projection_orjson))
+    listings = [
+        ('appointments', application.Appointment, application.appointment_serializer),
+        ('alerts', application.EmergencyAlert, application.alert_serializer),
+        ('hospitals', application.Hospital, application.hospital_serializer),
+    ]
+
+    print(f"{'listing':<14} {'path':<22} {'rows/s':>10} {'speedup':>8}")
+    for name, model, serializer in listings:
+        reference = None
+        for label, path in paths:
+            rate = measure(app, db, path, model, serializer, args.rows, args.repeat)
+            reference = reference or rate
+            print(f'{name:<14} {label:<22} {rate:>10,.0f} {rate / reference:>7.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,252 @@
+"""
+Drive every API route at fixed concurrency and compare against a baseline
+
+Starts a local Overpass stub, launches the app in a child process against a
+fresh SQLite database filled with a synthetic dataset, then sends a fixed
+number of requests to each route from a pool of client threads. Reports
+throughput, p50/p95/p99 latency, error count and the server's peak RSS per
+route, and compares them with benchmarks/baseline.json when its scale and
+concurrency match.
+
+Usage:
+    python benchmarks/load.py
+    python benchmarks/load.py --scale medium --concurrency 16 --requests 500
+    python benchmarks/load.py --routes nearby_warm,admin_appointments --check
+    python benchmarks/load.py --save-baseline
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+import requests
+
+from datasets import LOCATIONS, SCALES
+from stub_overpass import StubOverpassServer
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+BASELINE_PATH = os.path.join(BENCHMARK_DIR, 'baseline.json')
+
+
+def nearby_params(lat, lon, radius=5000, limit=50):
+    return {'lat': f'{lat:.5f}', 'lon': f'{lon:.5f}', 'radius': radius, 'limit': limit}
+
+
+def warm_location(rng):
+    # A handful of fixed points: after the first request per tile these are cache hits
+    _, lat, lon = rng.choice(LOCATIONS)
+    return nearby_params(lat, lon)
+
+
+def cold_location(rng):
+    # Spread over a wide area so nearly every request misses the tile cache
+    return nearby_params(rng.uniform(-50, 60), rng.uniform(-120, 140))
+
+
+def availability_range(rng):
+    first = date.today() + timedelta(days=rng.randrange(53))
+    return {'from': first.isoformat(), 'to': (first + timedelta(days=6)).isoformat()}
+
+
+ROUTES = {
+    'health': lambda rng: ('GET', '/api/health', None, None),
+    'nearby_warm': lambda rng: ('GET', '/api/nearby', warm_location(rng), None),
+    'nearby_cold': lambda rng: ('GET', '/api/nearby', cold_location(rng), None),
+    'nearby_ndjson': lambda rng: ('GET', '/api/nearby', dict(warm_location(rng), format='ndjson'), None),
+    'admin_appointments': lambda rng: ('GET', '/api/admin/appointments', {'limit': 100}, None),
+    'admin_appointments_facility': lambda rng: (
+        'GET', '/api/admin/appointments', {'facility': f'Bench Hospital {rng.randrange(500)}', 'limit': 100}, None
+    ),
+    'admin_emergencies': lambda rng: ('GET', '/api/admin/emergencies', {'limit': 100}, None),
+    'hospitals': lambda rng: ('GET', '/api/hospitals', None, None),
+    'hospital_availability': lambda rng: (
+        'GET', f'/api/hospitals/{rng.randrange(500) + 1}/availability', availability_range(rng), None
+    ),
+    'hospitals_export': lambda rng: ('GET', '/api/hospitals/export', {'format': 'ndjson'}, None),
+    'create_appointment': lambda rng: ('POST', '/api/appointments', None, {
+        'name': 'Load Test', 'phone': '+1 555 0100', 'date': '2025-01-01 10:00',
+        'reason': 'Benchmark', 'facility_name': f'Bench Hospital {rng.randrange(500)}'
+    }),
+    'create_emergency': lambda rng: ('POST', '/api/emergency', None, {
+        'latitude': LOCATIONS[0][1], 'longitude': LOCATIONS[0][2], 'message': 'Benchmark', 'user_info': 'Load Test'
+    }),
+}
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def peak_rss_mb(pid):
+    """Peak resident set size of a process in MiB (Linux only, else None)"""
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return None
+
+
+class AppProcess:
+    """The app under test, served by benchmarks/app_server.py in a child process"""
+
+    def __init__(self, env, sizes):
+        command = [sys.executable, os.path.join(BENCHMARK_DIR, 'app_server.py')]
+        for key, value in sizes.items():
+            command += [f'--{key}', str(value)]
+        self.process = subprocess.Popen(command, env=env, stdout=subprocess.PIPE, text=True)
+        line = self.process.stdout.readline()
+        if not line.startswith('READY'):
+            self.process.kill()
+            raise RuntimeError('App server failed to start')
+        self.base_url = f'http://127.0.0.1:{int(line.split()[1])}'
+
+    def stop(self):
+        self.process.terminate()
+        self.process.wait(10)
+
+
+def run_route(base_url, build_request, total, concurrency, warmup, seed):
+    local = threading.local()
+
+    def send(n):
+        if not hasattr(local, 'session'):
+            local.session = requests.Session()
+        method, path, params, body = build_request(random.Random(seed * 1_000_003 + n))
+        started = time.perf_counter()
+        response = local.session.request(method, base_url + path, params=params, json=body, timeout=120)
+        size = len(response.content)
+        return time.perf_counter() - started, response.status_code, size
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(send, range(-warmup, 0)))
+        started = time.perf_counter()
+        results = list(pool.map(send, range(total)))
+        elapsed = time.perf_counter() - started
+
+    latencies = sorted(result[0] for result in results)
+    return {
+        'rps': round(total / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+        'errors': sum(1 for result in results if result[1] >= 400),
+        'mean_bytes': int(sum(result[2] for result in results) / max(total, 1)),
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Print changes against the baseline and return the routes whose p99 regressed"""
+    regressions = []
+    print()
+    print(f"{'route':<28} {'p99 ms':>9} {'baseline':>9} {'change':>8} {'rps':>9} {'baseline':>9}")
+    for route, result in results.items():
+        previous = baseline.get('routes', {}).get(route)
+        if not previous:
+            continue
+        change = (result['p99_ms'] - previous['p99_ms']) / previous['p99_ms'] if previous['p99_ms'] else 0.0
+        flag = ''
+        if change > tolerance:
+            regressions.append(route)
+            flag = '  REGRESSION'
+        print(f"{route:<28} {result['p99_ms']:>9.1f} {previous['p99_ms']:>9.1f} {change:>+8.0%} "
+              f"{result['rps']:>9.0f} {previous['rps']:>9.0f}{flag}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--scale', choices=sorted(SCALES), default='small')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=200, help='Measured requests per route')
+    parser.add_argument('--warmup', type=int, default=10, help='Unmeasured requests per route')
+    parser.add_argument('--routes', help='Comma-separated subset of: ' + ', '.join(ROUTES))
+    parser.add_argument('--overpass-latency', type=float, default=0.05, help='Seconds the stub waits per query')
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--check', action='store_true', help='Exit non-zero if any p99 regresses past --tolerance')
+    parser.add_argument('--tolerance', type=float, default=0.25)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args(argv)
+
+    routes = args.routes.split(',') if args.routes else list(ROUTES)
+    unknown = [route for route in routes if route not in ROUTES]
+    if unknown:
+        parser.error(f"unknown routes: {', '.join(unknown)}")
+
+    stub = StubOverpassServer(latency=args.overpass_latency).start()
+    workdir = tempfile.mkdtemp(prefix='medihost-load-')
+    env = dict(
+        os.environ,
+        DATABASE_URL='sqlite:///' + os.path.join(workdir, 'app.db'),
+        OVERPASS_API_URL=stub.url,
+        OVERPASS_MIRRORS='',
+        NEARBY_SOURCE='overpass',
+        NEARBY_CACHE_BACKEND='memory',
+        NOTIFICATIONS_FAKE='true',
+        RATE_LIMIT_PER_IP='0',  # every client thread shares one IP
+    )
+    sizes = SCALES[args.scale]
+    print(f"Loading {args.scale} dataset: " + ', '.join(f'{value:,} {key}' for key, value in sizes.items()))
+    app_process = AppProcess(env, sizes)
+
+    results = {}
+    try:
+        print(f"{'route':<28} {'rps':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>7} {'bytes':>9} {'rss MiB':>8}")
+        for route in routes:
+            result = run_route(app_process.base_url, ROUTES[route], args.requests,
+                               args.concurrency, args.warmup, args.seed)
+            result['peak_rss_mb'] = peak_rss_mb(app_process.process.pid)
+            results[route] = result
+            print(f"{route:<28} {result['rps']:>8.0f} {result['p50_ms']:>8.1f} {result['p95_ms']:>8.1f} "
+                  f"{result['p99_ms']:>8.1f} {result['errors']:>7} {result['mean_bytes']:>9} "
+                  f"{result['peak_rss_mb'] or 0:>8.1f}")
+    finally:
+        app_process.stop()
+        stub.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+    print(f'Overpass stub served {stub.requests} queries')
+
+    meta = {
+        'scale': args.scale,
+        'concurrency': args.concurrency,
+        'requests': args.requests,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+    }
+    regressions = []
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        base_meta = baseline.get('meta', {})
+        if (base_meta.get('scale'), base_meta.get('concurrency')) == (args.scale, args.concurrency):
+            regressions = compare(results, baseline, args.tolerance)
+        else:
+            print(f"\nBaseline was recorded at scale={base_meta.get('scale')} "
+                  f"concurrency={base_meta.get('concurrency')}; not comparing")
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump({'meta': meta, 'routes': results}, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f'Baseline written to {args.baseline}')
+
+    if args.check and regressions:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
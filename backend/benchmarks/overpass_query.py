@@ -0,0 +1,90 @@
+"""
+Compare the legacy 18-clause Overpass query with the collapsed query builder
+
+Runs both queries against the same Overpass endpoint for a set of locations
+and reports response size, server round-trip time and element counts.
+
+Usage:
+    python benchmarks/overpass_query.py
+    python benchmarks/overpass_query.py --url http://localhost:12345/api/interpreter --runs 5
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from overpass import build_overpass_query, elements_to_facilities  # noqa: E402
+
+LOCATIONS = [
+    ('New York', 40.7128, -74.0060),
+    ('London', 51.5074, -0.1278),
+    ('Bengaluru', 12.9716, 77.5946),
+]
+
+LEGACY_QUERY = """
+        [out:json];
+        (
+          node["amenity"="hospital"](around:{radius},{lat},{lon});
+          node["amenity"="clinic"](around:{radius},{lat},{lon});
+          node["amenity"="pharmacy"](around:{radius},{lat},{lon});
+          node["amenity"="doctors"](around:{radius},{lat},{lon});
+          node["amenity"="dentist"](around:{radius},{lat},{lon});
+          node["healthcare"="hospital"](around:{radius},{lat},{lon});
+          node["healthcare"="clinic"](around:{radius},{lat},{lon});
+          node["healthcare"="doctor"](around:{radius},{lat},{lon});
+          node["healthcare"="dentist"](around:{radius},{lat},{lon});
+          node["healthcare"="pharmacy"](around:{radius},{lat},{lon});
+          way["amenity"="hospital"](around:{radius},{lat},{lon});
+          way["amenity"="clinic"](around:{radius},{lat},{lon});
+          way["amenity"="pharmacy"](around:{radius},{lat},{lon});
+          way["amenity"="doctors"](around:{radius},{lat},{lon});
+          way["amenity"="dentist"](around:{radius},{lat},{lon});
+          way["healthcare"="hospital"](around:{radius},{lat},{lon});
+          way["healthcare"="clinic"](around:{radius},{lat},{lon});
+          way["healthcare"="doctor"](around:{radius},{lat},{lon});
+        );
+        out center;
+        """
+
+
+def run_query(session, url, query, timeout):
+    started = time.perf_counter()
+    response = session.post(url, data={'data': query}, timeout=timeout)
+    elapsed = time.perf_counter() - started
+    response.raise_for_status()
+    elements = response.json().get('elements', [])
+    return elapsed, len(response.content), len(elements), len(elements_to_facilities(elements))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--url', default=os.getenv('OVERPASS_API_URL', 'http://overpass-api.de/api/interpreter'))
+    parser.add_argument('--radius', type=int, default=5000)
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--timeout', type=int, default=60)
+    parser.add_argument('--pause', type=float, default=2.0, help='Seconds between requests (be polite to public servers)')
+    args = parser.parse_args(argv)
+
+    session = requests.Session()
+    print(f"{'location':<12} {'query':<8} {'median s':>9} {'bytes':>10} {'elements':>9} {'facilities':>11}")
+    for name, lat, lon in LOCATIONS:
+        queries = {
+            'legacy': LEGACY_QUERY.format(lat=lat, lon=lon, radius=args.radius),
+            'builder': build_overpass_query(lat, lon, args.radius, timeout=args.timeout),
+        }
+        for label, query in queries.items():
+            timings = []
+            for _ in range(args.runs):
+                elapsed, size, elements, facilities = run_query(session, args.url, query, args.timeout)
+                timings.append(elapsed)
+                time.sleep(args.pause)
+            print(f"{name:<12} {label:<8} {statistics.median(timings):>9.2f} {size:>10} {elements:>9} {facilities:>11}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+"""
+Measure /api/search index build time and query latency at 10k to 1M facilities
+
+Builds each backend from the same synthetic facilities (names assembled from
+word lists around the benchmark locations, fixed seed) and times a mix of
+exact, prefix, misspelled and address queries with a search location.
+Reports build time and the median and p99 query latency per query.
+
+Usage:
+    python benchmarks/search_index.py
+    python benchmarks/search_index.py --documents 1000000 --backends memory
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from datasets import LOCATIONS, jitter  # noqa: E402
+from search import FTS5SearchIndex, MemorySearchIndex, fts5_available  # noqa: E402
+
+WORDS = ['Saint', 'City', 'General', 'Mercy', 'Memorial', 'Children', 'Apollo', 'Fortis', 'Royal', 'Central',
+         'Riverside', 'Lakeview', 'Sunrise', 'Hope', 'Grace', 'Unity', 'Metro', 'Valley', 'Oak', 'Cedar']
+KINDS = ['Hospital', 'Clinic', 'Pharmacy', 'Medical Center', 'Health Centre', 'Dental Care', 'Diagnostics']
+STREETS = ['Main', 'Park', 'Oak', 'Maple', 'High', 'Church', 'Station', 'Market', 'Mill', 'Bridge']
+QUERIES = ['mercy hospital', 'mercy hosp', 'mrecy hospitl', 'apollo', 'ri', 'lakeview clinic 123', 'main street']
+
+
+def documents(count, seed=42):
+    rng = random.Random(seed)
+    for n in range(count):
+        _, lat, lon = LOCATIONS[n % len(LOCATIONS)]
+        lat, lon = jitter(rng, lat, lon)
+        kind = rng.choice(KINDS)
+        name = f'{rng.choice(WORDS)} {rng.choice(WORDS)} {kind} {n}'
+        address = f'{rng.randint(1, 999)} {rng.choice(STREETS)} Street'
+        facility = {'id': n, 'name': name, 'type': kind.lower(), 'latitude': lat, 'longitude': lon, 'address': address}
+        yield n, name, address, facility['type'], lat, lon, facility
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--documents', type=int, default=100_000)
+    parser.add_argument('--backends', default='memory,fts5', help='Comma-separated: memory, fts5')
+    parser.add_argument('--repeat', type=int, default=50, help='Timed runs per query')
+    args = parser.parse_args(argv)
+
+    _, lat, lon = LOCATIONS[0]
+    for backend in args.backends.split(','):
+        if backend == 'fts5' and not fts5_available():
+            print('fts5: not available in this SQLite build')
+            continue
+        index = MemorySearchIndex() if backend == 'memory' else FTS5SearchIndex()
+        started = time.perf_counter()
+        index.add_many(documents(args.documents))
+        print(f'{backend}: {len(index)} documents indexed in {time.perf_counter() - started:.1f} s')
+        print(f"  {'query':<22} {'p50 ms':>8} {'p99 ms':>8}  top result")
+        for query in QUERIES:
+            index.search(query, lat, lon, limit=10)
+            timings = []
+            for _ in range(args.repeat):
+                started = time.perf_counter()
+                results = index.search(query, lat, lon, limit=10)
+                timings.append((time.perf_counter() - started) * 1000)
+            timings.sort()
+            p99 = timings[min(len(timings) - 1, int(len(timings) * 0.99))]
+            top = results[0]['name'] if results else '-'
+            print(f'  {query:<22} {statistics.median(timings):>8.2f} {p99:>8.2f}  {top}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,167 @@
+"""
+Local Overpass API stub for benchmarks
+
+Replays recorded responses from benchmarks/fixtures/ (keyed by a hash of the
+query text) and synthesizes a deterministic response for any query without a
+recording, so benchmark runs never touch the public Overpass servers.
+
+Usage:
+    python benchmarks/stub_overpass.py --port 8765 --latency 0.2
+    python benchmarks/stub_overpass.py --record http://overpass-api.de/api/interpreter
+"""
+import argparse
+import hashlib
+import json
+import math
+import os
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+import requests
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+AROUND_PATTERN = re.compile(r'around:(\d+(?:\.\d+)?),(-?\d+(?:\.\d+)?),(-?\d+(?:\.\d+)?)')
+FACILITY_TAGS = [
+    ('amenity', 'hospital'), ('amenity', 'clinic'), ('amenity', 'pharmacy'),
+    ('amenity', 'doctors'), ('amenity', 'dentist'), ('healthcare', 'hospital'),
+    ('healthcare', 'clinic'), ('healthcare', 'doctor'),
+]
+OPENING_HOURS = ['24/7', 'Mo-Fr 08:00-18:00', 'Mo-Sa 09:00-21:00; Su 10:00-14:00', None]
+
+
+def fixture_path(query, fixture_dir=FIXTURE_DIR):
+    digest = hashlib.sha1(query.strip().encode('utf-8')).hexdigest()[:16]
+    return os.path.join(fixture_dir, f'overpass_{digest}.json')
+
+
+def synthesize_response(query, density=40):
+    """Build a deterministic Overpass response for the circle in the query"""
+    match = AROUND_PATTERN.search(query)
+    radius, lat, lon = (float(value) for value in match.groups()) if match else (5000.0, 0.0, 0.0)
+    rng = random.Random(query)
+    count = max(1, int(density * (radius / 1000.0) ** 2))
+    elements = []
+    for n in range(count):
+        # Uniform over the disc, in degrees (close enough for a stub)
+        distance = radius * rng.random() ** 0.5 / 111320.0
+        angle = rng.random() * 2 * math.pi
+        point = {'lat': lat + distance * math.cos(angle),
+                 'lon': lon + distance * math.sin(angle) / max(math.cos(math.radians(lat)), 0.01)}
+        key, value = rng.choice(FACILITY_TAGS)
+        tags = {key: value, 'name': f'{value.title()} {n}'}
+        hours = rng.choice(OPENING_HOURS)
+        if hours:
+            tags['opening_hours'] = hours
+        if rng.random() < 0.5:
+            tags['phone'] = f'+1 555 {n:04d}'
+        if rng.random() < 0.3:
+            elements.append({'type': 'way', 'id': 10_000_000 + n, 'center': point, 'tags': tags})
+        else:
+            elements.append(dict(point, type='node', id=n + 1, tags=tags))
+    return {'version': 0.6, 'generator': 'medihost-stub', 'elements': elements}
+
+
+class StubOverpassServer:
+    """Threaded HTTP server answering POST /api/interpreter"""
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, density=40,
+                 fixture_dir=FIXTURE_DIR, record_url=None):
+        self.latency = latency
+        self.density = density
+        self.fixture_dir = fixture_dir
+        self.record_url = record_url
+        self.requests = 0
+        self.replayed = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}/api/interpreter'
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name='overpass-stub', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def respond(self, query):
+        """Return the response body bytes for a query"""
+        with self._lock:
+            self.requests += 1
+        path = fixture_path(query, self.fixture_dir)
+        if os.path.exists(path):
+            with self._lock:
+                self.replayed += 1
+            with open(path, 'rb') as f:
+                return f.read()
+        if self.record_url:
+            response = requests.post(self.record_url, data={'data': query}, timeout=120)
+            response.raise_for_status()
+            os.makedirs(self.fixture_dir, exist_ok=True)
+            with open(path, 'wb') as f:
+                f.write(response.content)
+            return response.content
+        return json.dumps(synthesize_response(query, self.density), separators=(',', ':')).encode('utf-8')
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                form = parse_qs(self.rfile.read(length).decode('utf-8'))
+                query = (form.get('data') or [''])[0]
+                if stub.latency:
+                    time.sleep(stub.latency)
+                try:
+                    body = stub.respond(query)
+                except Exception as e:
+                    body = str(e).encode('utf-8')
+                    self.send_response(502)
+                else:
+                    self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        return Handler
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds added to every response')
+    parser.add_argument('--density', type=int, default=40, help='Synthetic facilities per square km')
+    parser.add_argument('--fixtures', default=FIXTURE_DIR)
+    parser.add_argument('--record', metavar='URL', help='Forward unrecorded queries to URL and save the responses')
+    args = parser.parse_args(argv)
+
+    stub = StubOverpassServer(args.host, args.port, args.latency, args.density, args.fixtures, args.record).start()
+    print(f'Overpass stub listening on {stub.url}', flush=True)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        stub.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+"""
+Measure sustained appointment inserts with and without write-behind
+
+Writer threads post to POST /api/appointments (without a hospital, the
+bookings write-behind journals) through the Flask test client, against a
+fresh SQLite database per mode. In 'sync' mode every request commits its
+own row; in 'write-behind' mode requests journal their row and a background
+thread inserts batches (WRITE_BEHIND_ENABLED). Reports request throughput
+and latency, then stops the flusher and checks that every row reached the
+database.
+
+Usage:
+    python benchmarks/write_behind.py
+    python benchmarks/write_behind.py --writers 32 --requests 500 --no-fsync
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+APPOINTMENT = {'name': 'Bench', 'phone': '555-0100', 'date': '2025-01-01 10:00', 'reason': 'Benchmark'}
+
+
+def run_writers(app, writers, requests):
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+    barrier = threading.Barrier(writers)
+
+    def writer(worker):
+        client = app.test_client()
+        local_latencies = []
+        local_errors = 0
+        barrier.wait()
+        for _ in range(requests):
+            started = time.perf_counter()
+            response = client.post('/api/appointments', json=APPOINTMENT)
+            if response.status_code == 201:
+                local_latencies.append(time.perf_counter() - started)
+            else:
+                local_errors += 1
+        with lock:
+            latencies.extend(local_latencies)
+            errors.append(local_errors)
+
+    threads = [threading.Thread(target=writer, args=(worker,)) for worker in range(writers)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - started, sorted(latencies), sum(errors)
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--writers', type=int, default=16)
+    parser.add_argument('--requests', type=int, default=250, help='Requests sent by each writer')
+    parser.add_argument('--interval', type=float, default=0.05, help='WRITE_BEHIND_INTERVAL')
+    parser.add_argument('--no-fsync', action='store_true', help='Journal without fsync (WRITE_BEHIND_FSYNC=false)')
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix='medihost-write-behind-')
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(workdir, 'app.db')
+    os.environ.setdefault('NEARBY_LAST_GOOD_PATH', '')
+    os.environ.setdefault('NEARBY_PREFETCH_PATH', '')
+    import app as application  # noqa: E402 -- imported after DATABASE_URL is set
+    from config import Config  # noqa: E402
+
+    print(f"{'mode':<13} {'writers':>7} {'req/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>7} {'rows':>7}")
+    for mode in ('sync', 'write-behind'):
+        overrides = {
+            'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + os.path.join(workdir, f'{mode}.db'),
+            'RATE_LIMIT_PER_IP': 0,
+            'WRITE_BEHIND_ENABLED': mode == 'write-behind',
+            'WRITE_BEHIND_JOURNAL_DIR': os.path.join(workdir, 'journal'),
+            'WRITE_BEHIND_INTERVAL': args.interval,
+            'WRITE_BEHIND_FSYNC': not args.no_fsync
+        }
+        app = application.create_app(type('BenchConfig', (Config,), overrides))
+        with app.app_context():
+            application.schema.ensure()
+
+        elapsed, latencies, errors = run_writers(app, args.writers, args.requests)
+        if application.write_behind is not None:
+            application.write_behind.stop()
+        with app.app_context():
+            rows = application.Appointment.query.count()
+        print(f"{mode:<13} {args.writers:>7} {len(latencies) / elapsed:>9.0f} "
+              f"{statistics.median(latencies) * 1000 if latencies else 0:>8.1f} "
+              f"{percentile(latencies, 0.95) * 1000:>8.1f} {percentile(latencies, 0.99) * 1000:>8.1f} "
+              f"{errors:>7} {rows:>7}")
+
+
+if __name__ == '__main__':
+    main()
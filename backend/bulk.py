@@ -0,0 +1,168 @@
+"""
+Bulk import and export of custom hospitals
+
+Rows are read incrementally from CSV or NDJSON streams, validated one at a
+time, and written in chunks: each chunk does one set-based lookup of the
+names it contains, then one executemany INSERT for new rows and one
+executemany UPDATE (or skip) for existing ones. Hospitals are keyed by name,
+the same natural key the seed script uses.
+"""
+import csv
+import io
+import json
+
+from sqlalchemy import insert, select, update
+
+HOSPITAL_FIELDS = (
+    'name', 'type', 'latitude', 'longitude', 'address', 'phone',
+    'opening_hours', 'website', 'description', 'is_featured'
+)
+REQUIRED_FIELDS = ('name', 'type', 'latitude', 'longitude')
+STRING_LIMITS = {
+    'name': 200, 'type': 50, 'address': 300, 'phone': 50,
+    'opening_hours': 200, 'website': 200, 'description': 500
+}
+
+
+class BulkImportError(ValueError):
+    """Raised for an unsupported or unreadable bulk payload"""
+
+
+def iter_csv_rows(lines):
+    """Yield (row_number, dict) from an iterable of CSV lines (bytes or str)"""
+    decoded = (line.decode('utf-8-sig') if isinstance(line, bytes) else line for line in lines)
+    reader = csv.DictReader(decoded)
+    for number, row in enumerate(reader, start=1):
+        yield number, row
+
+
+def iter_ndjson_rows(lines):
+    """Yield (row_number, dict or error string) from an iterable of NDJSON lines"""
+    number = 0
+    for line in lines:
+        if isinstance(line, bytes):
+            line = line.decode('utf-8-sig')
+        if not line.strip():
+            continue
+        number += 1
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            yield number, f'Invalid JSON: {e}'
+            continue
+        if not isinstance(row, dict):
+            yield number, 'Each line must be a JSON object'
+            continue
+        yield number, row
+
+
+def _parse_bool(value):
+    if isinstance(value, bool):
+        return value
+    if value is None:
+        return False
+    return str(value).strip().lower() in ('1', 'true', 'yes', 'y')
+
+
+def validate_row(row):
+    """Return (values, None) for a valid row or (None, error message)"""
+    for field in REQUIRED_FIELDS:
+        if row.get(field) in (None, ''):
+            return None, f'{field} is required'
+
+    values = {}
+    try:
+        values['latitude'] = float(row['latitude'])
+        values['longitude'] = float(row['longitude'])
+    except (TypeError, ValueError):
+        return None, 'latitude and longitude must be numbers'
+    if not -90 <= values['latitude'] <= 90 or not -180 <= values['longitude'] <= 180:
+        return None, 'latitude/longitude out of range'
+
+    for field, limit in STRING_LIMITS.items():
+        value = row.get(field)
+        value = '' if value is None else str(value).strip()
+        if len(value) > limit:
+            return None, f'{field} is longer than {limit} characters'
+        values[field] = value
+    values['is_featured'] = _parse_bool(row.get('is_featured'))
+    return values, None
+
+
+def upsert_hospitals(session, model, rows, chunk_size=1000, on_conflict='update', max_errors=100):
+    """
+    Insert or update hospitals from an iterable of (row_number, dict or error).
+    on_conflict is 'update' to overwrite rows with the same name or 'skip'
+    to leave them untouched. Returns a summary dict with per-row errors.
+    """
+    summary = {'inserted': 0, 'updated': 0, 'skipped': 0, 'failed': 0, 'errors': []}
+
+    def record_error(number, message):
+        summary['failed'] += 1
+        if len(summary['errors']) < max_errors:
+            summary['errors'].append({'row': number, 'error': message})
+
+    def flush(chunk):
+        # Last occurrence of a name within a chunk wins
+        by_name = {}
+        for values in chunk:
+            by_name[values['name']] = values
+        existing = dict(session.execute(
+            select(model.name, model.id).where(model.name.in_(list(by_name)))
+        ).all())
+
+        inserts = [values for name, values in by_name.items() if name not in existing]
+        updates = [dict(values, id=existing[name]) for name, values in by_name.items() if name in existing]
+        summary['skipped'] += len(chunk) - len(by_name)
+
+        if inserts:
+            session.execute(insert(model), inserts)
+            summary['inserted'] += len(inserts)
+        if updates:
+            if on_conflict == 'update':
+                session.execute(update(model), updates)
+                summary['updated'] += len(updates)
+            else:
+                summary['skipped'] += len(updates)
+        session.commit()
+
+    chunk = []
+    for number, row in rows:
+        if isinstance(row, str):
+            record_error(number, row)
+            continue
+        values, error = validate_row(row)
+        if error:
+            record_error(number, error)
+            continue
+        chunk.append(values)
+        if len(chunk) >= chunk_size:
+            flush(chunk)
+            chunk = []
+    if chunk:
+        flush(chunk)
+    return summary
+
+
+def iter_export(session, model, output_format='csv', batch_size=1000):
+    """Yield hospitals as CSV or NDJSON text chunks, reading the table in batches"""
+    columns = [getattr(model, field) for field in ('id',) + HOSPITAL_FIELDS]
+    result = session.execute(select(*columns).order_by(model.id).execution_options(yield_per=batch_size))
+
+    if output_format == 'csv':
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(('id',) + HOSPITAL_FIELDS)
+        for rows in result.partitions():
+            writer.writerows(rows)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue()
+    elif output_format == 'ndjson':
+        keys = ('id',) + HOSPITAL_FIELDS
+        for rows in result.partitions():
+            yield ''.join(json.dumps(dict(zip(keys, row)), separators=(',', ':')) + '\n' for row in rows)
+    else:
+        raise BulkImportError('format must be csv or ndjson')
@@ -0,0 +1,384 @@
+"""
+Geo-tiled response cache for nearby facility searches
+
+Queries are quantized to a geohash cell plus a radius bucket. The upstream
+search for a tile is made around the cell center with the bucket radius
+widened by the cell's half-diagonal, so the cached result covers every
+query circle that maps onto the same tile and can be filtered down exactly.
+Expired entries are kept for a stale_ttl grace period so they can still be
+served when the upstream is overloaded. The last successful result for each
+tile is also kept on disk for much longer, so stale data survives restarts
+and can be served while a background refresh runs.
+"""
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from ratelimit import LimitExceeded
+
+from geo import geohash_bounds, geohash_encode, haversine_m
+
+DEFAULT_RADIUS_BUCKETS = (1000, 2000, 3000, 5000, 10000, 15000, 25000, 50000)
+
+Tile = namedtuple('Tile', ['key', 'center_lat', 'center_lon', 'fetch_radius'])
+
+
+class MemoryCacheBackend:
+    """In-process LRU store bounded by total value size in bytes"""
+
+    name = 'memory'
+
+    def __init__(self, max_bytes, stale_ttl=0):
+        self.max_bytes = max_bytes
+        self.stale_ttl = stale_ttl
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, key, stale=False):
+        """Return a fresh value, or with stale=True one expired less than stale_ttl ago"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            now = time.time()
+            if expires_at + self.stale_ttl <= now:
+                self._remove(key)
+                return None
+            if expires_at <= now and not stale:
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        if len(value) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.time() + ttl, value)
+            self._bytes += len(value)
+            while self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'evictions': self.evictions
+            }
+
+    def _remove(self, key):
+        _, value = self._entries.pop(key)
+        self._bytes -= len(value)
+
+
+class SQLiteCacheBackend:
+    """On-disk LRU store shared by every worker on the same host"""
+
+    name = 'sqlite'
+
+    def __init__(self, path, max_bytes, stale_ttl=0):
+        self.max_bytes = max_bytes
+        self.stale_ttl = stale_ttl
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=5, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS tile_cache ('
+            'key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, '
+            'expires_at REAL NOT NULL, accessed_at REAL NOT NULL)'
+        )
+        self._conn.execute('CREATE INDEX IF NOT EXISTS ix_tile_cache_accessed ON tile_cache (accessed_at)')
+
+    def get(self, key, stale=False):
+        """Return a fresh value, or with stale=True one expired less than stale_ttl ago"""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT value, expires_at FROM tile_cache WHERE key = ?', (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] + self.stale_ttl <= now:
+                self._conn.execute('DELETE FROM tile_cache WHERE key = ?', (key,))
+                return None
+            if row[1] <= now and not stale:
+                return None
+            self._conn.execute('UPDATE tile_cache SET accessed_at = ? WHERE key = ?', (now, key))
+            return bytes(row[0])
+
+    def set(self, key, value, ttl):
+        if len(value) > self.max_bytes:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO tile_cache (key, value, size, expires_at, accessed_at) '
+                'VALUES (?, ?, ?, ?, ?)',
+                (key, value, len(value), now + ttl, now)
+            )
+            self._evict()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute('DELETE FROM tile_cache')
+
+    def stats(self):
+        with self._lock:
+            entries, total = self._conn.execute(
+                'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM tile_cache'
+            ).fetchone()
+        return {
+            'entries': entries,
+            'bytes': total,
+            'max_bytes': self.max_bytes,
+            'evictions': self.evictions
+        }
+
+    def _evict(self):
+        total = self._conn.execute('SELECT COALESCE(SUM(size), 0) FROM tile_cache').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        self._conn.execute('DELETE FROM tile_cache WHERE expires_at <= ?', (time.time() - self.stale_ttl,))
+        rows = self._conn.execute('SELECT key, size FROM tile_cache ORDER BY accessed_at').fetchall()
+        total = sum(size for _, size in rows)
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            self._conn.execute('DELETE FROM tile_cache WHERE key = ?', (key,))
+            total -= size
+            self.evictions += 1
+
+
+class TileCache:
+    """Maps nearby queries onto tiles and caches the facilities per tile"""
+
+    def __init__(self, backend, ttl, radius_buckets=DEFAULT_RADIUS_BUCKETS):
+        self.backend = backend
+        self.ttl = ttl
+        self.radius_buckets = sorted(radius_buckets)
+        self.hits = 0
+        self.misses = 0
+        self.stale_hits = 0
+        self.prefetched = None
+        self.prefetch_max_age = 0
+        self.prefetch_hits = 0
+
+    @property
+    def enabled(self):
+        return self.backend is not None
+
+    def radius_bucket(self, radius):
+        """Round a radius up to the nearest configured bucket"""
+        for bucket in self.radius_buckets:
+            if radius <= bucket:
+                return bucket
+        return -(-radius // 1000) * 1000
+
+    def tile_for(self, lat, lon, radius):
+        """Return the tile whose cached result covers the given query"""
+        if not self.enabled:
+            return Tile(None, lat, lon, radius)
+
+        bucket = self.radius_bucket(radius)
+        for precision in range(4, 9):
+            geohash = geohash_encode(lat, lon, precision)
+            min_lat, min_lon, max_lat, max_lon = geohash_bounds(geohash)
+            center_lat = (min_lat + max_lat) / 2
+            center_lon = (min_lon + max_lon) / 2
+            half_diagonal = max(
+                haversine_m(center_lat, center_lon, min_lat, min_lon),
+                haversine_m(center_lat, center_lon, max_lat, min_lon)
+            )
+            if half_diagonal <= bucket / 8:
+                break
+
+        key = f'{geohash}:{bucket}'
+        return Tile(key, center_lat, center_lon, int(bucket + half_diagonal) + 1)
+
+    def attach_prefetched(self, artifact, max_age):
+        """Fall back to a read-only prefetch artifact (see prefetch.py) for tiles not in the backend"""
+        self.prefetched = artifact
+        self.prefetch_max_age = max_age
+
+    def _get_prefetched(self, tile, max_age=None):
+        if self.prefetched is None or (max_age and self.prefetched.age() > max_age):
+            return None
+        facilities = self.prefetched.get(tile.key)
+        if facilities is not None:
+            self.prefetch_hits += 1
+        return facilities
+
+    def get(self, tile):
+        if tile.key is None:
+            return None
+        value = self.backend.get(tile.key)
+        if value is None:
+            facilities = self._get_prefetched(tile, self.prefetch_max_age)
+            if facilities is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return facilities
+        self.hits += 1
+        return json.loads(value)
+
+    def get_stale(self, tile):
+        """Return facilities for the tile even if expired (within the backend's stale_ttl)"""
+        if tile.key is None:
+            return None
+        value = self.backend.get(tile.key, stale=True)
+        if value is None:
+            # An outdated prefetched tile beats waiting on the upstream
+            facilities = self._get_prefetched(tile)
+            if facilities is not None:
+                self.stale_hits += 1
+            return facilities
+        self.stale_hits += 1
+        return json.loads(value)
+
+    def set(self, tile, facilities):
+        if tile.key is None:
+            return
+        value = json.dumps(facilities, separators=(',', ':')).encode('utf-8')
+        self.backend.set(tile.key, value, self.ttl)
+
+    def stats(self):
+        if not self.enabled:
+            return {'backend': 'none'}
+        lookups = self.hits + self.misses
+        stats = {
+            'backend': self.backend.name,
+            'hits': self.hits,
+            'misses': self.misses,
+            'stale_hits': self.stale_hits,
+            'prefetch_hits': self.prefetch_hits,
+            'prefetched_tiles': len(self.prefetched) if self.prefetched is not None else 0,
+            'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0
+        }
+        stats.update(self.backend.stats())
+        return stats
+
+
+class LastKnownGoodStore:
+    """Persistent, byte-bounded record of the last successful result per tile"""
+
+    def __init__(self, path, max_bytes, max_age):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.hits = 0
+        self._backend = None
+        self._lock = threading.Lock()
+
+    @property
+    def backend(self):
+        # Opened on first use so startup does not wait on the file
+        if self._backend is None:
+            with self._lock:
+                if self._backend is None:
+                    self._backend = SQLiteCacheBackend(self.path, self.max_bytes)
+        return self._backend
+
+    def get(self, tile):
+        """Return (facilities, fetched_at) or None"""
+        if tile.key is None:
+            return None
+        value = self.backend.get(tile.key)
+        if value is None:
+            return None
+        self.hits += 1
+        record = json.loads(value)
+        return record['facilities'], record['fetched_at']
+
+    def set(self, tile, facilities):
+        if tile.key is None:
+            return
+        record = {'fetched_at': time.time(), 'facilities': facilities}
+        self.backend.set(tile.key, json.dumps(record, separators=(',', ':')).encode('utf-8'), self.max_age)
+
+    def stats(self):
+        return dict(self.backend.stats(), hits=self.hits)
+
+
+class TileRefresher:
+    """
+    Runs tile fetches on a small thread pool, one at a time per tile. A full
+    queue raises LimitExceeded instead of growing without bound.
+    """
+
+    def __init__(self, workers=4, max_pending=32):
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='tile-refresh')
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def submit(self, key, fetch):
+        """Start fetch() for key unless one is already running; returns its Future"""
+        with self._lock:
+            future = self._pending.get(key)
+            if future is not None:
+                return future
+            if len(self._pending) >= self.max_pending:
+                raise LimitExceeded('Too many tile refreshes pending')
+            future = self._pending[key] = self._executor.submit(fetch)
+        future.add_done_callback(lambda _: self._done(key))
+        return future
+
+    def _done(self, key):
+        with self._lock:
+            self._pending.pop(key, None)
+
+    def pending(self):
+        with self._lock:
+            return len(self._pending)
+
+
+def create_last_good_store(config):
+    """Build the last-known-good store from Flask config values, or None if disabled"""
+    path = config.get('NEARBY_LAST_GOOD_PATH', 'nearby_last_good.db')
+    if not path:
+        return None
+    return LastKnownGoodStore(
+        path,
+        max_bytes=config.get('NEARBY_LAST_GOOD_MAX_BYTES', 256 * 1024 * 1024),
+        max_age=config.get('NEARBY_LAST_GOOD_MAX_AGE', 7 * 86400)
+    )
+
+
+def create_tile_cache(config):
+    """Build the nearby tile cache from Flask config values"""
+    backend_name = config.get('NEARBY_CACHE_BACKEND', 'memory')
+    max_bytes = config.get('NEARBY_CACHE_MAX_BYTES', 64 * 1024 * 1024)
+    stale_ttl = config.get('NEARBY_CACHE_STALE_TTL', 86400)
+
+    if backend_name == 'memory':
+        backend = MemoryCacheBackend(max_bytes, stale_ttl)
+    elif backend_name == 'sqlite':
+        backend = SQLiteCacheBackend(config.get('NEARBY_CACHE_PATH', 'nearby_cache.db'), max_bytes, stale_ttl)
+    elif backend_name == 'none':
+        backend = None
+    else:
+        raise ValueError(f'Unknown NEARBY_CACHE_BACKEND: {backend_name}')
+
+    return TileCache(
+        backend,
+        ttl=config.get('NEARBY_CACHE_TTL', 900),
+        radius_buckets=config.get('NEARBY_CACHE_RADIUS_BUCKETS', DEFAULT_RADIUS_BUCKETS)
+    )
@@ -4,6 +4,19 @@ from dotenv import load_dotenv
 # Load environment variables from .env file
 load_dotenv()
 
+def engine_options(database_uri):
+    """SQLAlchemy engine options for the configured database"""
+    if database_uri.startswith('sqlite'):
+        # SQLite has no server-side pool to size; pragmas are set per connection in database.py
+        return {'connect_args': {'timeout': int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', '5000')) / 1000}}
+    return {
+        'pool_size': int(os.getenv('DB_POOL_SIZE', '10')),
+        'max_overflow': int(os.getenv('DB_MAX_OVERFLOW', '20')),
+        'pool_timeout': int(os.getenv('DB_POOL_TIMEOUT', '30')),
+        'pool_recycle': int(os.getenv('DB_POOL_RECYCLE', '1800')),
+        'pool_pre_ping': True
+    }
+
 class Config:
     """Application configuration from environment variables"""
     
@@ -14,29 +27,121 @@ class Config:
     # Database Configuration
     SQLALCHEMY_DATABASE_URI = os.getenv('DATABASE_URL', 'sqlite:///database.db')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    SQLALCHEMY_ENGINE_OPTIONS = engine_options(SQLALCHEMY_DATABASE_URI)
+    SQLITE_BUSY_TIMEOUT_MS = int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', '5000'))
+    SQLITE_WAL = os.getenv('SQLITE_WAL', 'true').lower() == 'true'
+    # Create missing tables, columns and indexes on the first request (else run `python schema.py` on deploy)
+    SCHEMA_AUTO_MIGRATE = os.getenv('SCHEMA_AUTO_MIGRATE', 'true').lower() == 'true'
+    
+    # Optional read replica for admin listings and exports
+    DATABASE_REPLICA_URL = os.getenv('DATABASE_REPLICA_URL', '')
+    SQLALCHEMY_BINDS = {
+        'replica': dict(engine_options(DATABASE_REPLICA_URL), url=DATABASE_REPLICA_URL)
+    } if DATABASE_REPLICA_URL else {}
     
     # CORS Configuration
     ALLOWED_ORIGINS = os.getenv('ALLOWED_ORIGINS', 'http://localhost:3000').split(',')
     
     # Overpass API Configuration (No API key needed - it's free!)
-    OVERPASS_API_URL = 'http://overpass-api.de/api/interpreter'
+    OVERPASS_API_URL = os.getenv('OVERPASS_API_URL', 'http://overpass-api.de/api/interpreter')
+    OVERPASS_MIRRORS = [url for url in os.getenv('OVERPASS_MIRRORS', '').split(',') if url]
     OVERPASS_TIMEOUT = int(os.getenv('OVERPASS_TIMEOUT', '30'))
+    OVERPASS_HEDGE_DELAY = float(os.getenv('OVERPASS_HEDGE_DELAY', '2.0'))
+    OVERPASS_MAX_RETRIES = int(os.getenv('OVERPASS_MAX_RETRIES', '2'))
+    OVERPASS_MAX_BACKOFF = float(os.getenv('OVERPASS_MAX_BACKOFF', '10'))
+    OVERPASS_POOL_SIZE = int(os.getenv('OVERPASS_POOL_SIZE', '10'))
+    OVERPASS_MAX_CONCURRENCY = int(os.getenv('OVERPASS_MAX_CONCURRENCY', '4'))  # tile refresher threads
     
     # Search Configuration
     DEFAULT_SEARCH_RADIUS = int(os.getenv('DEFAULT_SEARCH_RADIUS', '5000'))
     MAX_SEARCH_RADIUS = int(os.getenv('MAX_SEARCH_RADIUS', '15000'))
     
+    # Nearby Search Source (overpass, local snapshot, or hybrid: local when the snapshot covers the query)
+    NEARBY_SOURCE = os.getenv('NEARBY_SOURCE', 'overpass')
+    NEARBY_SNAPSHOT_PATH = os.getenv('NEARBY_SNAPSHOT_PATH', 'facilities.snap')
+    
+    # Nearby Search Cache (backend: memory, sqlite or none)
+    NEARBY_CACHE_BACKEND = os.getenv('NEARBY_CACHE_BACKEND', 'memory')
+    NEARBY_CACHE_TTL = int(os.getenv('NEARBY_CACHE_TTL', '900'))
+    NEARBY_CACHE_STALE_TTL = int(os.getenv('NEARBY_CACHE_STALE_TTL', '86400'))  # expired tiles served under load
+    NEARBY_CACHE_MAX_BYTES = int(os.getenv('NEARBY_CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
+    NEARBY_CACHE_PATH = os.getenv('NEARBY_CACHE_PATH', 'nearby_cache.db')
+    NEARBY_CACHE_RADIUS_BUCKETS = [
+        int(r) for r in os.getenv('NEARBY_CACHE_RADIUS_BUCKETS', '1000,2000,3000,5000,10000,15000,25000,50000').split(',')
+    ]
+    
+    # Nearby Search Fallbacks: last-known-good results per tile (empty path disables), background
+    # refresh of stale tiles, and the most a request waits on Overpass before answering from local data
+    NEARBY_LAST_GOOD_PATH = os.getenv('NEARBY_LAST_GOOD_PATH', 'nearby_last_good.db')
+    NEARBY_LAST_GOOD_MAX_BYTES = int(os.getenv('NEARBY_LAST_GOOD_MAX_BYTES', str(256 * 1024 * 1024)))
+    NEARBY_LAST_GOOD_MAX_AGE = int(os.getenv('NEARBY_LAST_GOOD_MAX_AGE', str(7 * 86400)))
+    NEARBY_REFRESH_MAX_PENDING = int(os.getenv('NEARBY_REFRESH_MAX_PENDING', '32'))
+    NEARBY_UPSTREAM_BUDGET = float(os.getenv('NEARBY_UPSTREAM_BUDGET', '5'))
+    NEARBY_DEGRADED_FALLBACK = os.getenv('NEARBY_DEGRADED_FALLBACK', 'true').lower() == 'true'
+    
+    # Nearby Search Prefetch: tiles for hot regions built by prefetch.py and memory-mapped at
+    # startup (a missing file disables it); served as fresh until older than NEARBY_PREFETCH_MAX_AGE
+    NEARBY_PREFETCH_PATH = os.getenv('NEARBY_PREFETCH_PATH', 'nearby_tiles.pfx')
+    NEARBY_PREFETCH_MAX_AGE = int(os.getenv('NEARBY_PREFETCH_MAX_AGE', '86400'))
+    
+    # Custom Hospital Spatial Index (grid for in-memory lookups, sql for bounding-box queries); the grid
+    # reloads when the change_counter shows another worker's write, and at least every HOSPITAL_INDEX_REFRESH seconds
+    HOSPITAL_SPATIAL_INDEX = os.getenv('HOSPITAL_SPATIAL_INDEX', 'grid')
+    HOSPITAL_INDEX_CELL_DEG = float(os.getenv('HOSPITAL_INDEX_CELL_DEG', '0.05'))
+    HOSPITAL_INDEX_REFRESH = int(os.getenv('HOSPITAL_INDEX_REFRESH', '300'))
+    
+    # Opening Hours: compiled weekly schedules kept per facility for open_now / open_at filters;
+    # open_now without a client tz= uses this IANA time zone (e.g. Europe/Berlin) or UTC offset,
+    # or the server's local time when empty
+    OPENING_HOURS_CACHE_SIZE = int(os.getenv('OPENING_HOURS_CACHE_SIZE', '50000'))
+    OPENING_HOURS_TIMEZONE = os.getenv('OPENING_HOURS_TIMEZONE', '')
+    
+    # Facility Search (/api/search): backend memory (in-process trigram index), fts5 (SQLite FTS5,
+    # in memory or at SEARCH_INDEX_PATH) or auto; fetched facilities beyond SEARCH_MAX_DOCUMENTS are
+    # evicted oldest first, and results are biased towards facilities within a few SEARCH_GEO_SCALE_KM
+    SEARCH_BACKEND = os.getenv('SEARCH_BACKEND', 'memory')
+    SEARCH_INDEX_PATH = os.getenv('SEARCH_INDEX_PATH', '')
+    SEARCH_MAX_DOCUMENTS = int(os.getenv('SEARCH_MAX_DOCUMENTS', '200000'))
+    SEARCH_MIN_SIMILARITY = float(os.getenv('SEARCH_MIN_SIMILARITY', '0.5'))  # share of query trigrams
+    SEARCH_GEO_WEIGHT = float(os.getenv('SEARCH_GEO_WEIGHT', '1.0'))
+    SEARCH_GEO_SCALE_KM = float(os.getenv('SEARCH_GEO_SCALE_KM', '5'))
+    SEARCH_CANDIDATES = int(os.getenv('SEARCH_CANDIDATES', '500'))  # fts5 rows rescored per query
+    SEARCH_DEFAULT_LIMIT = int(os.getenv('SEARCH_DEFAULT_LIMIT', '20'))
+    SEARCH_MAX_LIMIT = int(os.getenv('SEARCH_MAX_LIMIT', '100'))
+    
+    # Bulk Hospital Import
+    BULK_CHUNK_SIZE = int(os.getenv('BULK_CHUNK_SIZE', '1000'))
+    
+    # Emergency Alert Stream (Server-Sent Events)
+    EMERGENCY_STREAM_HEARTBEAT = int(os.getenv('EMERGENCY_STREAM_HEARTBEAT', '15'))
+    EMERGENCY_STREAM_QUEUE_SIZE = int(os.getenv('EMERGENCY_STREAM_QUEUE_SIZE', '100'))
+    EMERGENCY_STREAM_REPLAY_LIMIT = int(os.getenv('EMERGENCY_STREAM_REPLAY_LIMIT', '500'))
+    
+    # Emergency Routing: nearest hospitals attached to each alert (count 0 disables), searched in
+    # widening rings (meters) for at most EMERGENCY_ROUTING_BUDGET seconds; travel times come from
+    # speed bands ("length_m:km/h,...,:km/h") applied to straight-line distance times the detour factor
+    EMERGENCY_NEAREST_COUNT = int(os.getenv('EMERGENCY_NEAREST_COUNT', '3'))
+    EMERGENCY_REQUIRE_24_7 = os.getenv('EMERGENCY_REQUIRE_24_7', 'true').lower() == 'true'
+    EMERGENCY_ROUTING_RADII = [int(r) for r in os.getenv('EMERGENCY_ROUTING_RADII', '5000,15000,50000').split(',')]
+    EMERGENCY_ROUTING_BUDGET = float(os.getenv('EMERGENCY_ROUTING_BUDGET', '0.25'))
+    EMERGENCY_SPEED_BANDS = os.getenv('EMERGENCY_SPEED_BANDS', '2000:25,8000:45,:70')
+    EMERGENCY_DETOUR_FACTOR = float(os.getenv('EMERGENCY_DETOUR_FACTOR', '1.3'))
+    EMERGENCY_DISPATCH_OVERHEAD = int(os.getenv('EMERGENCY_DISPATCH_OVERHEAD', '60'))  # seconds
+    
     # Optional: Twilio Configuration (for SMS alerts)
     TWILIO_ENABLED = os.getenv('TWILIO_ENABLED', 'false').lower() == 'true'
     TWILIO_ACCOUNT_SID = os.getenv('TWILIO_ACCOUNT_SID', '')
     TWILIO_AUTH_TOKEN = os.getenv('TWILIO_AUTH_TOKEN', '')
     TWILIO_PHONE_NUMBER = os.getenv('TWILIO_PHONE_NUMBER', '')
     TWILIO_EMERGENCY_PHONE = os.getenv('TWILIO_EMERGENCY_PHONE', '')
+    TWILIO_RATE_LIMIT = float(os.getenv('TWILIO_RATE_LIMIT', '1'))  # messages per second
     
     # Optional: SendGrid Configuration (for email notifications)
     SENDGRID_ENABLED = os.getenv('SENDGRID_ENABLED', 'false').lower() == 'true'
     SENDGRID_API_KEY = os.getenv('SENDGRID_API_KEY', '')
     SENDGRID_FROM_EMAIL = os.getenv('SENDGRID_FROM_EMAIL', '')
+    SENDGRID_EMERGENCY_EMAIL = os.getenv('SENDGRID_EMERGENCY_EMAIL', '')
+    SENDGRID_RATE_LIMIT = float(os.getenv('SENDGRID_RATE_LIMIT', '10'))
     
     # Optional: Google Maps API Key (for geocoding)
     GOOGLE_MAPS_API_KEY = os.getenv('GOOGLE_MAPS_API_KEY', '')
@@ -45,8 +150,51 @@ class Config:
     FIREBASE_ENABLED = os.getenv('FIREBASE_ENABLED', 'false').lower() == 'true'
     FIREBASE_API_KEY = os.getenv('FIREBASE_API_KEY', '')
     FIREBASE_PROJECT_ID = os.getenv('FIREBASE_PROJECT_ID', '')
+    FIREBASE_EMERGENCY_TOPIC = os.getenv('FIREBASE_EMERGENCY_TOPIC', 'emergency-alerts')
+    FIREBASE_RATE_LIMIT = float(os.getenv('FIREBASE_RATE_LIMIT', '50'))
+    
+    # Background Threads (notification dispatcher, write-behind flusher), started on the first request;
+    # off on serverless hosts such as Vercel, which freeze or kill threads between invocations
+    BACKGROUND_THREADS = os.getenv('BACKGROUND_THREADS', 'false' if os.getenv('VERCEL') else 'true').lower() == 'true'
+    
+    # Notification Dispatch (outbox table + background workers)
+    NOTIFICATIONS_FAKE = os.getenv('NOTIFICATIONS_FAKE', 'false').lower() == 'true'  # log instead of sending
+    NOTIFICATION_WORKERS = int(os.getenv('NOTIFICATION_WORKERS', '2'))
+    NOTIFICATION_BATCH_SIZE = int(os.getenv('NOTIFICATION_BATCH_SIZE', '20'))
+    NOTIFICATION_MAX_ATTEMPTS = int(os.getenv('NOTIFICATION_MAX_ATTEMPTS', '5'))
+    NOTIFICATION_POLL_INTERVAL = float(os.getenv('NOTIFICATION_POLL_INTERVAL', '5'))
+    
+    # Rate Limiting and Load Shedding (appointment and emergency writes are exempt)
+    RATE_LIMIT_PER_IP = float(os.getenv('RATE_LIMIT_PER_IP', '0'))  # requests per second, 0 disables
+    RATE_LIMIT_BURST = int(os.getenv('RATE_LIMIT_BURST', '20'))
+    RATE_LIMIT_TRUST_FORWARDED = os.getenv('RATE_LIMIT_TRUST_FORWARDED', 'false').lower() == 'true'
+    MAX_INFLIGHT_REQUESTS = int(os.getenv('MAX_INFLIGHT_REQUESTS', '64'))  # 0 disables
+    PRIORITY_RESERVED_REQUESTS = int(os.getenv('PRIORITY_RESERVED_REQUESTS', '8'))  # of those, kept for writes
+    
+    # Metrics (/api/metrics) and slow-request logging (threshold in seconds, 0 disables)
+    METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'true').lower() == 'true'
+    SLOW_REQUEST_THRESHOLD = float(os.getenv('SLOW_REQUEST_THRESHOLD', '1.0'))
+    
+    # Appointment Scheduling (hospitals without capacity rules take any start time, one booking per slot)
+    APPOINTMENT_SLOT_MINUTES = int(os.getenv('APPOINTMENT_SLOT_MINUTES', '30'))
+    APPOINTMENT_DEFAULT_CAPACITY = int(os.getenv('APPOINTMENT_DEFAULT_CAPACITY', '1'))
+    APPOINTMENT_MAX_DURATION_MINUTES = int(os.getenv('APPOINTMENT_MAX_DURATION_MINUTES', '240'))
+    APPOINTMENT_AVAILABILITY_MAX_DAYS = int(os.getenv('APPOINTMENT_AVAILABILITY_MAX_DAYS', '31'))
+    
+    # Write-Behind Inserts: appointments without a hospital slot are journaled
+    # (fsynced, one fsync shared by concurrent requests) and inserted in batches every
+    # WRITE_BEHIND_INTERVAL seconds or WRITE_BEHIND_BATCH_SIZE rows; ids are reserved in blocks
+    WRITE_BEHIND_ENABLED = os.getenv('WRITE_BEHIND_ENABLED', 'false').lower() == 'true'
+    WRITE_BEHIND_JOURNAL_DIR = os.getenv('WRITE_BEHIND_JOURNAL_DIR', 'write_journal')
+    WRITE_BEHIND_INTERVAL = float(os.getenv('WRITE_BEHIND_INTERVAL', '0.05'))
+    WRITE_BEHIND_BATCH_SIZE = int(os.getenv('WRITE_BEHIND_BATCH_SIZE', '500'))
+    WRITE_BEHIND_FSYNC = os.getenv('WRITE_BEHIND_FSYNC', 'true').lower() == 'true'
+    WRITE_BEHIND_ID_BLOCK = int(os.getenv('WRITE_BEHIND_ID_BLOCK', '1000'))
+    WRITE_BEHIND_RECEIPT_DAYS = int(os.getenv('WRITE_BEHIND_RECEIPT_DAYS', '30'))  # applied-segment tokens kept
     
     # Admin Configuration
+    ADMIN_PAGE_SIZE = int(os.getenv('ADMIN_PAGE_SIZE', '100'))
+    ADMIN_MAX_PAGE_SIZE = int(os.getenv('ADMIN_MAX_PAGE_SIZE', '1000'))
     ADMIN_USERNAME = os.getenv('ADMIN_USERNAME', 'admin')
     ADMIN_PASSWORD = os.getenv('ADMIN_PASSWORD', 'admin123')  # Change in production!
 
@@ -0,0 +1,63 @@
+"""
+Database engine tuning and read-replica routing
+
+SQLite connections get WAL journaling, synchronous=NORMAL and a busy
+timeout so concurrent writers queue briefly instead of failing with
+"database is locked". Server databases get a bounded, pre-pinged pool (see
+engine_options in config.py). When a 'replica' bind is configured, admin
+read paths query it through a separate scoped session.
+"""
+from sqlalchemy import event
+from sqlalchemy.orm import scoped_session, sessionmaker
+
+
+def apply_sqlite_pragmas(engine, busy_timeout_ms=5000, wal=True):
+    """Set per-connection pragmas on every new SQLite connection of an engine"""
+    if engine.dialect.name != 'sqlite':
+        return
+
+    @event.listens_for(engine, 'connect')
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute(f'PRAGMA busy_timeout={int(busy_timeout_ms)}')
+        if wal and engine.url.database not in (None, '', ':memory:'):
+            cursor.execute('PRAGMA journal_mode=WAL')
+            cursor.execute('PRAGMA synchronous=NORMAL')
+        cursor.close()
+
+
+def configure_engines(db, config):
+    """Apply pragmas to every SQLite engine; call inside an app context"""
+    for engine in db.engines.values():
+        apply_sqlite_pragmas(
+            engine,
+            busy_timeout_ms=config.get('SQLITE_BUSY_TIMEOUT_MS', 5000),
+            wal=config.get('SQLITE_WAL', True)
+        )
+
+
+class ReadRouter:
+    """Routes read-only admin queries to the replica bind when one is configured"""
+
+    def __init__(self, db, app, bind_key='replica'):
+        self.db = db
+        self._session = None
+        with app.app_context():
+            engine = db.engines.get(bind_key)
+        if engine is not None:
+            self._session = scoped_session(sessionmaker(bind=engine))
+            app.teardown_appcontext(self._remove)
+
+    @property
+    def enabled(self):
+        return self._session is not None
+
+    @property
+    def session(self):
+        return self._session if self._session is not None else self.db.session
+
+    def query(self, *entities):
+        return self.session.query(*entities)
+
+    def _remove(self, exception=None):
+        self._session.remove()
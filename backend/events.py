@@ -0,0 +1,87 @@
+"""
+In-process publish/subscribe broker for Server-Sent Events
+
+Each subscriber gets a bounded queue. A subscriber that falls behind is
+disconnected instead of blocking publishers; the client reconnects with
+Last-Event-ID and the missed events are replayed from the database.
+"""
+import json
+import queue
+import threading
+from collections import namedtuple
+
+Event = namedtuple('Event', ['id', 'type', 'data'])
+
+# Put on a subscriber's queue when it has been dropped for falling behind
+CLOSED = object()
+
+
+class Subscription:
+    """One subscriber's bounded event queue"""
+
+    def __init__(self, maxsize):
+        self.queue = queue.Queue(maxsize)
+        self.closed = False
+
+    def get(self, timeout):
+        """Return the next Event, None on timeout, or CLOSED once dropped"""
+        if self.closed and self.queue.empty():
+            return CLOSED
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        """Discard queued events and wake the reader with CLOSED"""
+        self.closed = True
+        while True:
+            try:
+                self.queue.get_nowait()
+            except queue.Empty:
+                break
+        try:
+            self.queue.put_nowait(CLOSED)
+        except queue.Full:
+            pass
+
+
+class EventBroker:
+    """Fans published events out to every current subscriber"""
+
+    def __init__(self, queue_size=100):
+        self.queue_size = queue_size
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self.dropped = 0
+
+    def __len__(self):
+        return len(self._subscribers)
+
+    def subscribe(self):
+        subscription = Subscription(self.queue_size)
+        with self._lock:
+            self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def publish(self, event_id, event_type, data):
+        """Deliver an event without ever blocking on a slow subscriber"""
+        event = Event(event_id, event_type, data)
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            try:
+                subscription.queue.put_nowait(event)
+            except queue.Full:
+                self.unsubscribe(subscription)
+                subscription.close()
+                self.dropped += 1
+
+
+def format_sse(event):
+    """Encode an Event in the text/event-stream wire format"""
+    return f'id: {event.id}\nevent: {event.type}\ndata: {json.dumps(event.data, separators=(",", ":"))}\n\n'
@@ -0,0 +1,94 @@
+"""
+Geographic helpers shared by the nearby-search code paths
+"""
+import math
+
+EARTH_RADIUS_M = 6371008.8
+
+_GEOHASH_ALPHABET = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+
+def haversine_m(lat1, lon1, lat2, lon2):
+    """Great-circle distance in meters between two points"""
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    dphi = phi2 - phi1
+    dlmb = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlmb / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(min(1.0, math.sqrt(a)))
+
+
+def bounding_box(lat, lon, radius_m):
+    """Return (min_lat, min_lon, max_lat, max_lon) enclosing a circle"""
+    dlat = math.degrees(radius_m / EARTH_RADIUS_M)
+    coslat = math.cos(math.radians(lat))
+    if coslat < 1e-6:
+        dlon = 180.0
+    else:
+        dlon = min(180.0, dlat / coslat)
+    return (max(-90.0, lat - dlat), lon - dlon, min(90.0, lat + dlat), lon + dlon)
+
+
+def geohash_encode(lat, lon, precision):
+    """Encode a point as a geohash string of the given length"""
+    lat_lo, lat_hi = -90.0, 90.0
+    lon_lo, lon_hi = -180.0, 180.0
+    chars = []
+    bits = 0
+    bit_count = 0
+    even = True
+    while len(chars) < precision:
+        if even:
+            mid = (lon_lo + lon_hi) / 2
+            if lon >= mid:
+                bits = (bits << 1) | 1
+                lon_lo = mid
+            else:
+                bits <<= 1
+                lon_hi = mid
+        else:
+            mid = (lat_lo + lat_hi) / 2
+            if lat >= mid:
+                bits = (bits << 1) | 1
+                lat_lo = mid
+            else:
+                bits <<= 1
+                lat_hi = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(_GEOHASH_ALPHABET[bits])
+            bits = 0
+            bit_count = 0
+    return ''.join(chars)
+
+
+def geohash_bounds(geohash):
+    """Return (min_lat, min_lon, max_lat, max_lon) of a geohash cell"""
+    lat_lo, lat_hi = -90.0, 90.0
+    lon_lo, lon_hi = -180.0, 180.0
+    even = True
+    for char in geohash:
+        value = _GEOHASH_ALPHABET.index(char)
+        for shift in range(4, -1, -1):
+            bit = (value >> shift) & 1
+            if even:
+                mid = (lon_lo + lon_hi) / 2
+                if bit:
+                    lon_lo = mid
+                else:
+                    lon_hi = mid
+            else:
+                mid = (lat_lo + lat_hi) / 2
+                if bit:
+                    lat_lo = mid
+                else:
+                    lat_hi = mid
+            even = not even
+    return (lat_lo, lon_lo, lat_hi, lon_hi)
+
+
+def geohash_center(geohash):
+    """Return the (lat, lon) center of a geohash cell"""
+    min_lat, min_lon, max_lat, max_lon = geohash_bounds(geohash)
+    return ((min_lat + max_lat) / 2, (min_lon + max_lon) / 2)
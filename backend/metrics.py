@@ -0,0 +1,310 @@
+"""
+Request instrumentation exported in the Prometheus text format
+
+MetricsMiddleware wraps the WSGI app and times each request until its body
+has been fully sent, so streamed responses are measured end to end. While a
+request runs, its thread carries a RequestStats that the SQLAlchemy hooks
+and track_upstream() add to; the total is then split into upstream (Overpass),
+database and local processing time per route. Requests slower than the
+configured threshold are logged with that breakdown.
+"""
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+_local = threading.local()
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, '') for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        for key, value in sorted(values.items()):
+            yield self.name, _labels(self.labelnames, key), value
+
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets) + (float('inf'),)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, '') for name in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][index] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    def samples(self):
+        with self._lock:
+            series = {key: (list(counts), total, count) for key, (counts, total, count) in self._series.items()}
+        for key, (counts, total, count) in sorted(series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                yield self.name + '_bucket', _labels(self.labelnames, key, ('le', _number(bound))), cumulative
+            yield self.name + '_sum', _labels(self.labelnames, key), total
+            yield self.name + '_count', _labels(self.labelnames, key), count
+
+
+class Gauge:
+    """Read at scrape time from a callback returning a number or {label values: number}"""
+
+    kind = 'gauge'
+
+    def __init__(self, name, help_text, callback, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.callback = callback
+        self.labelnames = tuple(labelnames)
+
+    def samples(self):
+        try:
+            value = self.callback()
+        except Exception:
+            logger.exception('Metric %s callback failed', self.name)
+            return
+        if isinstance(value, dict):
+            for key, item in sorted(value.items()):
+                yield self.name, _labels(self.labelnames, key if isinstance(key, tuple) else (key,)), item
+        elif value is not None:
+            yield self.name, '', value
+
+
+class MetricsRegistry:
+    def __init__(self, prefix='medihost_'):
+        self.prefix = prefix
+        self._metrics = []
+
+    def _add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help_text, labelnames=()):
+        return self._add(Counter(self.prefix + name, help_text, labelnames))
+
+    def histogram(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._add(Histogram(self.prefix + name, help_text, labelnames, buckets))
+
+    def gauge(self, name, help_text, callback, labelnames=()):
+        return self._add(Gauge(self.prefix + name, help_text, callback, labelnames))
+
+    def render(self):
+        """Every metric in the Prometheus text exposition format"""
+        lines = []
+        for metric in self._metrics:
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            for name, labels, value in metric.samples():
+                lines.append(f'{name}{labels} {_number(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+class RequestStats:
+    """Time and query counts accumulated by the thread serving one request"""
+
+    __slots__ = ('upstream_seconds', 'db_seconds', 'db_queries')
+
+    def __init__(self):
+        self.upstream_seconds = 0.0
+        self.db_seconds = 0.0
+        self.db_queries = 0
+
+
+def current_request():
+    return getattr(_local, 'stats', None)
+
+
+class Metrics:
+    """The app's metric set plus the hooks that feed it"""
+
+    def __init__(self, slow_threshold=0.0):
+        self.slow_threshold = slow_threshold
+        self.registry = MetricsRegistry()
+        registry = self.registry
+        self.requests = registry.histogram(
+            'http_request_duration_seconds', 'Time from request start until the body is sent',
+            ('method', 'route', 'status'))
+        self.upstream = registry.histogram(
+            'http_request_upstream_seconds', 'Time per request spent waiting on the Overpass API', ('route',))
+        self.db = registry.histogram(
+            'http_request_db_seconds', 'Time per request spent in database queries', ('route',))
+        self.local = registry.histogram(
+            'http_request_local_seconds', 'Time per request spent outside upstream calls and queries', ('route',))
+        self.db_queries = registry.histogram(
+            'http_request_db_queries', 'Database queries issued per request', ('route',), COUNT_BUCKETS)
+        self.sizes = registry.histogram(
+            'http_response_size_bytes', 'Response body size', ('route',), SIZE_BUCKETS)
+        self.query_duration = registry.histogram(
+            'db_query_duration_seconds', 'Duration of individual database queries', ('operation',))
+        self.overpass_calls = registry.histogram(
+            'overpass_call_duration_seconds', 'Overpass client calls including retries and parsing', ('outcome',))
+        self.slow_requests = registry.counter(
+            'http_slow_requests_total', 'Requests slower than the slow-request threshold', ('route',))
+
+    def watch_engine(self, engine):
+        """Count and time every statement executed on a SQLAlchemy engine"""
+        @event.listens_for(engine, 'before_cursor_execute')
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            conn.info.setdefault('metrics_started', []).append(time.perf_counter())
+
+        @event.listens_for(engine, 'after_cursor_execute')
+        def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            started = conn.info['metrics_started'].pop()
+            elapsed = time.perf_counter() - started
+            operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else 'OTHER'
+            self.query_duration.observe(elapsed, operation=operation)
+            stats = current_request()
+            if stats is not None:
+                stats.db_seconds += elapsed
+                stats.db_queries += 1
+
+        @event.listens_for(engine, 'handle_error')
+        def handle_error(context):
+            # The after hook never runs for a failed statement
+            started = context.connection.info.get('metrics_started') if context.connection is not None else None
+            if started:
+                started.pop()
+
+    @contextmanager
+    def track_upstream(self):
+        """Attribute the enclosed block to upstream (Overpass) time"""
+        started = time.perf_counter()
+        outcome = 'error'
+        try:
+            yield
+            outcome = 'ok'
+        finally:
+            elapsed = time.perf_counter() - started
+            self.overpass_calls.observe(elapsed, outcome=outcome)
+            stats = current_request()
+            if stats is not None:
+                stats.upstream_seconds += elapsed
+
+    @contextmanager
+    def upstream_wait(self):
+        """Attribute time spent waiting on an upstream call made by another thread"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            stats = current_request()
+            if stats is not None:
+                stats.upstream_seconds += time.perf_counter() - started
+
+    def record(self, method, route, status, elapsed, size, stats):
+        self.requests.observe(elapsed, method=method, route=route, status=status)
+        self.sizes.observe(size, route=route)
+        self.upstream.observe(stats.upstream_seconds, route=route)
+        self.db.observe(stats.db_seconds, route=route)
+        self.local.observe(max(0.0, elapsed - stats.upstream_seconds - stats.db_seconds), route=route)
+        self.db_queries.observe(stats.db_queries, route=route)
+        if self.slow_threshold and elapsed >= self.slow_threshold:
+            self.slow_requests.inc(route=route)
+            logger.warning(
+                'Slow request %s %s -> %s in %.3fs (upstream %.3fs, db %.3fs over %d queries, %d bytes)',
+                method, route, status, elapsed, stats.upstream_seconds, stats.db_seconds, stats.db_queries, size
+            )
+
+
+class MetricsMiddleware:
+    """WSGI middleware timing each request through the last byte of its body"""
+
+    ROUTE_KEY = 'metrics.route'
+
+    def __init__(self, wsgi_app, metrics):
+        self.wsgi_app = wsgi_app
+        self.metrics = metrics
+
+    def __call__(self, environ, start_response):
+        started = time.perf_counter()
+        stats = RequestStats()
+        previous = current_request()
+        _local.stats = stats
+        status = []
+
+        def capture(status_line, headers, exc_info=None):
+            status.append(status_line.split(' ', 1)[0])
+            return start_response(status_line, headers, exc_info)
+
+        try:
+            body = self.wsgi_app(environ, capture)
+        except BaseException:
+            _local.stats = previous
+            raise
+        return self._iterate(body, environ, started, stats, status, previous)
+
+    def _iterate(self, body, environ, started, stats, status, previous):
+        size = 0
+        _local.stats = stats
+        try:
+            for chunk in body:
+                size += len(chunk)
+                yield chunk
+        finally:
+            if hasattr(body, 'close'):
+                body.close()
+            elapsed = time.perf_counter() - started
+            _local.stats = previous
+            self.metrics.record(
+                environ.get('REQUEST_METHOD', ''),
+                environ.get(self.ROUTE_KEY) or 'unmatched',
+                status[0] if status else '500',
+                elapsed, size, stats
+            )
@@ -0,0 +1,343 @@
+"""
+Background dispatch of SMS, email and push notifications
+
+Messages are written to an outbox table in the same transaction as the
+record that triggers them, so the request only pays for one local commit.
+A dispatcher thread claims due rows in batches, hands each provider's batch
+to a worker pool under a per-provider rate limit, and records the outcome:
+sent, retried later with exponential backoff, or dead-lettered once
+max_attempts is reached.
+
+Provider SDKs (twilio, sendgrid, firebase-admin) are optional and imported
+only when their provider is first used. Fake providers record messages in
+memory for local development.
+"""
+import logging
+import threading
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from ratelimit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+STATUS_PENDING = 'pending'
+STATUS_SENDING = 'sending'
+STATUS_SENT = 'sent'
+STATUS_DEAD = 'dead'
+
+
+class NotificationProvider(ABC):
+    """Delivers messages for one channel; subclasses implement send()"""
+
+    channel = None
+
+    def __init__(self, rate_per_second=1.0):
+        self.bucket = TokenBucket(rate_per_second)
+
+    @abstractmethod
+    def send(self, message):
+        """Deliver one outbox message, raising on failure"""
+
+    def send_batch(self, messages):
+        """Send messages, returning an error string (or None) for each"""
+        results = []
+        for message in messages:
+            self.bucket.acquire()
+            try:
+                self.send(message)
+                results.append(None)
+            except Exception as e:
+                results.append(str(e) or e.__class__.__name__)
+        return results
+
+
+class TwilioProvider(NotificationProvider):
+    channel = 'sms'
+
+    def __init__(self, account_sid, auth_token, from_number, rate_per_second=1.0):
+        super().__init__(rate_per_second)
+        self.account_sid = account_sid
+        self.auth_token = auth_token
+        self.from_number = from_number
+        self._client = None
+
+    def send(self, message):
+        if self._client is None:
+            from twilio.rest import Client
+            self._client = Client(self.account_sid, self.auth_token)
+        self._client.messages.create(to=message.recipient, from_=self.from_number, body=message.body)
+
+
+class SendGridProvider(NotificationProvider):
+    channel = 'email'
+
+    def __init__(self, api_key, from_email, rate_per_second=10.0):
+        super().__init__(rate_per_second)
+        self.api_key = api_key
+        self.from_email = from_email
+        self._client = None
+
+    def send(self, message):
+        from sendgrid.helpers.mail import Mail
+        if self._client is None:
+            from sendgrid import SendGridAPIClient
+            self._client = SendGridAPIClient(self.api_key)
+        mail = Mail(
+            from_email=self.from_email,
+            to_emails=message.recipient,
+            subject=message.subject,
+            plain_text_content=message.body
+        )
+        response = self._client.send(mail)
+        if response.status_code >= 300:
+            raise RuntimeError(f'SendGrid returned {response.status_code}')
+
+
+class FirebaseProvider(NotificationProvider):
+    channel = 'push'
+
+    def __init__(self, project_id, rate_per_second=50.0):
+        super().__init__(rate_per_second)
+        self.project_id = project_id
+        self._app = None
+
+    def _messaging(self):
+        import firebase_admin
+        from firebase_admin import messaging
+        if self._app is None:
+            self._app = firebase_admin.initialize_app(options={'projectId': self.project_id}, name='notifications')
+        return messaging
+
+    def send(self, message):
+        error = self.send_batch([message])[0]
+        if error is not None:
+            raise RuntimeError(error)
+
+    def send_batch(self, messages):
+        """Send with send_each in chunks no larger than the bucket, taking one token per message"""
+        messaging = self._messaging()
+        chunk_size = int(self.bucket.capacity)
+        errors = []
+        for start in range(0, len(messages), chunk_size):
+            chunk = messages[start:start + chunk_size]
+            self.bucket.acquire(len(chunk))
+            batch = [
+                messaging.Message(
+                    topic=message.recipient,
+                    notification=messaging.Notification(title=message.subject, body=message.body)
+                )
+                for message in chunk
+            ]
+            response = messaging.send_each(batch, app=self._app)
+            errors.extend(None if result.success else str(result.exception) for result in response.responses)
+        return errors
+
+
+class FakeProvider(NotificationProvider):
+    """Records messages instead of sending them"""
+
+    def __init__(self, channel, rate_per_second=100.0):
+        super().__init__(rate_per_second)
+        self.channel = channel
+        self.sent = []
+
+    def send(self, message):
+        self.sent.append((message.recipient, message.subject, message.body))
+        logger.info('[fake %s] to=%s subject=%s', self.channel, message.recipient, message.subject)
+
+
+def create_providers(config):
+    """Build the enabled providers keyed by channel"""
+    if config.get('NOTIFICATIONS_FAKE', False):
+        return {channel: FakeProvider(channel) for channel in ('sms', 'email', 'push')}
+
+    providers = {}
+    if config.get('TWILIO_ENABLED'):
+        providers['sms'] = TwilioProvider(
+            config.get('TWILIO_ACCOUNT_SID'),
+            config.get('TWILIO_AUTH_TOKEN'),
+            config.get('TWILIO_PHONE_NUMBER'),
+            rate_per_second=config.get('TWILIO_RATE_LIMIT', 1.0)
+        )
+    if config.get('SENDGRID_ENABLED'):
+        providers['email'] = SendGridProvider(
+            config.get('SENDGRID_API_KEY'),
+            config.get('SENDGRID_FROM_EMAIL'),
+            rate_per_second=config.get('SENDGRID_RATE_LIMIT', 10.0)
+        )
+    if config.get('FIREBASE_ENABLED'):
+        providers['push'] = FirebaseProvider(
+            config.get('FIREBASE_PROJECT_ID'),
+            rate_per_second=config.get('FIREBASE_RATE_LIMIT', 50.0)
+        )
+    return providers
+
+
+class NotificationDispatcher:
+    """
+    Polls the outbox and delivers due messages on a worker pool. Without
+    `threaded` there is no polling thread: wake() delivers the due messages
+    inline, and retries wait for the next wake.
+    """
+
+    def __init__(self, app, db, model, providers, workers=2, batch_size=20,
+                 max_attempts=5, poll_interval=5.0, lease_seconds=300, retry_base=30.0, prepare=None,
+                 threaded=True):
+        self.app = app
+        self.db = db
+        self.model = model
+        self.providers = providers
+        self.prepare = prepare  # optional callable run in the app context before each claim (schema setup)
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self.retry_base = retry_base
+        self.threaded = threaded
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='notify')
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def enqueue(self, channel, recipient, body, subject=None, alert_id=None):
+        """Add an outbox row to the current session; the caller commits"""
+        if channel not in self.providers or not recipient:
+            return None
+        message = self.model(
+            channel=channel,
+            recipient=recipient,
+            subject=subject,
+            body=body,
+            alert_id=alert_id,
+            status=STATUS_PENDING,
+            next_attempt_at=datetime.utcnow()
+        )
+        self.db.session.add(message)
+        return message
+
+    def wake(self):
+        """Start the dispatcher if needed and poll the outbox immediately"""
+        if not self.threaded:
+            while self.dispatch_once() >= self.batch_size:
+                pass
+            return
+        self.start()
+        self._wake.set()
+
+    def start(self):
+        """Start polling the outbox, so messages left by a previous run are delivered; no-op without providers"""
+        if not self.providers or not self.threaded:
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name='notification-dispatcher', daemon=True)
+                self._thread.start()
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self._executor.shutdown(wait=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                while self.dispatch_once():
+                    if self._stop.is_set():
+                        return
+            except Exception:
+                logger.exception('Notification dispatch failed')
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+
+    def dispatch_once(self):
+        """Claim one batch of due messages, deliver it, and return the number claimed"""
+        if not self.providers:
+            return 0
+        with self.app.app_context():
+            if self.prepare is not None:
+                self.prepare()
+            claimed = self._claim()
+            by_channel = {}
+            for row_id, channel in claimed:
+                by_channel.setdefault(channel, []).append(row_id)
+
+            futures = [
+                self._executor.submit(self._deliver, channel, ids)
+                for channel, ids in by_channel.items()
+            ]
+        for future in futures:
+            future.result()
+        return len(claimed)
+
+    def _claim(self):
+        """Lease due rows with a conditional update so concurrent dispatchers never share one"""
+        model = self.model
+        session = self.db.session
+        now = datetime.utcnow()
+        candidates = (session.query(model.id, model.channel)
+                      .filter(model.status.in_((STATUS_PENDING, STATUS_SENDING)),
+                              model.next_attempt_at <= now,
+                              model.channel.in_(list(self.providers)))
+                      .order_by(model.next_attempt_at)
+                      .limit(self.batch_size)
+                      .all())
+        lease_until = now + timedelta(seconds=self.lease_seconds)
+        claimed = []
+        for row_id, channel in candidates:
+            updated = (session.query(model)
+                       .filter(model.id == row_id, model.next_attempt_at <= now)
+                       .update({'status': STATUS_SENDING, 'next_attempt_at': lease_until},
+                               synchronize_session=False))
+            if updated:
+                claimed.append((row_id, channel))
+        session.commit()
+        return claimed
+
+    def _deliver(self, channel, ids):
+        with self.app.app_context():
+            session = self.db.session
+            messages = session.query(self.model).filter(self.model.id.in_(ids)).all()
+            try:
+                errors = self.providers[channel].send_batch(messages)
+            except Exception as e:
+                errors = [str(e) or e.__class__.__name__] * len(messages)
+
+            now = datetime.utcnow()
+            for message, error in zip(messages, errors):
+                message.attempts = (message.attempts or 0) + 1
+                if error is None:
+                    message.status = STATUS_SENT
+                    message.sent_at = now
+                    message.last_error = None
+                elif message.attempts >= self.max_attempts:
+                    message.status = STATUS_DEAD
+                    message.last_error = error[:500]
+                    logger.error('Notification %s dead-lettered after %s attempts: %s',
+                                 message.id, message.attempts, error)
+                else:
+                    message.status = STATUS_PENDING
+                    message.last_error = error[:500]
+                    delay = self.retry_base * (2 ** (message.attempts - 1))
+                    message.next_attempt_at = now + timedelta(seconds=delay)
+            session.commit()
+
+
+def create_dispatcher(app, db, model, prepare=None):
+    """Build the notification dispatcher from Flask config values"""
+    config = app.config
+    return NotificationDispatcher(
+        app, db, model, create_providers(config),
+        workers=config.get('NOTIFICATION_WORKERS', 2),
+        batch_size=config.get('NOTIFICATION_BATCH_SIZE', 20),
+        max_attempts=config.get('NOTIFICATION_MAX_ATTEMPTS', 5),
+        poll_interval=config.get('NOTIFICATION_POLL_INTERVAL', 5.0),
+        prepare=prepare,
+        threaded=config.get('BACKGROUND_THREADS', True)
+    )
@@ -0,0 +1,183 @@
+"""
+Minimal parser for OSM opening_hours values
+
+Understands the common subset of the format: '24/7', and rules separated by
+';' made of an optional weekday selector ('Mo-Fr', 'Sa,Su', 'Fr-Mo') and
+comma-separated time spans ('08:00-12:00,13:00-18:00', '22:00-06:00' runs
+past midnight) or 'off'. A later rule replaces earlier ones on the days it
+names, as in OSM. Anything else (public holidays, months, comments) raises
+OpeningHoursError, so callers can treat the value as unknown.
+
+For filtering, a value is compiled once into a weekly bitmap with one bit
+per 5-minute step (252 bytes), so checking whether a facility is open at a
+given time is a single byte lookup. ScheduleCache keeps the compiled bitmap
+of each facility and recompiles it when the facility's value changes.
+"""
+import re
+import threading
+from collections import OrderedDict
+
+DAYS = ('Mo', 'Tu', 'We', 'Th', 'Fr', 'Sa', 'Su')
+MINUTES_PER_DAY = 24 * 60
+MINUTES_PER_WEEK = 7 * MINUTES_PER_DAY
+RESOLUTION_MINUTES = 5
+STEPS_PER_WEEK = MINUTES_PER_WEEK // RESOLUTION_MINUTES
+ALWAYS_OPEN = b'\xff' * (STEPS_PER_WEEK // 8)
+
+_SPAN = re.compile(r'^(\d{1,2}):(\d{2})-(\d{1,2}):(\d{2})$')
+_DAY_SELECTOR = re.compile(r'^(Mo|Tu|We|Th|Fr|Sa|Su)(-(Mo|Tu|We|Th|Fr|Sa|Su))?$')
+
+
+class OpeningHoursError(ValueError):
+    """Raised for opening_hours values outside the supported subset"""
+
+
+def _parse_days(selector):
+    days = []
+    for part in selector.split(','):
+        match = _DAY_SELECTOR.match(part.strip())
+        if match is None:
+            raise OpeningHoursError(f'Unsupported day selector: {part!r}')
+        first = DAYS.index(match.group(1))
+        last = DAYS.index(match.group(3)) if match.group(3) else first
+        # Ranges may wrap around the week, e.g. Fr-Mo
+        days.extend((first + offset) % 7 for offset in range((last - first) % 7 + 1))
+    return days
+
+
+def _parse_spans(text):
+    spans = []
+    for part in text.split(','):
+        match = _SPAN.match(part.strip())
+        if match is None:
+            raise OpeningHoursError(f'Unsupported time span: {part!r}')
+        start = int(match.group(1)) * 60 + int(match.group(2))
+        end = int(match.group(3)) * 60 + int(match.group(4))
+        if start >= MINUTES_PER_DAY or end > MINUTES_PER_DAY or int(match.group(2)) > 59 or int(match.group(4)) > 59:
+            raise OpeningHoursError(f'Invalid time span: {part!r}')
+        spans.append((start, end))
+    return spans
+
+
+def parse(value):
+    """
+    Return the weekly schedule of an opening_hours value as a sorted list of
+    (start, end) minute offsets from Monday 00:00, end exclusive.
+    """
+    value = (value or '').strip()
+    if not value:
+        raise OpeningHoursError('Empty opening_hours')
+    if value == '24/7':
+        return [(0, MINUTES_PER_WEEK)]
+
+    per_day = {}
+    for rule in value.split(';'):
+        rule = rule.strip()
+        if not rule:
+            continue
+        selector, _, times = rule.partition(' ')
+        if _DAY_SELECTOR.match(selector.split(',')[0]):
+            days = _parse_days(selector)
+            times = times.strip()
+        else:
+            days = list(range(7))
+            times = rule
+        if times in ('off', 'closed'):
+            spans = []
+        elif times == '24/7':
+            spans = [(0, MINUTES_PER_DAY)]
+        else:
+            spans = _parse_spans(times)
+        for day in days:
+            per_day[day] = spans
+
+    intervals = []
+    for day, spans in per_day.items():
+        base = day * MINUTES_PER_DAY
+        for start, end in spans:
+            if end > start:
+                intervals.append((base + start, base + end))
+            else:
+                # Past midnight: the span ends on the next day, wrapping Sunday into Monday
+                intervals.append((base + start, base + MINUTES_PER_DAY))
+                if end:
+                    next_day = (base + MINUTES_PER_DAY) % MINUTES_PER_WEEK
+                    intervals.append((next_day, next_day + end))
+    return _merge(intervals)
+
+
+def _merge(intervals):
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def compile_schedule(value):
+    """
+    Compile an opening_hours value into its weekly bitmap, or None if it
+    cannot be parsed. A step counts as open if any part of it is.
+    """
+    try:
+        intervals = parse(value)
+    except OpeningHoursError:
+        return None
+    bitmap = bytearray(STEPS_PER_WEEK // 8)
+    for start, end in intervals:
+        for step in range(start // RESOLUTION_MINUTES, -(-end // RESOLUTION_MINUTES)):
+            bitmap[step >> 3] |= 1 << (step & 7)
+    return bytes(bitmap)
+
+
+def minute_of_week(moment):
+    """Minutes since Monday 00:00 of a datetime's week, in its own wall-clock time"""
+    return moment.weekday() * MINUTES_PER_DAY + moment.hour * 60 + moment.minute
+
+
+def is_open(bitmap, minute):
+    """True if a compiled schedule is open at a minute of the week; unknown schedules are not"""
+    if bitmap is None:
+        return False
+    step = minute // RESOLUTION_MINUTES
+    return bool(bitmap[step >> 3] >> (step & 7) & 1)
+
+
+class ScheduleCache:
+    """Compiled schedules per facility id, least recently used evicted past max_entries"""
+
+    def __init__(self, max_entries=50000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # facility id -> (opening_hours value, bitmap)
+        self._lock = threading.Lock()
+        self.compiled = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, facility_id, value):
+        """The bitmap for a facility's current opening_hours value, compiling it on first use or change"""
+        with self._lock:
+            entry = self._entries.get(facility_id)
+            if entry is not None and entry[0] == value:
+                self._entries.move_to_end(facility_id)
+                return entry[1]
+        bitmap = compile_schedule(value)
+        with self._lock:
+            self.compiled += 1
+            self._entries[facility_id] = (value, bitmap)
+            self._entries.move_to_end(facility_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return bitmap
+
+    def invalidate(self, facility_ids):
+        with self._lock:
+            for facility_id in facility_ids:
+                self._entries.pop(facility_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,307 @@
+"""
+Overpass API client, query building and element conversion
+
+The client keeps a pooled HTTP session, coalesces identical in-flight
+queries into a single upstream request, hedges slow requests onto the next
+fastest mirror, and retries with exponential backoff (honoring Retry-After
+on 429/503 responses). Every failure reaches the caller as an OverpassError
+subclass, never as a requests exception. requests is imported when the first query is made,
+so importing this module stays cheap for processes that never call out.
+"""
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+
+from streaming import CHUNK_SIZE, iter_json_array
+
+# Tag values that mark an OSM element as a medical facility
+AMENITY_TYPES = ('hospital', 'clinic', 'pharmacy', 'doctors', 'dentist')
+HEALTHCARE_TYPES = ('hospital', 'clinic', 'doctor', 'dentist', 'pharmacy')
+
+
+class OverpassError(Exception):
+    """Raised when the Overpass API returns an unusable response"""
+
+
+class OverpassTimeout(OverpassError):
+    """Raised when every attempt against every mirror timed out"""
+
+
+class OverpassUnavailable(OverpassError):
+    """Raised when no mirror could be reached (connection refused, reset, DNS failure)"""
+
+
+class OverpassRateLimited(OverpassError):
+    """Raised when a mirror answers 429 or 503"""
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def _value_pattern(values):
+    return '^(' + '|'.join(sorted(set(values))) + ')$'
+
+
+def build_overpass_query(lat, lon, radius, timeout=None):
+    """
+    Build the Overpass QL query for medical facilities around a point.
+
+    A single around() filter on nodes, ways and relations with a regex over
+    both tag keys replaces one spatial scan per key/value/type combination,
+    and only tags plus a center point are requested (no way node lists).
+    Values valid for only one of the keys are dropped again by is_facility().
+    """
+    header = '[out:json]'
+    if timeout:
+        header += f'[timeout:{int(timeout)}]'
+    values = _value_pattern(AMENITY_TYPES + HEALTHCARE_TYPES)
+    return (
+        f'{header};'
+        f'nwr[~"^(amenity|healthcare)$"~"{values}"](around:{radius},{lat},{lon});'
+        'out tags center qt;'
+    )
+
+
+def element_to_facility(element):
+    """Convert an Overpass element into a facility dict, or None if it has no location"""
+    # Get coordinates
+    if 'lat' in element and 'lon' in element:
+        facility_lat = element['lat']
+        facility_lon = element['lon']
+    elif 'center' in element:
+        facility_lat = element['center']['lat']
+        facility_lon = element['center']['lon']
+    else:
+        return None
+
+    tags = element.get('tags', {})
+
+    # Determine facility type from tags
+    facility_type = tags.get('amenity') or tags.get('healthcare') or 'unknown'
+
+    return {
+        'id': element['id'],
+        'name': tags.get('name', 'Unnamed Facility'),
+        'type': facility_type,
+        'latitude': facility_lat,
+        'longitude': facility_lon,
+        'address': tags.get('addr:street', '') + ' ' + tags.get('addr:housenumber', ''),
+        'phone': tags.get('phone', tags.get('contact:phone', 'N/A')),
+        'opening_hours': tags.get('opening_hours', 'N/A'),
+        'website': tags.get('website', tags.get('contact:website', ''))
+    }
+
+
+def is_facility(tags):
+    """Return True if an element's tags mark it as a medical facility"""
+    return tags.get('amenity') in AMENITY_TYPES or tags.get('healthcare') in HEALTHCARE_TYPES
+
+
+def parse_facilities(response):
+    """Stream an Overpass HTTP response into facility dicts without buffering the body"""
+    return elements_to_facilities(iter_json_array(response.iter_content(CHUNK_SIZE), 'elements'))
+
+
+def elements_to_facilities(elements):
+    """Convert Overpass elements to facilities, dropping non-facilities and duplicate OSM ids"""
+    seen = set()
+    facilities = []
+    for element in elements:
+        key = (element.get('type'), element.get('id'))
+        if key in seen or not is_facility(element.get('tags', {})):
+            continue
+        facility = element_to_facility(element)
+        if facility is not None:
+            seen.add(key)
+            facilities.append(facility)
+    return facilities
+
+
+def _retry_after(response):
+    value = response.headers.get('Retry-After')
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        return None
+
+
+class OverpassClient:
+    """Pooled, coalescing, hedging client for one or more Overpass mirrors"""
+
+    def __init__(self, urls, timeout=30, hedge_delay=2.0, max_retries=2,
+                 backoff_base=0.5, max_backoff=10.0, pool_size=10):
+        self.urls = list(urls)
+        self.timeout = timeout
+        self.hedge_delay = hedge_delay
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.max_backoff = max_backoff
+        self.pool_size = pool_size
+        self._session = None
+
+        self._executor = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix='overpass')
+        self._latency = {url: None for url in self.urls}
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self.coalesced = 0
+
+    @property
+    def session(self):
+        """The pooled HTTP session, created on first use"""
+        if self._session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+            with self._lock:
+                if self._session is None:
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=len(self.urls), pool_maxsize=self.pool_size)
+                    session.mount('http://', adapter)
+                    session.mount('https://', adapter)
+                    self._session = session
+        return self._session
+
+    def query(self, query, parse=None):
+        """
+        Run an Overpass QL query. Without `parse` the decoded JSON response is
+        returned; otherwise the body is streamed and parse(response) is returned.
+        """
+        key = (query, parse)
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            return future.result()
+
+        try:
+            result = self._query_with_retries(query, parse)
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def mirrors(self):
+        """Mirrors ordered fastest first; unmeasured mirrors are tried early"""
+        with self._lock:
+            latency = dict(self._latency)
+        return sorted(self.urls, key=lambda url: latency[url] if latency[url] is not None else 0.0)
+
+    def stats(self):
+        """Coalesced request count and smoothed latency (seconds) per mirror"""
+        with self._lock:
+            return {'coalesced': self.coalesced, 'latency': dict(self._latency)}
+
+    def _record_latency(self, url, seconds):
+        with self._lock:
+            previous = self._latency[url]
+            self._latency[url] = seconds if previous is None else 0.7 * previous + 0.3 * seconds
+
+    def _query_with_retries(self, query, parse):
+        attempt = 0
+        while True:
+            try:
+                return self._hedged(query, parse)
+            except OverpassRateLimited as e:
+                if attempt >= self.max_retries:
+                    raise
+                delay = e.retry_after if e.retry_after is not None else self._backoff(attempt)
+            except (OverpassTimeout, OverpassUnavailable):
+                if attempt >= self.max_retries:
+                    raise
+                delay = self._backoff(attempt)
+            time.sleep(min(delay, self.max_backoff))
+            attempt += 1
+
+    def _backoff(self, attempt):
+        base = self.backoff_base * (2 ** attempt)
+        return base + random.uniform(0, base / 2)
+
+    def _hedged(self, query, parse):
+        """Send to the fastest mirror, adding the next one each time hedge_delay passes"""
+        pending = set()
+        errors = []
+        for url in self.mirrors():
+            pending.add(self._executor.submit(self._post, url, query, parse))
+            result = self._first_success(pending, errors, self.hedge_delay)
+            if result is not None:
+                return result
+
+        while pending:
+            result = self._first_success(pending, errors, None)
+            if result is not None:
+                return result
+
+        rate_limited = [e for e in errors if isinstance(e, OverpassRateLimited)]
+        if rate_limited:
+            retry_after = max((e.retry_after or 0.0) for e in rate_limited) or None
+            raise OverpassRateLimited('Overpass API rate limit reached', retry_after)
+        if errors and all(isinstance(e, OverpassTimeout) for e in errors):
+            raise OverpassTimeout('Request to Overpass API timed out')
+        if errors and all(isinstance(e, OverpassUnavailable) for e in errors):
+            raise OverpassUnavailable(f'Could not connect to Overpass API: {errors[0]}')
+        raise OverpassError('Failed to fetch data from Overpass API')
+
+    def _first_success(self, pending, errors, timeout):
+        """Wait for the next completed request; return its result or None"""
+        done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+        for future in done:
+            pending.discard(future)
+            try:
+                return future.result()
+            except Exception as e:
+                errors.append(e)
+        return None
+
+    def _post(self, url, query, parse):
+        import requests
+        started = time.perf_counter()
+        try:
+            response = self.session.post(url, data={'data': query}, timeout=self.timeout, stream=parse is not None)
+        except requests.Timeout:
+            self._record_latency(url, self.timeout)
+            raise OverpassTimeout(f'{url} timed out')
+        except requests.RequestException as e:
+            # Connection refused or reset, DNS, TLS: callers only ever see OverpassError
+            self._record_latency(url, self.timeout)
+            raise OverpassUnavailable(f'{url} unreachable: {e.__class__.__name__}') from e
+        self._record_latency(url, time.perf_counter() - started)
+
+        try:
+            if response.status_code in (429, 503):
+                raise OverpassRateLimited(f'{url} returned {response.status_code}', _retry_after(response))
+            if response.status_code != 200:
+                raise OverpassError(f'{url} returned {response.status_code}')
+            return parse(response) if parse is not None else response.json()
+        except requests.Timeout:
+            raise OverpassTimeout(f'{url} timed out')
+        except requests.RequestException as e:
+            # The connection dropped while the body was streaming
+            raise OverpassUnavailable(f'{url} unreachable: {e.__class__.__name__}') from e
+        except ValueError:
+            raise OverpassError(f'{url} returned invalid JSON')
+        finally:
+            response.close()
+
+
+def create_overpass_client(config):
+    """Build the Overpass client from Flask config values"""
+    urls = [config.get('OVERPASS_API_URL', 'http://overpass-api.de/api/interpreter')]
+    urls += [url for url in config.get('OVERPASS_MIRRORS', []) if url not in urls]
+    return OverpassClient(
+        urls,
+        timeout=config.get('OVERPASS_TIMEOUT', 30),
+        hedge_delay=config.get('OVERPASS_HEDGE_DELAY', 2.0),
+        max_retries=config.get('OVERPASS_MAX_RETRIES', 2),
+        max_backoff=config.get('OVERPASS_MAX_BACKOFF', 10.0),
+        pool_size=config.get('OVERPASS_POOL_SIZE', 10)
+    )
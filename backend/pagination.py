@@ -0,0 +1,92 @@
+"""
+Keyset pagination and conditional GET helpers for admin listings
+
+Pages are ordered by (created_at, id) descending and the cursor is the
+position of the last row returned, so each page is a single range scan on
+the (created_at, id) index no matter how deep the client pages.
+"""
+import base64
+import hashlib
+from datetime import datetime
+
+
+class PaginationError(ValueError):
+    """Raised for malformed pagination or filter parameters"""
+
+
+def encode_cursor(created_at, row_id):
+    raw = f'{created_at.isoformat()}|{row_id}'.encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        created_at, row_id = base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8').split('|')
+        return datetime.fromisoformat(created_at), int(row_id)
+    except (TypeError, ValueError, UnicodeError):
+        raise PaginationError('Invalid cursor')
+
+
+def parse_datetime(value, name):
+    if value is None:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        raise PaginationError(f'{name} must be an ISO 8601 date or datetime')
+    # Stored timestamps are naive UTC
+    if parsed.tzinfo is not None:
+        parsed = (parsed - parsed.utcoffset()).replace(tzinfo=None)
+    return parsed
+
+
+def parse_limit(value, default, maximum):
+    if value is None:
+        return default
+    try:
+        limit = int(value)
+    except ValueError:
+        raise PaginationError('limit must be a positive integer')
+    if limit < 1:
+        raise PaginationError('limit must be a positive integer')
+    return min(limit, maximum)
+
+
+def keyset_page(query, model, args, default_limit=100, max_limit=1000):
+    """
+    Apply since/until/cursor/limit request args to a query and return
+    (rows, next_cursor), newest first.
+    """
+    since = parse_datetime(args.get('since'), 'since')
+    until = parse_datetime(args.get('until'), 'until')
+    limit = parse_limit(args.get('limit'), default_limit, max_limit)
+    cursor = args.get('cursor')
+
+    if since is not None:
+        query = query.filter(model.created_at >= since)
+    if until is not None:
+        query = query.filter(model.created_at < until)
+    if cursor:
+        created_at, row_id = decode_cursor(cursor)
+        query = query.filter(
+            (model.created_at < created_at)
+            | ((model.created_at == created_at) & (model.id < row_id))
+        )
+
+    rows = query.order_by(model.created_at.desc(), model.id.desc()).limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].created_at, rows[-1].id)
+    return rows, next_cursor
+
+
+def listing_etag(path, args, version, latest_id):
+    """
+    Weak validator for an append-only listing: request args plus the newest
+    row id, and a change counter for inserts whose ids can land below it
+    (write-behind id blocks)
+    """
+    key = path + '?' + '&'.join(f'{k}={v}' for k, v in sorted(args.items(multi=True))) + f'#{version}:{latest_id}'
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
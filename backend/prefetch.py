@@ -0,0 +1,381 @@
+"""
+Precomputed nearby-search tiles for warm starts
+
+A prefetch artifact holds the facilities for every TileCache tile covering a
+set of hot regions at the standard search radii. Each region is fetched from
+Overpass once (or read from an Overpass JSON dump), then sliced into tiles
+locally. Facilities are stored once as JSON and each tile is an array of
+facility indexes, so overlapping tiles share storage.
+
+At startup the artifact is memory-mapped and attached to the tile cache as a
+read-only layer: only the small header is parsed, and tile pages are read
+from disk on first use. The first search after a cold start then costs one
+local lookup instead of an Overpass round trip.
+
+Hot regions come from a JSON file, from the command line, or from access
+logs (the most requested /api/nearby tiles).
+
+Usage:
+    python prefetch.py build --regions regions.json -o nearby_tiles.pfx
+    python prefetch.py build --region "New York,40.7128,-74.0060,10" --radii 5000,10000
+    python prefetch.py build --from-log access.log --top 200 -o nearby_tiles.pfx
+    python prefetch.py build --regions regions.json --overpass-json dump.json
+    python prefetch.py info nearby_tiles.pfx
+"""
+import argparse
+import json
+import logging
+import mmap
+import os
+import re
+import struct
+import sys
+import time
+from array import array
+from collections import Counter
+from urllib.parse import parse_qs
+
+from cache import create_tile_cache
+from geo import bounding_box, geohash_bounds, haversine_m
+from spatial import GridIndex
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'MEDITILE1\n'
+DEFAULT_RADII = (10000,)
+NEARBY_LOG_PATTERN = re.compile(r'/api/nearby\?([^\s"]+)')
+
+
+class PrefetchError(Exception):
+    """Raised when a prefetch artifact cannot be built or read"""
+
+
+def _encode(facility):
+    return json.dumps(facility, separators=(',', ':')).encode('utf-8')
+
+
+class TileArtifact:
+    """Read-only, memory-mapped tile store keyed like TileCache tiles"""
+
+    def __init__(self, header, offsets, indexes, blob, mapping=None):
+        self.created_at = header['created_at']
+        self.radius_buckets = header['radius_buckets']
+        self.regions = header.get('regions', [])
+        self._tiles = {key: (start, count) for key, start, count in header['tiles']}
+        self._offsets = offsets
+        self._indexes = indexes
+        self._blob = blob
+        self._mapping = mapping
+
+    def __len__(self):
+        return len(self._tiles)
+
+    def __contains__(self, key):
+        return key in self._tiles
+
+    @property
+    def facility_count(self):
+        return len(self._offsets) - 1
+
+    def age(self):
+        return time.time() - self.created_at
+
+    def get(self, key):
+        """Return the facility list for a tile key, or None if the tile was not prefetched"""
+        entry = self._tiles.get(key)
+        if entry is None:
+            return None
+        start, count = entry
+        offsets = self._offsets
+        blob = self._blob
+        parts = [blob[offsets[i]:offsets[i + 1]] for i in self._indexes[start:start + count]]
+        return json.loads(b'[' + b','.join(parts) + b']')
+
+    def close(self):
+        if self._mapping is not None:
+            self._offsets = self._indexes = self._blob = None
+            self._mapping.close()
+            self._mapping = None
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as f:
+            mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            if mapping[:len(MAGIC)] != MAGIC:
+                raise PrefetchError(f'{path} is not a prefetch artifact')
+            position = len(MAGIC)
+            header_length = struct.unpack_from('<I', mapping, position)[0]
+            position += 4
+            header = json.loads(mapping[position:position + header_length])
+            data = header['data_start']
+            view = memoryview(mapping)
+            sections = header['sections']
+            offsets = view[data + sections['offsets'][0]:data + sections['offsets'][1]].cast('Q')
+            indexes = view[data + sections['indexes'][0]:data + sections['indexes'][1]].cast('I')
+            blob = view[data + sections['blob'][0]:data + sections['blob'][1]]
+            if header['byteorder'] != sys.byteorder:
+                # Rare: copy and swap rather than map
+                offsets, indexes = array('Q', offsets), array('I', indexes)
+                offsets.byteswap()
+                indexes.byteswap()
+        except (KeyError, ValueError, struct.error) as e:
+            mapping.close()
+            raise PrefetchError(f'{path} is corrupt: {e}')
+        return cls(header, offsets, indexes, blob, mapping)
+
+
+class ArtifactBuilder:
+    """Collects tiles and their facilities, storing each distinct facility once"""
+
+    def __init__(self, radius_buckets):
+        self.radius_buckets = list(radius_buckets)
+        self.regions = []
+        self._facility_index = {}
+        self._facilities = []
+        self._tiles = {}
+
+    def add_tile(self, key, facilities):
+        indexes = array('I')
+        for facility in facilities:
+            encoded = _encode(facility)
+            index = self._facility_index.get(encoded)
+            if index is None:
+                index = self._facility_index[encoded] = len(self._facilities)
+                self._facilities.append(encoded)
+            indexes.append(index)
+        self._tiles[key] = indexes
+
+    def __len__(self):
+        return len(self._tiles)
+
+    def save(self, path):
+        offsets = array('Q', [0])
+        for encoded in self._facilities:
+            offsets.append(offsets[-1] + len(encoded))
+        indexes = array('I')
+        tiles = []
+        for key in sorted(self._tiles):
+            tile_indexes = self._tiles[key]
+            tiles.append([key, len(indexes), len(tile_indexes)])
+            indexes.extend(tile_indexes)
+
+        offsets_size = len(offsets) * offsets.itemsize
+        indexes_size = len(indexes) * indexes.itemsize
+        header = {
+            'created_at': time.time(),
+            'radius_buckets': self.radius_buckets,
+            'regions': self.regions,
+            'byteorder': sys.byteorder,
+            'tiles': tiles,
+            'sections': {
+                'offsets': [0, offsets_size],
+                'indexes': [offsets_size, offsets_size + indexes_size],
+                'blob': [offsets_size + indexes_size, offsets_size + indexes_size + offsets[-1]]
+            },
+            'data_start': 0
+        }
+        # data_start depends on the header length, which depends on data_start; pad it to a fixed width
+        header['data_start'] = 10 ** 12
+        header_length = len(json.dumps(header).encode('utf-8'))
+        data_start = len(MAGIC) + 4 + header_length
+        data_start += -data_start % 8
+        header['data_start'] = data_start
+        header_bytes = json.dumps(header).encode('utf-8').ljust(header_length)
+
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(MAGIC)
+            f.write(struct.pack('<I', len(header_bytes)))
+            f.write(header_bytes)
+            f.write(b'\0' * (data_start - f.tell()))
+            offsets.tofile(f)
+            indexes.tofile(f)
+            for encoded in self._facilities:
+                f.write(encoded)
+        os.replace(tmp_path, path)
+        return header
+
+
+def region_tiles(cache, lat, lon, radius_m, bucket):
+    """Every tile a search of `bucket` radius from inside the region circle maps onto"""
+    first = cache.tile_for(lat, lon, bucket)
+    tiles = {first.key: first}
+    if radius_m <= 0:
+        return tiles
+    # Sample at half the cell size so every cell touching the circle is visited
+    min_lat, min_lon, max_lat, max_lon = geohash_bounds(first.key.split(':')[0])
+    step_lat = (max_lat - min_lat) / 2
+    step_lon = (max_lon - min_lon) / 2
+    south, west, north, east = bounding_box(lat, lon, radius_m)
+    point_lat = south
+    while point_lat <= north:
+        point_lon = west
+        while point_lon <= east:
+            if haversine_m(lat, lon, point_lat, point_lon) <= radius_m:
+                tile = cache.tile_for(point_lat, point_lon, bucket)
+                tiles.setdefault(tile.key, tile)
+            point_lon += step_lon
+        point_lat += step_lat
+    return tiles
+
+
+def slice_tiles(builder, tiles, facilities):
+    """Add each tile with the facilities inside its fetch circle"""
+    index = GridIndex(0.05)
+    index.rebuild((n, facility['latitude'], facility['longitude']) for n, facility in enumerate(facilities))
+    for key, tile in tiles.items():
+        matches = index.query_radius(tile.center_lat, tile.center_lon, tile.fetch_radius)
+        builder.add_tile(key, [facilities[n] for n, _ in sorted(matches)])
+
+
+def learn_hot_tiles(cache, log_paths, top, default_radius=10000):
+    """Count /api/nearby requests per tile in access logs and return the `top` busiest tiles"""
+    counts = Counter()
+    tiles = {}
+    for path in log_paths:
+        with open(path, errors='replace') as f:
+            for line in f:
+                match = NEARBY_LOG_PATTERN.search(line)
+                if not match:
+                    continue
+                params = parse_qs(match.group(1))
+                try:
+                    lat = float(params['lat'][0])
+                    lon = float(params['lon'][0])
+                    radius = int(params.get('radius', [default_radius])[0])
+                except (KeyError, ValueError):
+                    continue
+                tile = cache.tile_for(lat, lon, radius)
+                counts[tile.key] += 1
+                tiles.setdefault(tile.key, tile)
+    return [(tiles[key], count) for key, count in counts.most_common(top)]
+
+
+def parse_region(value):
+    """Parse "name,lat,lon,radius_km" from the command line"""
+    try:
+        name, lat, lon, radius_km = value.rsplit(',', 3)
+        return {'name': name, 'lat': float(lat), 'lon': float(lon), 'radius_km': float(radius_km)}
+    except ValueError:
+        raise argparse.ArgumentTypeError('regions look like "New York,40.7128,-74.0060,10"')
+
+
+def load_config():
+    from config import Config
+    return {key: getattr(Config, key) for key in dir(Config) if key.isupper()}
+
+
+def build_artifact(config, regions, radii, output, overpass_json=None, hot_tiles=None):
+    """Fetch or read facilities for regions (and learned hot tiles) and write an artifact"""
+    cache = create_tile_cache(dict(config, NEARBY_CACHE_BACKEND='memory'))
+    builder = ArtifactBuilder(cache.radius_buckets)
+
+    if overpass_json:
+        from overpass import elements_to_facilities
+        from streaming import iter_json_array
+
+        with open(overpass_json, 'rb') as f:
+            dump = elements_to_facilities(iter_json_array(iter(lambda: f.read(1 << 16), b''), 'elements'))
+
+        def fetch(lat, lon, radius):
+            return [facility for facility in dump
+                    if haversine_m(lat, lon, facility['latitude'], facility['longitude']) <= radius]
+    else:
+        from overpass import build_overpass_query, create_overpass_client, parse_facilities
+        client = create_overpass_client(config)
+
+        def fetch(lat, lon, radius):
+            query = build_overpass_query(lat, lon, radius, timeout=config.get('OVERPASS_TIMEOUT', 30) * 4)
+            return client.query(query, parse=parse_facilities)
+
+    jobs = []
+    for region in regions:
+        radius_m = region['radius_km'] * 1000
+        for radius in radii:
+            tiles = region_tiles(cache, region['lat'], region['lon'], radius_m, cache.radius_bucket(radius))
+            jobs.append((region['name'], region['lat'], region['lon'], radius_m, tiles))
+        builder.regions.append(region)
+    covered = set().union(*(tiles for *_, tiles in jobs))
+    for tile, count in hot_tiles or []:
+        if tile.key in covered:
+            continue
+        jobs.append((f'{tile.key} ({count} requests)', tile.center_lat, tile.center_lon, 0, {tile.key: tile}))
+
+    for name, lat, lon, radius_m, tiles in jobs:
+        # One upstream query per job covers every tile's fetch circle
+        reach = radius_m + max(tile.fetch_radius + haversine_m(lat, lon, tile.center_lat, tile.center_lon) - radius_m
+                               for tile in tiles.values())
+        started = time.perf_counter()
+        facilities = fetch(lat, lon, max(reach, radius_m))
+        slice_tiles(builder, tiles, facilities)
+        print(f'  {name}: {len(tiles)} tiles, {len(facilities)} facilities '
+              f'({time.perf_counter() - started:.1f}s)')
+
+    builder.save(output)
+    return builder
+
+
+def load_prefetched_tiles(cache, config):
+    """Attach the configured prefetch artifact to the tile cache; returns it or None"""
+    path = config.get('NEARBY_PREFETCH_PATH', 'nearby_tiles.pfx')
+    if not path or not os.path.exists(path) or not cache.enabled:
+        return None
+    try:
+        artifact = TileArtifact.load(path)
+    except (OSError, PrefetchError) as e:
+        logger.warning('Ignoring prefetch artifact %s: %s', path, e)
+        return None
+    if list(artifact.radius_buckets) != list(cache.radius_buckets):
+        logger.warning('Ignoring prefetch artifact %s: built for radius buckets %s', path, artifact.radius_buckets)
+        artifact.close()
+        return None
+    cache.attach_prefetched(artifact, config.get('NEARBY_PREFETCH_MAX_AGE', 86400))
+    return artifact
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Build and inspect prefetched nearby-search tiles')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    build_parser = subparsers.add_parser('build', help='Prefetch tiles for hot regions')
+    build_parser.add_argument('--regions', help='JSON file: [{"name", "lat", "lon", "radius_km"}, ...]')
+    build_parser.add_argument('--region', action='append', type=parse_region, default=[],
+                              help='"name,lat,lon,radius_km" (repeatable)')
+    build_parser.add_argument('--from-log', action='append', default=[], metavar='LOG',
+                              help='Access log to learn hot tiles from (repeatable)')
+    build_parser.add_argument('--top', type=int, default=100, help='Hot tiles to keep from the logs')
+    build_parser.add_argument('--radii', default=','.join(str(r) for r in DEFAULT_RADII),
+                              help='Search radii in meters to prefetch for each region')
+    build_parser.add_argument('--overpass-json', help='Read facilities from an Overpass JSON dump instead')
+    build_parser.add_argument('-o', '--output', default='nearby_tiles.pfx', help='Artifact file to write')
+
+    info_parser = subparsers.add_parser('info', help='Show artifact statistics')
+    info_parser.add_argument('artifact', help='Artifact file to inspect')
+
+    args = parser.parse_args(argv)
+    config = load_config()
+
+    if args.command == 'build':
+        regions = list(args.region)
+        if args.regions:
+            with open(args.regions) as f:
+                regions.extend(json.load(f))
+        cache = create_tile_cache(dict(config, NEARBY_CACHE_BACKEND='memory'))
+        hot_tiles = learn_hot_tiles(cache, args.from_log, args.top) if args.from_log else []
+        if not regions and not hot_tiles:
+            parser.error('give --regions, --region or --from-log')
+        radii = [int(radius) for radius in args.radii.split(',')]
+        builder = build_artifact(config, regions, radii, args.output, args.overpass_json, hot_tiles)
+        print(f"✅ Wrote {len(builder)} tiles to {args.output} ({os.path.getsize(args.output):,} bytes)")
+    else:
+        artifact = TileArtifact.load(args.artifact)
+        print(f"📊 Tiles: {len(artifact)}")
+        print(f"📊 Distinct facilities: {artifact.facility_count}")
+        print(f"📊 Regions: {', '.join(region['name'] for region in artifact.regions) or 'learned from logs'}")
+        print(f"📊 Age: {artifact.age() / 3600:.1f} hours")
+        artifact.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+"""
+Distance ranking, type filtering and cursor pagination of nearby facilities
+
+Distances are computed in one vectorized pass with NumPy when it is
+installed (imported on first use, as it dominates import time), falling
+back to a plain haversine loop otherwise. Pages are
+selected with argpartition (or a heap) instead of sorting every candidate.
+Cursors are keyset positions: the (distance, id) of the last item returned.
+"""
+import base64
+import heapq
+import json
+import math
+
+from geo import EARTH_RADIUS_M, haversine_m
+
+_numpy = False  # not imported yet
+
+
+def numpy_module():
+    """NumPy, imported on first call; None when it is not installed"""
+    global _numpy
+    if _numpy is False:
+        try:
+            import numpy
+        except ImportError:
+            numpy = None
+        _numpy = numpy
+    return _numpy
+
+
+def encode_cursor(distance, key):
+    raw = json.dumps([distance, key], separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Decode a cursor into its (distance, key) position, raising ValueError if malformed"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        distance, key = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        return float(distance), str(key)
+    except (TypeError, ValueError, UnicodeError):
+        raise ValueError('Invalid cursor')
+
+
+def parse_types(value):
+    """Parse a comma-separated types= parameter into a set, or None for all types"""
+    if not value:
+        return None
+    types = {item.strip() for item in value.split(',') if item.strip()}
+    return types or None
+
+
+def distances_m(lat, lon, lats, lons):
+    """Distances in meters from a point to each of the given coordinates"""
+    np = numpy_module()
+    if np is not None:
+        phi1 = math.radians(lat)
+        phi2 = np.radians(np.asarray(lats, dtype=np.float64))
+        dphi = phi2 - phi1
+        dlmb = np.radians(np.asarray(lons, dtype=np.float64) - lon)
+        a = np.sin(dphi / 2) ** 2 + math.cos(phi1) * np.cos(phi2) * np.sin(dlmb / 2) ** 2
+        return 2 * EARTH_RADIUS_M * np.arcsin(np.minimum(1.0, np.sqrt(a)))
+    return [haversine_m(lat, lon, item_lat, item_lon) for item_lat, item_lon in zip(lats, lons)]
+
+
+def rank_facilities(facilities, lat, lon, radius, types=None, limit=None, cursor=None):
+    """
+    Filter facilities to the radius and types, order them by distance and
+    return (page, total, next_cursor). Each facility in the page gets a
+    'distance' field in meters.
+    """
+    np = numpy_module()
+    if types is not None:
+        facilities = [facility for facility in facilities if facility.get('type') in types]
+
+    after = decode_cursor(cursor) if cursor else None
+    keys = [str(facility['id']) for facility in facilities]
+    distances = distances_m(
+        lat, lon,
+        [facility['latitude'] for facility in facilities],
+        [facility['longitude'] for facility in facilities]
+    )
+
+    if np is not None and len(facilities):
+        inside = np.flatnonzero(distances <= radius)
+        total = len(inside)
+        if after is not None:
+            after_distance, after_key = after
+            ties = [i for i in inside[distances[inside] == after_distance] if keys[i] > after_key]
+            candidates = np.concatenate([
+                inside[distances[inside] > after_distance],
+                np.array(ties, dtype=np.intp)
+            ])
+        else:
+            candidates = inside
+        remaining = len(candidates)
+        if limit is not None and limit < len(candidates):
+            # Partition on distance, then keep every tie with the k-th item so the id tiebreak stays exact
+            kth = distances[candidates][np.argpartition(distances[candidates], limit - 1)[limit - 1]]
+            candidates = candidates[distances[candidates] <= kth]
+        order = sorted(candidates.tolist(), key=lambda i: (distances[i], keys[i]))
+    else:
+        ranked = [
+            (distance, key, i)
+            for i, (distance, key) in enumerate(zip(distances, keys))
+            if distance <= radius
+        ]
+        total = len(ranked)
+        if after is not None:
+            ranked = [item for item in ranked if (item[0], item[1]) > after]
+        remaining = len(ranked)
+        if limit is not None and limit < len(ranked):
+            ranked = heapq.nsmallest(limit, ranked)
+        else:
+            ranked.sort()
+        order = [i for _, _, i in ranked]
+
+    has_more = limit is not None and remaining > limit
+    if limit is not None:
+        order = order[:limit]
+
+    page = []
+    for i in order:
+        facility = dict(facilities[i])
+        facility['distance'] = round(float(distances[i]), 1)
+        page.append(facility)
+
+    next_cursor = None
+    if has_more:
+        last = order[-1]
+        next_cursor = encode_cursor(float(distances[last]), keys[last])
+    return page, total, next_cursor
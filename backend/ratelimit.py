@@ -0,0 +1,164 @@
+"""
+Token-bucket rate limiting and concurrency limits for admission control
+"""
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+
+class LimitExceeded(Exception):
+    """Raised when a request is refused; retry_after is a hint in seconds"""
+
+    def __init__(self, message, retry_after=1.0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """Refills `rate` tokens per second up to `capacity`"""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(1.0, rate))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self, tokens=1):
+        """Take tokens if available; never blocks"""
+        with self._lock:
+            self._refill(time.monotonic())
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return True
+            return False
+
+    def wait_time(self, tokens=1):
+        """Seconds until `tokens` would be available"""
+        with self._lock:
+            self._refill(time.monotonic())
+            missing = tokens - self._tokens
+        if missing <= 0:
+            return 0.0
+        return missing / self.rate if self.rate > 0 else float('inf')
+
+    def acquire(self, tokens=1, timeout=None):
+        """Block until tokens are taken; returns False if timeout elapses first"""
+        if tokens > self.capacity:
+            raise ValueError(f'Cannot take {tokens} tokens from a bucket of {self.capacity:g}')
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            if self.try_acquire(tokens):
+                return True
+            delay = self.wait_time(tokens)
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or delay > remaining:
+                    return False
+            time.sleep(min(delay, 1.0))
+
+
+class ClientRateLimiter:
+    """One token bucket per client key, remembering the most recent max_clients keys"""
+
+    def __init__(self, rate, burst=None, max_clients=10000):
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+        self.rejected = 0
+
+    @property
+    def enabled(self):
+        return self.rate > 0
+
+    def check(self, client):
+        """Return 0.0 if the client may proceed, else the seconds until it may"""
+        if not self.enabled:
+            return 0.0
+        with self._lock:
+            bucket = self._buckets.get(client)
+            if bucket is None:
+                bucket = self._buckets[client] = TokenBucket(self.rate, self.burst)
+                if len(self._buckets) > self.max_clients:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(client)
+        if bucket.try_acquire():
+            return 0.0
+        with self._lock:
+            self.rejected += 1
+        return max(bucket.wait_time(), 0.001)
+
+
+class ConcurrencyLimiter:
+    """
+    Caps concurrent holders at `limit`. Up to `max_waiting` callers queue for
+    at most `queue_timeout` seconds; everyone else is rejected immediately.
+    The last `reserved` slots are kept for priority callers, who count
+    towards the limit but are never turned away. A limit of 0 disables the cap.
+    """
+
+    def __init__(self, limit, max_waiting=0, queue_timeout=0.0, reserved=0):
+        self.limit = limit
+        self.max_waiting = max_waiting
+        self.queue_timeout = queue_timeout
+        self.reserved = min(max(reserved, 0), max(limit - 1, 0))
+        self.active = 0
+        self.waiting = 0
+        self.rejected = 0
+        self._condition = threading.Condition()
+
+    def try_acquire(self, timeout=None, priority=False):
+        """Take a slot, waiting up to timeout (default queue_timeout) if the queue has room"""
+        if self.limit <= 0:
+            return True
+        timeout = self.queue_timeout if timeout is None else timeout
+        limit = self.limit - self.reserved
+        with self._condition:
+            if priority or self.active < limit:
+                self.active += 1
+                return True
+            if timeout <= 0 or self.waiting >= self.max_waiting:
+                self.rejected += 1
+                return False
+            self.waiting += 1
+            try:
+                deadline = time.monotonic() + timeout
+                while self.active >= limit:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.rejected += 1
+                        return False
+                    self._condition.wait(remaining)
+                self.active += 1
+                return True
+            finally:
+                self.waiting -= 1
+
+    def release(self):
+        if self.limit <= 0:
+            return
+        with self._condition:
+            self.active -= 1
+            self._condition.notify()
+
+    @contextmanager
+    def slot(self, retry_after=1.0):
+        """Hold a slot for the block or raise LimitExceeded"""
+        if not self.try_acquire():
+            raise LimitExceeded('Too many concurrent requests', retry_after)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def stats(self):
+        with self._condition:
+            return {'limit': self.limit, 'active': self.active, 'waiting': self.waiting, 'rejected': self.rejected}
@@ -0,0 +1,110 @@
+"""
+Nearest capable facilities for emergency alerts, with travel-time estimates
+
+There is no road graph to route on, so travel time comes from a speed
+model: the straight-line distance is stretched by a detour factor to
+approximate road distance, then driven through distance bands of
+increasing speed (slow city streets for the first kilometers, arterials,
+then highways), plus a fixed dispatch overhead. The estimate grows with
+distance, so the nearest facilities are also the quickest to reach.
+
+Candidates come from in-process sources only (custom hospitals, the offline
+snapshot and already cached tiles), searched in widening rings until enough
+are found or the time budget runs out. The budget is checked between
+facilities, not only between sources, and nothing here waits on the network.
+"""
+import time
+
+from geo import haversine_m
+
+# (band length in meters, speed in km/h); the last band has no end
+DEFAULT_SPEED_BANDS = ((2000, 25.0), (8000, 45.0), (None, 70.0))
+
+
+def parse_speed_bands(value):
+    """Parse '2000:25,8000:45,:70' into speed bands; an empty length marks the open-ended band"""
+    bands = []
+    for part in value.split(','):
+        length, _, speed = part.strip().partition(':')
+        bands.append((int(length) if length else None, float(speed)))
+    if not bands or bands[-1][0] is not None:
+        raise ValueError('The last speed band must have no length, e.g. ":70"')
+    return tuple(bands)
+
+
+class SpeedModel:
+    """Estimated driving time from straight-line distance"""
+
+    def __init__(self, bands=DEFAULT_SPEED_BANDS, detour_factor=1.3, overhead_seconds=60):
+        self.bands = bands
+        self.detour_factor = detour_factor
+        self.overhead_seconds = overhead_seconds
+
+    @classmethod
+    def from_config(cls, config):
+        bands = config.get('EMERGENCY_SPEED_BANDS')
+        return cls(
+            parse_speed_bands(bands) if bands else DEFAULT_SPEED_BANDS,
+            detour_factor=config.get('EMERGENCY_DETOUR_FACTOR', 1.3),
+            overhead_seconds=config.get('EMERGENCY_DISPATCH_OVERHEAD', 60)
+        )
+
+    def eta_seconds(self, distance_m):
+        """Seconds to drive to a point distance_m away in a straight line"""
+        remaining = distance_m * self.detour_factor
+        seconds = self.overhead_seconds
+        for length, speed_kmh in self.bands:
+            leg = remaining if length is None else min(remaining, length)
+            seconds += leg / (speed_kmh / 3.6)
+            remaining -= leg
+            if remaining <= 0:
+                break
+        return seconds
+
+
+def nearest_facilities(lat, lon, sources, accept, model, limit, radii, budget):
+    """
+    Return (routes, complete): up to `limit` accepted facilities nearest the
+    point, each with its distance and estimated travel time.
+
+    sources are callables (lat, lon, radius) -> iterables of facility dicts,
+    ideally lazy ones. They are searched ring by ring through `radii`
+    (meters, ascending) until `limit` facilities are found; complete is False
+    if the search stopped because `budget` seconds had passed.
+    """
+    deadline = time.monotonic() + budget
+    found = {}
+    complete = True
+    for radius in radii:
+        for source in sources:
+            if time.monotonic() > deadline:
+                complete = False
+                break
+            for n, facility in enumerate(source(lat, lon, radius), start=1):
+                if n % 64 == 0 and time.monotonic() > deadline:
+                    complete = False
+                    break
+                if facility['id'] in found or not accept(facility):
+                    continue
+                distance = haversine_m(lat, lon, facility['latitude'], facility['longitude'])
+                if distance <= radius:
+                    found[facility['id']] = (distance, facility)
+            if not complete:
+                break
+        if not complete or len(found) >= limit:
+            break
+
+    routes = []
+    for distance, facility in sorted(found.values(), key=lambda item: item[0])[:limit]:
+        routes.append({
+            'id': facility['id'],
+            'name': facility.get('name'),
+            'type': facility.get('type'),
+            'latitude': facility['latitude'],
+            'longitude': facility['longitude'],
+            'address': facility.get('address'),
+            'phone': facility.get('phone'),
+            'distance': round(distance, 1),
+            'eta_seconds': round(model.eta_seconds(distance))
+        })
+    return routes, complete
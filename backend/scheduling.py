@@ -0,0 +1,155 @@
+"""
+Appointment slots, capacity rules and overlap checks
+
+Appointments booked at a custom hospital carry a typed [start_at, end_at)
+interval in the facility's local wall-clock time. The hospital's capacity
+rules say when it takes bookings: an opening window per weekday (or for
+every day) split into fixed-length slots, each of which holds up to
+`capacity` overlapping appointments. Rules for a specific weekday replace
+the every-day rules on that day.
+
+No appointment is longer than max_duration, so every appointment that
+overlaps [start, end) starts inside [start - max_duration, end). Overlap
+checks and availability are therefore one bounded range scan on the
+(hospital_id, start_at) index, and free slots come from a single sweep over
+the sorted intervals.
+"""
+import heapq
+import re
+from datetime import date, datetime, time, timedelta, timezone
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+UTC_OFFSET = re.compile(r'^(?:UTC|GMT)?([+-])(\d{1,2}):?(\d{2})?$')
+
+
+class SchedulingError(ValueError):
+    """Raised for booking requests and capacity rules that are invalid"""
+
+
+def parse_local_datetime(value, field):
+    """Parse an ISO 8601 local date-time such as '2025-10-25T14:30'"""
+    if not isinstance(value, str):
+        raise SchedulingError(f'{field} must be an ISO 8601 date-time')
+    try:
+        parsed = datetime.fromisoformat(value.strip())
+    except ValueError:
+        raise SchedulingError(f'{field} must be an ISO 8601 date-time')
+    if parsed.tzinfo is not None:
+        raise SchedulingError(f'{field} must be the local time at the facility, without a UTC offset')
+    return parsed.replace(second=0, microsecond=0)
+
+
+def parse_timezone(value, field):
+    """Parse an IANA time zone name ('Europe/Berlin') or UTC offset ('+05:30', '-0800') into a tzinfo"""
+    value = (value or '').strip()
+    if value.upper() in ('UTC', 'GMT', 'Z'):
+        return timezone.utc
+    match = UTC_OFFSET.match(value.upper())
+    if match:
+        sign, hours, minutes = match.groups()
+        offset = timedelta(hours=int(hours), minutes=int(minutes or 0))
+        if offset > timedelta(hours=14) or int(minutes or 0) >= 60:
+            raise SchedulingError(f'{field} must be an IANA time zone or a UTC offset such as +05:30')
+        return timezone(-offset if sign == '-' else offset)
+    try:
+        return ZoneInfo(value)
+    except (ZoneInfoNotFoundError, ValueError):
+        raise SchedulingError(f'{field} must be an IANA time zone or a UTC offset such as +05:30')
+
+
+def parse_date(value, field):
+    try:
+        return date.fromisoformat(value)
+    except (TypeError, ValueError):
+        raise SchedulingError(f'{field} must be a date (YYYY-MM-DD)')
+
+
+def parse_clock(value, field):
+    try:
+        return time.fromisoformat(value).replace(second=0, microsecond=0)
+    except (TypeError, ValueError):
+        raise SchedulingError(f'{field} must be a time of day (HH:MM)')
+
+
+def parse_rules(items, max_duration_minutes):
+    """Validate a list of capacity rule dicts from a request body"""
+    if not isinstance(items, list):
+        raise SchedulingError('rules must be a list')
+    rules = []
+    for n, item in enumerate(items, start=1):
+        if not isinstance(item, dict):
+            raise SchedulingError(f'Rule {n} must be an object')
+        weekday = item.get('weekday')
+        if weekday is not None and (not isinstance(weekday, int) or not 0 <= weekday <= 6):
+            raise SchedulingError(f'Rule {n}: weekday must be 0 (Monday) to 6 (Sunday) or null')
+        opens_at = parse_clock(item.get('opens_at'), f'Rule {n}: opens_at')
+        closes_at = parse_clock(item.get('closes_at'), f'Rule {n}: closes_at')
+        slot_minutes = item.get('slot_minutes', 30)
+        capacity = item.get('capacity', 1)
+        if closes_at <= opens_at:
+            raise SchedulingError(f'Rule {n}: closes_at must be after opens_at')
+        if not isinstance(slot_minutes, int) or not 5 <= slot_minutes <= max_duration_minutes:
+            raise SchedulingError(f'Rule {n}: slot_minutes must be between 5 and {max_duration_minutes}')
+        if not isinstance(capacity, int) or capacity < 1:
+            raise SchedulingError(f'Rule {n}: capacity must be a positive integer')
+        rules.append({'weekday': weekday, 'opens_at': opens_at, 'closes_at': closes_at,
+                      'slot_minutes': slot_minutes, 'capacity': capacity})
+
+    # Windows on the same day must not overlap, so each day's slots are disjoint and ordered
+    windows = sorted((rule['weekday'] if rule['weekday'] is not None else -1, rule['opens_at'], rule['closes_at'])
+                     for rule in rules)
+    for previous, current in zip(windows, windows[1:]):
+        if previous[0] == current[0] and current[1] < previous[2]:
+            raise SchedulingError('Rules for the same day must not overlap')
+    return rules
+
+
+def rules_for_day(rules, day):
+    """Rules in effect on a date: its weekday's own rules, else the every-day rules"""
+    specific = [rule for rule in rules if rule.weekday == day.weekday()]
+    return specific or [rule for rule in rules if rule.weekday is None]
+
+
+def iter_slots(rules, first_day, last_day):
+    """Yield (start, end, capacity) for every slot from first_day through last_day, in start order"""
+    day = first_day
+    while day <= last_day:
+        slots = []
+        for rule in rules_for_day(rules, day):
+            length = timedelta(minutes=rule.slot_minutes)
+            start = datetime.combine(day, rule.opens_at)
+            closes = datetime.combine(day, rule.closes_at)
+            while start + length <= closes:
+                slots.append((start, start + length, rule.capacity))
+                start += length
+        slots.sort()
+        yield from slots
+        day += timedelta(days=1)
+
+
+def slot_for(rules, start):
+    """Return (end, capacity) of the slot beginning exactly at start, or None if it is not one"""
+    for rule in rules_for_day(rules, start.date()):
+        opens = datetime.combine(start.date(), rule.opens_at)
+        closes = datetime.combine(start.date(), rule.closes_at)
+        length = timedelta(minutes=rule.slot_minutes)
+        if opens <= start and start + length <= closes and (start - opens) % length == timedelta(0):
+            return start + length, rule.capacity
+    return None
+
+
+def booked_per_slot(slots, intervals):
+    """
+    Pair each (start, end, capacity) slot with the number of [start, end)
+    intervals overlapping it. Both inputs must be sorted by start.
+    """
+    intervals = iter(intervals)
+    pending = next(intervals, None)
+    active = []  # end times of intervals that started before the current slot ends
+    for slot_start, slot_end, capacity in slots:
+        while pending is not None and pending[0] < slot_end:
+            heapq.heappush(active, pending[1])
+            pending = next(intervals, None)
+        while active and active[0] <= slot_start:
+            heapq.heappop(active)
+        yield slot_start, slot_end, capacity, len(active)
@@ -0,0 +1,134 @@
+"""
+Schema creation and additive migrations
+
+Instead of db.create_all() at import time, the app brings the schema up to
+date on the first request it serves (or when `python schema.py` runs as a
+deploy step). Missing tables are created, and tables that already exist get
+any columns and indexes the models have gained since they were created.
+Nothing is ever dropped or altered in place.
+
+SQLite cannot add a NOT NULL column without a default, so such columns are
+added as nullable.
+
+Usage:
+    python schema.py            # apply and list the changes
+    python schema.py --dry-run  # only list them
+"""
+import argparse
+import logging
+import threading
+
+from sqlalchemy import inspect
+from sqlalchemy.exc import DatabaseError
+from sqlalchemy.schema import CreateIndex
+
+logger = logging.getLogger(__name__)
+
+
+def _column_ddl(column, dialect):
+    """Column definition for ADD COLUMN; NOT NULL is kept only when there is a server default"""
+    ddl = f'{dialect.identifier_preparer.quote(column.name)} {column.type.compile(dialect=dialect)}'
+    if column.server_default is not None:
+        arg = column.server_default.arg
+        ddl += ' DEFAULT ' + ("'" + arg.replace("'", "''") + "'" if isinstance(arg, str) else str(arg))
+        if not column.nullable:
+            ddl += ' NOT NULL'
+    return ddl
+
+
+def pending_changes(engine, metadata):
+    """Return [(description, statements)] needed to bring the database up to the models"""
+    inspector = inspect(engine)
+    existing = set(inspector.get_table_names())
+    dialect = engine.dialect
+    changes = []
+    for table in metadata.sorted_tables:
+        if table.name not in existing:
+            changes.append((f'create table {table.name}', []))
+            continue
+        table_name = dialect.identifier_preparer.format_table(table)
+        columns = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in columns:
+                continue
+            statements = [f'ALTER TABLE {table_name} ADD COLUMN {_column_ddl(column, dialect)}']
+            if column.default is not None and column.default.is_scalar:
+                # Backfill existing rows with the model's Python-side default
+                statements.append(table.update().values({column.name: column.default.arg}))
+            changes.append((f'add column {table.name}.{column.name}', statements))
+        indexes = {index['name'] for index in inspector.get_indexes(table.name)}
+        for index in sorted(table.indexes, key=lambda index: index.name):
+            if index.name not in indexes:
+                ddl = str(CreateIndex(index, if_not_exists=True).compile(dialect=dialect))
+                changes.append((f'create index {index.name}', [ddl]))
+    return changes
+
+
+def migrate(engine, metadata, dry_run=False):
+    """
+    Create missing tables, columns and indexes; returns descriptions of the
+    changes. Safe to run from several workers at once: a worker that loses
+    the race (table or column already exists) rolls back and, if the winner
+    left nothing to do, returns no changes.
+    """
+    changes = pending_changes(engine, metadata)
+    if not dry_run and changes:
+        try:
+            with engine.begin() as connection:
+                # New tables (with their indexes) first, then columns and indexes on existing ones
+                metadata.create_all(connection)
+                for description, statements in changes:
+                    for statement in statements:
+                        if isinstance(statement, str):
+                            connection.exec_driver_sql(statement)
+                        else:
+                            connection.execute(statement)
+                    logger.info('Schema: %s', description)
+        except DatabaseError:
+            if pending_changes(engine, metadata):
+                raise
+            logger.info('Schema: brought up to date by another process')
+            return []
+    return [description for description, _ in changes]
+
+
+class LazySchema:
+    """Migrates each of an app's databases once per process, on first use"""
+
+    def __init__(self, db):
+        self.db = db
+        self._done = set()
+        self._lock = threading.Lock()
+
+    def ensure(self, app=None):
+        """Bring the schema up to date if this process has not done so yet; needs an app context"""
+        from flask import current_app
+        app = app or current_app._get_current_object()
+        if id(app) in self._done:
+            return
+        with self._lock:
+            if id(app) in self._done:
+                return
+            with app.app_context():
+                # The primary only: a replica receives schema changes through replication
+                migrate(self.db.engine, self.db.metadata)
+            self._done.add(id(app))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Create missing tables, columns and indexes')
+    parser.add_argument('--dry-run', action='store_true', help='List the changes without applying them')
+    args = parser.parse_args(argv)
+
+    from app import app, db
+
+    with app.app_context():
+        changes = migrate(db.engine, db.metadata, dry_run=args.dry_run)
+    for description in changes:
+        print(f"{'⊘ Pending' if args.dry_run else '✓ Applied'}: {description}")
+    if not changes:
+        print("✅ Schema is up to date")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,447 @@
+"""
+Full-text facility search with prefix and typo tolerance
+
+Documents are facilities (custom hospitals and facilities returned by
+Overpass), indexed by the character trigrams of their normalized name and
+address/description. Words are padded with two leading spaces and one
+trailing space, and the last word of a query is left open at the end, so
+'st' matches 'street' and 'hospitl' shares 6 of its 7 trigrams with
+'hospital'. A document matches when it contains at least
+SEARCH_MIN_SIMILARITY of the query's trigrams. The text score is that
+fraction, discounted by a quarter when the trigrams are not in the name.
+With a search location the score is biased towards nearby facilities:
+
+    score = text * (1 + geo_weight / (1 + distance_km / geo_scale_km)) / (1 + geo_weight)
+
+Two backends share this scoring:
+
+- memory: an in-process inverted index of trigram -> array of document
+  numbers. Hit counts for every document come from one NumPy bincount over
+  the query's posting lists (a Counter without NumPy). Removed documents
+  leave tombstones that are compacted away once they make up a quarter of
+  the index.
+- fts5: a SQLite FTS5 table with the trigram tokenizer (SQLite 3.34+),
+  optionally on disk. Substring matches on the query words come first, then
+  any document sharing a trigram with the query, up to SEARCH_CANDIDATES
+  rows, which are rescored as above. Slower per query than memory (tens of
+  milliseconds at 100k documents), and geo bias only reorders the candidates,
+  but the index does not live in the Python heap. 'auto' picks it when the
+  SQLite build supports it.
+
+Custom hospitals are pinned. Other documents are evicted oldest first beyond
+max_documents.
+"""
+import heapq
+import math
+import re
+import sqlite3
+import threading
+import unicodedata
+from array import array
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+
+from ranking import distances_m, numpy_module
+from serializers import dumps, dumps_bytes, loads
+
+NAME_ONLY_DISCOUNT = 0.75  # score factor when none of the matched trigrams are in the name
+PLACEHOLDERS = {'Address not available', 'N/A'}  # to_dict() fillers, not searchable text
+
+_NON_WORD = re.compile(r'[\W_]+')
+
+
+def normalize(text):
+    """Lower-case, accent-free words separated by single spaces"""
+    text = text or ''
+    if not text.isascii():
+        text = ''.join(ch for ch in unicodedata.normalize('NFKD', text) if not unicodedata.combining(ch))
+    return ' '.join(_NON_WORD.sub(' ', text.casefold()).split())
+
+
+def trigrams(text, prefix=False):
+    """Trigrams of normalized text; with prefix the last word may continue"""
+    words = text.split()
+    grams = set()
+    for n, word in enumerate(words):
+        padded = '  ' + word if prefix and n == len(words) - 1 else '  ' + word + ' '
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def facility_document(facility):
+    """The (key, name, text, type, lat, lon, payload) document for a facility dict"""
+    text = ' '.join(value for value in (facility.get('address'), facility.get('description'))
+                    if value and value not in PLACEHOLDERS)
+    return (facility['id'], facility.get('name') or '', text, facility.get('type'),
+            facility['latitude'], facility['longitude'], facility)
+
+
+def text_score(query_grams, name_grams, all_grams):
+    """Fraction of query trigrams found, discounted when they are not in the name"""
+    hits = len(query_grams & all_grams)
+    name_hits = len(query_grams & name_grams)
+    n = len(query_grams)
+    return hits / n * (NAME_ONLY_DISCOUNT + (1 - NAME_ONLY_DISCOUNT) * name_hits / n)
+
+
+class SearchIndex:
+    """Shared configuration, geo biasing and result shaping of the backends"""
+
+    def __init__(self, min_similarity=0.5, geo_weight=1.0, geo_scale_km=5.0, max_documents=200000):
+        self.min_similarity = min_similarity
+        self.geo_weight = geo_weight
+        self.geo_scale_m = geo_scale_km * 1000
+        self.max_documents = max_documents
+        self.pinned_built_at = None
+        self.pinned_version = None
+        self._lock = threading.RLock()
+
+    def invalidate_pinned(self):
+        """Mark the pinned documents stale so the owner reloads them before the next search"""
+        self.pinned_built_at = None
+
+    def _batch(self):
+        """Context for a group of changes: the lock, plus a transaction where there is one"""
+        return self._lock
+
+    def add(self, key, name, text, facility_type, lat, lon, payload, pinned=False):
+        """Add or replace one document; payload is the dict returned for it"""
+        with self._batch():
+            self._add(key, name, text, facility_type, lat, lon, payload, pinned)
+
+    def remove(self, key):
+        with self._batch():
+            self._remove(key)
+
+    def add_many(self, documents, pinned=False):
+        """Add or replace (key, name, text, type, lat, lon, payload) documents"""
+        with self._batch():
+            for document in documents:
+                self._add(*document, pinned=pinned)
+
+    def replace_pinned(self, documents, built_at, version=None):
+        """Make `documents` the complete set of pinned documents, read at the owner's data `version`"""
+        with self._batch():
+            keys = set()
+            for document in documents:
+                self._add(*document, pinned=True)
+                keys.add(document[0])
+            for key in self.pinned_keys() - keys:
+                self._remove(key)
+            self.pinned_built_at = built_at
+            self.pinned_version = version
+
+    def _geo_factor(self, distance):
+        return (1 + self.geo_weight / (1 + distance / self.geo_scale_m)) / (1 + self.geo_weight)
+
+    def _results(self, ranked):
+        """Decode (score, distance, payload) into result dicts"""
+        results = []
+        for score, distance, payload in ranked:
+            facility = loads(payload)
+            facility['score'] = round(float(score), 4)
+            if distance is not None:
+                facility['distance'] = round(float(distance), 1)
+            results.append(facility)
+        return results
+
+
+class MemorySearchIndex(SearchIndex):
+    """In-process trigram inverted index"""
+
+    name = 'memory'
+
+    def __init__(self, **options):
+        super().__init__(**options)
+        self._reset()
+
+    def _reset(self):
+        self._docs = {}                # key -> document number
+        self._evictable = OrderedDict()  # unpinned keys, oldest first
+        self._pinned = set()
+        self._keys = []                # document number -> key, None once removed
+        self._alive = bytearray()      # document number -> 1, 0 once removed
+        self._fields = []              # document number -> (name, text) normalized, for compaction
+        self._payloads = []
+        self._types = array('H')
+        self._type_codes = {}
+        self._lats = array('d')
+        self._lons = array('d')
+        self._all_postings = {}        # trigram -> array('I') of document numbers
+        self._name_postings = {}
+        self._removed = 0
+
+    def __len__(self):
+        return len(self._docs)
+
+    def pinned_keys(self):
+        return set(self._pinned)
+
+    def _add(self, key, name, text, facility_type, lat, lon, payload, pinned=False):
+        encoded = dumps_bytes(payload)
+        with self._lock:
+            number = self._docs.get(key)
+            if number is not None:
+                if self._payloads[number] == encoded and (key in self._pinned) == pinned:
+                    # Refetched but unchanged: only refresh its place in the eviction order
+                    if not pinned:
+                        self._evictable.move_to_end(key)
+                    return
+                self._remove(key)
+            name = normalize(name)
+            text = normalize(text)
+            number = len(self._keys)
+            self._keys.append(key)
+            self._alive.append(1)
+            self._fields.append((name, text))
+            self._payloads.append(encoded)
+            code = self._type_codes.setdefault(facility_type or '', len(self._type_codes))
+            self._types.append(code)
+            self._lats.append(lat)
+            self._lons.append(lon)
+            name_grams = trigrams(name)
+            for gram in name_grams | trigrams(text):
+                postings = self._all_postings.get(gram)
+                if postings is None:
+                    postings = self._all_postings[gram] = array('I')
+                postings.append(number)
+            for gram in name_grams:
+                postings = self._name_postings.get(gram)
+                if postings is None:
+                    postings = self._name_postings[gram] = array('I')
+                postings.append(number)
+            self._docs[key] = number
+            if pinned:
+                self._pinned.add(key)
+            else:
+                self._evictable[key] = None
+                while len(self._evictable) > self.max_documents:
+                    self._remove(next(iter(self._evictable)))
+
+    def _remove(self, key):
+        with self._lock:
+            number = self._docs.pop(key, None)
+            if number is None:
+                return
+            self._keys[number] = None
+            self._alive[number] = 0
+            self._payloads[number] = None
+            self._pinned.discard(key)
+            self._evictable.pop(key, None)
+            self._removed += 1
+            if self._removed > 1000 and self._removed * 4 > len(self._keys):
+                self._compact()
+
+    def _compact(self):
+        """Rebuild without tombstones; document numbers are reassigned"""
+        live = [(key, self._fields[number], self._types[number], self._lats[number], self._lons[number],
+                 self._payloads[number]) for number, key in enumerate(self._keys) if key is not None]
+        pinned = self._pinned
+        type_names = {code: name for name, code in self._type_codes.items()}
+        self._reset()
+        for key, (name, text), code, lat, lon, payload in live:
+            self._add(key, name, text, type_names[code], lat, lon, loads(payload), pinned=key in pinned)
+
+    def _hit_counts(self, postings_map, grams, size):
+        np = numpy_module()
+        lists = [postings_map[gram] for gram in grams if gram in postings_map]
+        if np is not None:
+            if not lists:
+                return np.zeros(size, dtype=np.intp)
+            # The views into the arrays are released before anything can append to them
+            return np.bincount(np.concatenate([np.frombuffer(postings, dtype=np.uint32) for postings in lists]),
+                               minlength=size)
+        counts = Counter()
+        for postings in lists:
+            counts.update(postings)
+        return counts
+
+    def search(self, query, lat=None, lon=None, limit=20, types=None):
+        grams = trigrams(normalize(query), prefix=True)
+        if not grams:
+            return []
+        n = len(grams)
+        need = max(1, math.ceil(n * self.min_similarity))
+        np = numpy_module()
+        with self._lock:
+            size = len(self._keys)
+            all_counts = self._hit_counts(self._all_postings, grams, size)
+            name_counts = self._hit_counts(self._name_postings, grams, size)
+            wanted = None
+            if types is not None:
+                wanted = {self._type_codes[name] for name in types if name in self._type_codes}
+
+            if np is not None:
+                candidates = np.flatnonzero(all_counts >= need)
+                if self._removed:
+                    candidates = candidates[np.frombuffer(self._alive, dtype=np.uint8)[candidates] == 1]
+                if wanted is not None:
+                    codes = np.frombuffer(self._types, dtype=np.uint16)[candidates]
+                    candidates = candidates[np.isin(codes, list(wanted))]
+                hits = all_counts[candidates]
+                scores = hits / n * (NAME_ONLY_DISCOUNT + (1 - NAME_ONLY_DISCOUNT) * name_counts[candidates] / n)
+                distances = None
+                if lat is not None and lon is not None and len(candidates):
+                    lats = np.frombuffer(self._lats, dtype=np.float64)[candidates]
+                    lons = np.frombuffer(self._lons, dtype=np.float64)[candidates]
+                    distances = distances_m(lat, lon, lats, lons)
+                    scores = scores * self._geo_factor(distances)
+                if limit < len(candidates):
+                    top = np.argpartition(-scores, limit - 1)[:limit]
+                else:
+                    top = np.arange(len(candidates))
+                top = sorted(top.tolist(), key=lambda i: -scores[i])
+                ranked = [(scores[i], distances[i] if distances is not None else None,
+                           self._payloads[candidates[i]]) for i in top]
+            else:
+                ranked = []
+                for number, hits in all_counts.items():
+                    if hits < need or not self._alive[number]:
+                        continue
+                    if wanted is not None and self._types[number] not in wanted:
+                        continue
+                    score = hits / n * (NAME_ONLY_DISCOUNT + (1 - NAME_ONLY_DISCOUNT) * name_counts[number] / n)
+                    distance = None
+                    if lat is not None and lon is not None:
+                        distance = distances_m(lat, lon, [self._lats[number]], [self._lons[number]])[0]
+                        score *= self._geo_factor(distance)
+                    ranked.append((score, distance, self._payloads[number]))
+                ranked = heapq.nlargest(limit, ranked, key=lambda item: item[0])
+        return self._results(ranked)
+
+
+class FTS5SearchIndex(SearchIndex):
+    """SQLite FTS5 index with the trigram tokenizer"""
+
+    name = 'fts5'
+
+    def __init__(self, path=':memory:', candidates=500, **options):
+        super().__init__(**options)
+        self.candidates = candidates
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS search_fts USING fts5(name, text, tokenize='trigram')")
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS search_docs ('
+            'rowid INTEGER PRIMARY KEY, key TEXT UNIQUE, type TEXT, latitude REAL, longitude REAL, '
+            'pinned INTEGER NOT NULL, payload BLOB NOT NULL)'
+        )
+        self._conn.commit()
+        self._unpinned = self._conn.execute('SELECT COUNT(*) FROM search_docs WHERE pinned = 0').fetchone()[0]
+
+    def __len__(self):
+        return self._conn.execute('SELECT COUNT(*) FROM search_docs').fetchone()[0]
+
+    @contextmanager
+    def _batch(self):
+        with self._lock, self._conn:
+            yield
+
+    def pinned_keys(self):
+        return {loads(key) for key, in self._conn.execute('SELECT key FROM search_docs WHERE pinned = 1')}
+
+    def _add(self, key, name, text, facility_type, lat, lon, payload, pinned=False):
+        encoded = dumps_bytes(payload)
+        row = self._conn.execute('SELECT pinned, payload FROM search_docs WHERE key = ?', (dumps(key),)).fetchone()
+        if row is not None and row[0] == int(pinned) and row[1] == encoded:
+            return
+        self._remove(key)
+        cursor = self._conn.execute(
+            'INSERT INTO search_docs (key, type, latitude, longitude, pinned, payload) VALUES (?, ?, ?, ?, ?, ?)',
+            (dumps(key), facility_type or '', lat, lon, int(pinned), encoded)
+        )
+        self._conn.execute('INSERT INTO search_fts (rowid, name, text) VALUES (?, ?, ?)',
+                           (cursor.lastrowid, normalize(name), normalize(text)))
+        if not pinned:
+            self._unpinned += 1
+            if self._unpinned > self.max_documents:
+                oldest = self._conn.execute('SELECT key FROM search_docs WHERE pinned = 0 ORDER BY rowid LIMIT ?',
+                                            (self._unpinned - self.max_documents,)).fetchall()
+                for encoded_key, in oldest:
+                    self._remove(loads(encoded_key))
+
+    def _remove(self, key):
+        row = self._conn.execute('SELECT rowid, pinned FROM search_docs WHERE key = ?', (dumps(key),)).fetchone()
+        if row is not None:
+            self._conn.execute('DELETE FROM search_fts WHERE rowid = ?', (row[0],))
+            self._conn.execute('DELETE FROM search_docs WHERE rowid = ?', (row[0],))
+            if not row[1]:
+                self._unpinned -= 1
+
+    def _candidates(self, condition, params, limit):
+        return self._conn.execute(
+            'SELECT d.rowid, f.name, f.text, d.type, d.latitude, d.longitude, d.payload '
+            'FROM search_fts f JOIN search_docs d ON d.rowid = f.rowid '
+            f'WHERE {condition} LIMIT ?',
+            (*params, limit)
+        ).fetchall()
+
+    def search(self, query, lat=None, lon=None, limit=20, types=None):
+        normalized = normalize(query)
+        grams = trigrams(normalized, prefix=True)
+        if not grams:
+            return []
+        # FTS5 trigram queries need at least three characters per phrase
+        words = [word for word in normalized.split() if len(word) >= 3]
+        inner = sorted(gram for gram in grams if ' ' not in gram)
+        rows = {}
+        with self._lock:
+            if words:
+                expression = ' AND '.join(f'"{word}"' for word in words)
+                for row in self._candidates('search_fts MATCH ? ORDER BY f.rank', (expression,), self.candidates):
+                    rows[row[0]] = row
+            if len(rows) < self.candidates and inner:
+                # Typo tolerance: anything sharing a trigram with the query, best BM25 first
+                expression = ' OR '.join(f'"{gram}"' for gram in inner)
+                for row in self._candidates('search_fts MATCH ? ORDER BY f.rank', (expression,), self.candidates):
+                    if len(rows) >= self.candidates:
+                        break
+                    rows.setdefault(row[0], row)
+            if not words and not inner:
+                # One or two characters: a word prefix scan
+                pattern = f'% {normalized}%'
+                rows.update((row[0], row) for row in self._candidates(
+                    "(' ' || f.name || ' ' || f.text) LIKE ?", (pattern,), self.candidates))
+
+        ranked = []
+        for _, name, text, facility_type, item_lat, item_lon, payload in rows.values():
+            if types is not None and facility_type not in types:
+                continue
+            name_grams = trigrams(name)
+            all_grams = name_grams | trigrams(text)
+            if len(grams & all_grams) < self.min_similarity * len(grams):
+                continue
+            score = text_score(grams, name_grams, all_grams)
+            distance = None
+            if lat is not None and lon is not None:
+                distance = distances_m(lat, lon, [item_lat], [item_lon])[0]
+                score *= self._geo_factor(distance)
+            ranked.append((score, distance, payload))
+        return self._results(heapq.nlargest(limit, ranked, key=lambda item: item[0]))
+
+
+def fts5_available():
+    """True if this SQLite build has FTS5 with the trigram tokenizer"""
+    try:
+        sqlite3.connect(':memory:').execute("CREATE VIRTUAL TABLE probe USING fts5(x, tokenize='trigram')")
+        return True
+    except sqlite3.OperationalError:
+        return False
+
+
+def create_search_index(config):
+    """Build the facility search index from Flask config values"""
+    backend = config.get('SEARCH_BACKEND', 'memory')
+    options = dict(
+        min_similarity=config.get('SEARCH_MIN_SIMILARITY', 0.5),
+        geo_weight=config.get('SEARCH_GEO_WEIGHT', 1.0),
+        geo_scale_km=config.get('SEARCH_GEO_SCALE_KM', 5.0),
+        max_documents=config.get('SEARCH_MAX_DOCUMENTS', 200000)
+    )
+    if backend == 'auto':
+        backend = 'fts5' if fts5_available() else 'memory'
+    if backend == 'memory':
+        return MemorySearchIndex(**options)
+    if backend == 'fts5':
+        return FTS5SearchIndex(config.get('SEARCH_INDEX_PATH') or ':memory:',
+                               candidates=config.get('SEARCH_CANDIDATES', 500), **options)
+    raise ValueError(f'Unknown SEARCH_BACKEND: {backend}')
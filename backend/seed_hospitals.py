@@ -2,7 +2,8 @@
 Seed script to add sample hospitals to the database
 Run this script to populate the database with sample medical facilities
 """
-from app import app, db, Hospital
+from app import app, db, schema, Hospital, publish_hospital_changes
+from bulk import upsert_hospitals
 
 # Sample hospitals with real locations (you can customize these)
 sample_hospitals = [
@@ -107,25 +108,22 @@ sample_hospitals = [
 def seed_database():
     """Add sample hospitals to the database"""
     with app.app_context():
+        schema.ensure()
+
         # Clear existing hospitals (optional - remove if you want to keep existing data)
         # Hospital.query.delete()
         
-        # Add sample hospitals
-        count = 0
-        for hospital_data in sample_hospitals:
-            # Check if hospital already exists (by name)
-            existing = Hospital.query.filter_by(name=hospital_data['name']).first()
-            if not existing:
-                hospital = Hospital(**hospital_data)
-                db.session.add(hospital)
-                count += 1
-                print(f"✓ Added: {hospital_data['name']}")
-            else:
-                print(f"⊘ Skipped (already exists): {hospital_data['name']}")
+        # Add sample hospitals in one batch, skipping names that already exist
+        rows = enumerate(sample_hospitals, start=1)
+        summary = upsert_hospitals(db.session, Hospital, rows, on_conflict='skip')
+        if summary['inserted'] or summary['updated']:
+            # Running workers rebuild their hospital index and search copies on the new version
+            publish_hospital_changes()
         
-        # Commit changes
-        db.session.commit()
-        print(f"\n✅ Successfully added {count} new hospitals to the database!")
+        for error in summary['errors']:
+            print(f"✗ Row {error['row']}: {error['error']}")
+        print(f"\n✅ Successfully added {summary['inserted']} new hospitals to the database!")
+        print(f"⊘ Skipped (already exists): {summary['skipped']}")
         print(f"📊 Total hospitals in database: {Hospital.query.count()}")
 
 if __name__ == '__main__':
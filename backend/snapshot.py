@@ -0,0 +1,317 @@
+"""
+Offline snapshot of OSM medical facilities for serving nearby searches locally
+
+A snapshot is built from an OSM extract (.osm.pbf, needs the optional
+osmium package) or an Overpass JSON dump and stored column-wise: parallel
+arrays of ids, coordinates and string-table offsets, sorted by grid cell so
+a radius query only touches the rows of the cells it overlaps.
+
+Usage:
+    python snapshot.py import region.osm.pbf -o facilities.snap
+    python snapshot.py import overpass_dump.json -o facilities.snap
+    python snapshot.py info facilities.snap
+"""
+import argparse
+import json
+import math
+import struct
+import sys
+from array import array
+
+from geo import bounding_box, haversine_m
+from overpass import element_to_facility, is_facility
+from streaming import CHUNK_SIZE, iter_json_array
+
+MAGIC = b'MEDISNAP1\n'
+DEFAULT_CELL_SIZE = 0.05
+
+STRING_FIELDS = ('name', 'type', 'address', 'phone', 'opening_hours', 'website')
+
+
+class SnapshotError(Exception):
+    """Raised when a snapshot cannot be built, read or queried"""
+
+
+class FacilitySnapshot:
+    """Column-oriented, grid-indexed store of facilities"""
+
+    def __init__(self, ids, lats, lons, string_columns, strings, cell_size=DEFAULT_CELL_SIZE):
+        self.ids = ids
+        self.lats = lats
+        self.lons = lons
+        self.string_columns = string_columns
+        self.strings = strings
+        self.cell_size = cell_size
+        self._columns = int(math.ceil(360.0 / cell_size))
+        self._cells = {}
+        self._string_ids = None
+        self.bounds = None
+        self._index()
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _cell(self, lat, lon):
+        return (int(math.floor(lat / self.cell_size)),
+                int(math.floor((lon + 180.0) / self.cell_size)) % self._columns)
+
+    def _index(self):
+        """Record the row range of each cell; rows are stored sorted by cell"""
+        previous = None
+        for row in range(len(self.ids)):
+            cell = self._cell(self.lats[row], self.lons[row])
+            if cell != previous:
+                if cell in self._cells:
+                    raise SnapshotError('Snapshot rows are not sorted by grid cell')
+                self._cells[cell] = [row, row + 1]
+                previous = cell
+            else:
+                self._cells[cell][1] = row + 1
+        if len(self.ids):
+            self.bounds = (min(self.lats), min(self.lons), max(self.lats), max(self.lons))
+
+    def covers(self, lat, lon, radius):
+        """Return True if a query circle lies entirely inside the snapshot extent"""
+        if self.bounds is None:
+            return False
+        min_lat, min_lon, max_lat, max_lon = bounding_box(lat, lon, radius)
+        return (min_lat >= self.bounds[0] and min_lon >= self.bounds[1]
+                and max_lat <= self.bounds[2] and max_lon <= self.bounds[3])
+
+    def facility(self, row):
+        """Build the facility dict for a row, matching the Overpass output"""
+        facility = {
+            'id': self.ids[row],
+            'latitude': self.lats[row],
+            'longitude': self.lons[row]
+        }
+        for field in STRING_FIELDS:
+            facility[field] = self.strings[self.string_columns[field][row]]
+        return facility
+
+    def query_radius(self, lat, lon, radius):
+        """Return [(row, distance_m)] of rows within radius meters"""
+        return list(self._iter_radius(lat, lon, radius))
+
+    def _iter_radius(self, lat, lon, radius, wanted=None):
+        """Yield (row, distance_m) of rows within radius meters, cell by cell; wanted limits type indexes"""
+        min_lat, min_lon, max_lat, max_lon = bounding_box(lat, lon, radius)
+        min_row = int(math.floor(min_lat / self.cell_size))
+        max_row = int(math.floor(max_lat / self.cell_size))
+        min_col = int(math.floor((min_lon + 180.0) / self.cell_size))
+        max_col = int(math.floor((max_lon + 180.0) / self.cell_size))
+        if max_col - min_col >= self._columns:
+            min_col, max_col = 0, self._columns - 1
+
+        lats = self.lats
+        lons = self.lons
+        type_column = self.string_columns['type']
+        for cell_row in range(min_row, max_row + 1):
+            for cell_col in range(min_col, max_col + 1):
+                span = self._cells.get((cell_row, cell_col % self._columns))
+                if span is None:
+                    continue
+                for row in range(span[0], span[1]):
+                    if wanted is not None and type_column[row] not in wanted:
+                        continue
+                    distance = haversine_m(lat, lon, lats[row], lons[row])
+                    if distance <= radius:
+                        yield row, distance
+
+    def facilities_within(self, lat, lon, radius, types=None):
+        """Return facility dicts within radius meters of a point, optionally only of some types"""
+        return list(self.iter_facilities_within(lat, lon, radius, types))
+
+    def iter_facilities_within(self, lat, lon, radius, types=None):
+        """Like facilities_within, one dict at a time, so callers on a time budget can stop early"""
+        wanted = None
+        if types is not None:
+            # Compare string-table indexes so rejected rows are skipped before any distance or dict
+            if self._string_ids is None:
+                self._string_ids = {value: index for index, value in enumerate(self.strings)}
+            wanted = {self._string_ids[value] for value in types if value in self._string_ids}
+        for row, _ in self._iter_radius(lat, lon, radius, wanted):
+            yield self.facility(row)
+
+    def save(self, path):
+        header = {
+            'count': len(self.ids),
+            'cell_size': self.cell_size,
+            'byteorder': sys.byteorder,
+            'strings': len(self.strings)
+        }
+        header_bytes = json.dumps(header).encode('utf-8')
+        string_bytes = '\0'.join(self.strings).encode('utf-8')
+        with open(path, 'wb') as f:
+            f.write(MAGIC)
+            f.write(struct.pack('<I', len(header_bytes)))
+            f.write(header_bytes)
+            f.write(struct.pack('<Q', len(string_bytes)))
+            f.write(string_bytes)
+            for column in self._arrays():
+                column.tofile(f)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise SnapshotError(f'{path} is not a facility snapshot')
+            header_length = struct.unpack('<I', f.read(4))[0]
+            header = json.loads(f.read(header_length))
+            string_length = struct.unpack('<Q', f.read(8))[0]
+            strings = f.read(string_length).decode('utf-8').split('\0')
+            if len(strings) != header['strings']:
+                raise SnapshotError(f'{path} has a corrupt string table')
+
+            count = header['count']
+            ids = array('q')
+            lats = array('d')
+            lons = array('d')
+            string_columns = {field: array('I') for field in STRING_FIELDS}
+            try:
+                for column in [ids, lats, lons] + [string_columns[field] for field in STRING_FIELDS]:
+                    column.fromfile(f, count)
+                    if header['byteorder'] != sys.byteorder:
+                        column.byteswap()
+            except EOFError:
+                raise SnapshotError(f'{path} is truncated')
+
+        return cls(ids, lats, lons, string_columns, strings, header['cell_size'])
+
+    def _arrays(self):
+        return [self.ids, self.lats, self.lons] + [self.string_columns[field] for field in STRING_FIELDS]
+
+
+class SnapshotBuilder:
+    """Accumulates Overpass-style elements and produces a FacilitySnapshot"""
+
+    def __init__(self, cell_size=DEFAULT_CELL_SIZE):
+        self.cell_size = cell_size
+        self._rows = []
+        self._seen = set()
+
+    def add_element(self, element):
+        """Add an element if it is a medical facility with a location"""
+        key = (element.get('type'), element.get('id'))
+        if key in self._seen or not is_facility(element.get('tags', {})):
+            return False
+        facility = element_to_facility(element)
+        if facility is None:
+            return False
+        self._seen.add(key)
+        self._rows.append(facility)
+        return True
+
+    def build(self):
+        columns = int(math.ceil(360.0 / self.cell_size))
+
+        def cell(facility):
+            return (int(math.floor(facility['latitude'] / self.cell_size)),
+                    int(math.floor((facility['longitude'] + 180.0) / self.cell_size)) % columns)
+
+        rows = sorted(self._rows, key=cell)
+
+        string_ids = {}
+        strings = []
+
+        def intern(value):
+            value = (value or '').replace('\0', '')
+            index = string_ids.get(value)
+            if index is None:
+                index = string_ids[value] = len(strings)
+                strings.append(value)
+            return index
+
+        ids = array('q', (facility['id'] for facility in rows))
+        lats = array('d', (facility['latitude'] for facility in rows))
+        lons = array('d', (facility['longitude'] for facility in rows))
+        string_columns = {
+            field: array('I', (intern(facility[field]) for facility in rows))
+            for field in STRING_FIELDS
+        }
+        return FacilitySnapshot(ids, lats, lons, string_columns, strings, self.cell_size)
+
+
+def import_overpass_json(path, builder):
+    """Add the elements of an Overpass JSON dump to a builder"""
+    with open(path, 'rb') as f:
+        for element in iter_json_array(iter(lambda: f.read(CHUNK_SIZE), b''), 'elements'):
+            builder.add_element(element)
+
+
+def import_pbf(path, builder):
+    """Add the facility nodes and ways of an .osm.pbf extract to a builder"""
+    try:
+        import osmium
+    except ImportError:
+        raise SnapshotError('Importing .pbf extracts requires the osmium package (pip install osmium)')
+
+    class FacilityHandler(osmium.SimpleHandler):
+        def node(self, node):
+            tags = dict(node.tags)
+            if is_facility(tags) and node.location.valid():
+                builder.add_element({
+                    'type': 'node',
+                    'id': node.id,
+                    'lat': node.location.lat,
+                    'lon': node.location.lon,
+                    'tags': tags
+                })
+
+        def way(self, way):
+            tags = dict(way.tags)
+            if not is_facility(tags):
+                return
+            locations = [n.location for n in way.nodes if n.location.valid()]
+            if not locations:
+                return
+            builder.add_element({
+                'type': 'way',
+                'id': way.id,
+                'center': {
+                    'lat': sum(loc.lat for loc in locations) / len(locations),
+                    'lon': sum(loc.lon for loc in locations) / len(locations)
+                },
+                'tags': tags
+            })
+
+    FacilityHandler().apply_file(path, locations=True)
+
+
+def build_snapshot(input_path, cell_size=DEFAULT_CELL_SIZE):
+    """Build a snapshot from an OSM extract or Overpass JSON dump"""
+    builder = SnapshotBuilder(cell_size)
+    if input_path.endswith('.pbf'):
+        import_pbf(input_path, builder)
+    else:
+        import_overpass_json(input_path, builder)
+    return builder.build()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Build and inspect offline facility snapshots')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    import_parser = subparsers.add_parser('import', help='Import an OSM extract or Overpass JSON dump')
+    import_parser.add_argument('input', help='.osm.pbf extract or Overpass JSON dump')
+    import_parser.add_argument('-o', '--output', default='facilities.snap', help='Snapshot file to write')
+    import_parser.add_argument('--cell-size', type=float, default=DEFAULT_CELL_SIZE, help='Grid cell size in degrees')
+
+    info_parser = subparsers.add_parser('info', help='Show snapshot statistics')
+    info_parser.add_argument('snapshot', help='Snapshot file to inspect')
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'import':
+        snapshot = build_snapshot(args.input, args.cell_size)
+        snapshot.save(args.output)
+        print(f"✅ Wrote {len(snapshot)} facilities to {args.output}")
+    else:
+        snapshot = FacilitySnapshot.load(args.snapshot)
+        print(f"📊 Facilities: {len(snapshot)}")
+        print(f"📊 Distinct strings: {len(snapshot.strings)}")
+        print(f"📊 Bounds: {snapshot.bounds}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+"""
+In-memory spatial index for point lookups by radius
+"""
+import math
+import threading
+import time
+from collections import defaultdict
+
+from geo import bounding_box, haversine_m
+
+
+class GridIndex:
+    """Uniform lat/lon grid mapping cells to the ids of points inside them"""
+
+    def __init__(self, cell_size_deg=0.05):
+        self.cell_size = cell_size_deg
+        self._columns = int(math.ceil(360.0 / cell_size_deg))
+        self._cells = defaultdict(set)
+        self._points = {}
+        self._lock = threading.RLock()
+        self.built_at = None
+        self.version = None  # the owner's data version the index was built from
+
+    def __len__(self):
+        return len(self._points)
+
+    def __contains__(self, item_id):
+        return item_id in self._points
+
+    def _cell(self, lat, lon):
+        row = int(math.floor(lat / self.cell_size))
+        col = int(math.floor((lon + 180.0) / self.cell_size)) % self._columns
+        return (row, col)
+
+    def rebuild(self, rows, version=None):
+        """Replace the index contents with an iterable of (id, lat, lon) read at `version`"""
+        cells = defaultdict(set)
+        points = {}
+        for item_id, lat, lon in rows:
+            if lat is None or lon is None:
+                continue
+            cell = self._cell(lat, lon)
+            cells[cell].add(item_id)
+            points[item_id] = (lat, lon, cell)
+        with self._lock:
+            self._cells = cells
+            self._points = points
+            self.built_at = time.time()
+            self.version = version
+
+    def invalidate(self):
+        """Mark the index stale so the owner rebuilds it before the next query"""
+        self.built_at = None
+
+    def insert(self, item_id, lat, lon):
+        """Add a point, moving it if the id is already indexed"""
+        with self._lock:
+            self._discard(item_id)
+            if lat is None or lon is None:
+                return
+            cell = self._cell(lat, lon)
+            self._cells[cell].add(item_id)
+            self._points[item_id] = (lat, lon, cell)
+
+    def remove(self, item_id):
+        with self._lock:
+            self._discard(item_id)
+
+    def _discard(self, item_id):
+        point = self._points.pop(item_id, None)
+        if point is None:
+            return
+        bucket = self._cells.get(point[2])
+        if bucket is not None:
+            bucket.discard(item_id)
+            if not bucket:
+                del self._cells[point[2]]
+
+    def query_radius(self, lat, lon, radius_m):
+        """Return [(id, distance_m)] of points within radius, nearest first"""
+        min_lat, min_lon, max_lat, max_lon = bounding_box(lat, lon, radius_m)
+        min_row = int(math.floor(min_lat / self.cell_size))
+        max_row = int(math.floor(max_lat / self.cell_size))
+        min_col = int(math.floor((min_lon + 180.0) / self.cell_size))
+        max_col = int(math.floor((max_lon + 180.0) / self.cell_size))
+        if max_col - min_col >= self._columns:
+            min_col, max_col = 0, self._columns - 1
+
+        results = []
+        with self._lock:
+            for row in range(min_row, max_row + 1):
+                for col in range(min_col, max_col + 1):
+                    bucket = self._cells.get((row, col % self._columns))
+                    if not bucket:
+                        continue
+                    for item_id in bucket:
+                        point_lat, point_lon, _ = self._points[item_id]
+                        if point_lat < min_lat or point_lat > max_lat:
+                            continue
+                        distance = haversine_m(lat, lon, point_lat, point_lon)
+                        if distance <= radius_m:
+                            results.append((item_id, distance))
+        results.sort(key=lambda item: item[1])
+        return results
@@ -0,0 +1,145 @@
+"""
+Incremental JSON parsing and streamed JSON/NDJSON responses
+
+Overpass payloads are parsed one element at a time from the HTTP body
+chunks (with ijson when installed, otherwise with an incremental
+raw_decode scanner), so the full response text is never held in memory.
+"""
+import codecs
+import json
+import re
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+from serializers import dumps
+
+CHUNK_SIZE = 64 * 1024
+
+_decoder = json.JSONDecoder()
+_ARRAY_START = re.compile(r'\s*:\s*\[')
+_ARRAY_START_PARTIAL = re.compile(r'\s*(:\s*)?')
+_SEPARATORS = ' \t\n\r,'
+
+
+class _ChunkReader:
+    """File-like wrapper over an iterator of byte chunks"""
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._buffer = b''
+
+    def read(self, size=-1):
+        while size < 0 or len(self._buffer) < size:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                break
+            self._buffer += chunk
+        if size < 0:
+            data, self._buffer = self._buffer, b''
+        else:
+            data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+
+def iter_json_array(chunks, key):
+    """Yield the items of the top-level array `key` from an iterable of byte chunks"""
+    if ijson is not None:
+        try:
+            yield from ijson.items(_ChunkReader(chunks), f'{key}.item', use_float=True)
+        except ijson.JSONError as e:
+            raise ValueError(str(e))
+        return
+
+    chunks = iter(chunks)
+    text_decoder = codecs.getincrementaldecoder('utf-8')()
+    buffer = ''
+
+    def read_more():
+        nonlocal buffer
+        for chunk in chunks:
+            if chunk:
+                buffer += text_decoder.decode(chunk) if isinstance(chunk, bytes) else chunk
+                return True
+        return False
+
+    # Find the opening bracket of the array
+    marker = f'"{key}"'
+    search_from = 0
+    while True:
+        index = buffer.find(marker, search_from)
+        if index == -1:
+            search_from = max(0, len(buffer) - len(marker))
+            if not read_more():
+                return
+            continue
+        after = index + len(marker)
+        match = _ARRAY_START.match(buffer, after)
+        if match:
+            buffer = buffer[match.end():]
+            break
+        if _ARRAY_START_PARTIAL.fullmatch(buffer, after):
+            if not read_more():
+                return
+            continue
+        search_from = index + 1
+
+    position = 0
+    while True:
+        while position < len(buffer) and buffer[position] in _SEPARATORS:
+            position += 1
+        if position == len(buffer):
+            buffer = ''
+            position = 0
+            if not read_more():
+                raise ValueError(f'Unexpected end of JSON while reading "{key}"')
+            continue
+        if buffer[position] == ']':
+            return
+        try:
+            item, end = _decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            if not read_more():
+                raise
+            continue
+        yield item
+        buffer = buffer[end:]
+        position = 0
+
+
+def iter_json_response(meta, key, items):
+    """Yield a JSON object made of `meta` plus `key` holding the streamed items"""
+    head = dumps(meta)
+    yield (head[:-1] + (',' if meta else '') + f'"{key}":[')
+    batch = []
+    size = 0
+    first = True
+    for item in items:
+        encoded = dumps(item)
+        batch.append(encoded if first else ',' + encoded)
+        first = False
+        size += len(encoded)
+        if size >= CHUNK_SIZE:
+            yield ''.join(batch)
+            batch = []
+            size = 0
+    batch.append(']}')
+    yield ''.join(batch)
+
+
+def iter_ndjson(items):
+    """Yield items as newline-delimited JSON"""
+    batch = []
+    size = 0
+    for item in items:
+        encoded = dumps(item) + '\n'
+        batch.append(encoded)
+        size += len(encoded)
+        if size >= CHUNK_SIZE:
+            yield ''.join(batch)
+            batch = []
+            size = 0
+    if batch:
+        yield ''.join(batch)
@@ -0,0 +1,9 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Importing app builds a default app; keep it away from files in the working directory
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+os.environ.setdefault('NEARBY_LAST_GOOD_PATH', '')
+os.environ.setdefault('NEARBY_PREFETCH_PATH', '')
@@ -0,0 +1,47 @@
+import pytest
+
+
+@pytest.fixture
+def application(tmp_path, monkeypatch):
+    import app as application
+    from config import Config
+
+    overrides = {'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + str(tmp_path / 'test.db'), 'RATE_LIMIT_PER_IP': 0,
+                 'NEARBY_SNAPSHOT_PATH': ''}
+    monkeypatch.setattr(application, 'app', application.create_app(type('TestConfig', (Config,), overrides)))
+    yield application
+    application.notification_dispatcher.stop()
+
+
+def create(client, name, lat=40.7, lon=-74.0):
+    response = client.post('/api/hospitals', json={'name': name, 'type': 'hospital', 'latitude': lat, 'longitude': lon})
+    return response.json['hospital']['id']
+
+
+def test_own_writes_update_the_grid_without_a_rebuild(application, monkeypatch):
+    client = application.app.test_client()
+    create(client, 'A')
+    with application.app.test_request_context():
+        assert [h.name for h in application.hospitals_within(40.7, -74.0, 1000)] == ['A']
+
+    rebuilds = []
+    rebuild = application.hospital_index.rebuild
+    monkeypatch.setattr(application.hospital_index, 'rebuild', lambda *args: rebuilds.append(1) or rebuild(*args))
+    hospital_id = create(client, 'B', lat=40.701)
+    client.put(f"/api/hospitals/{hospital_id.split('_')[1]}", json={'latitude': 40.702})
+    with application.app.test_request_context():
+        assert [h.name for h in application.hospitals_within(40.7, -74.0, 1000)] == ['A', 'B']
+    assert rebuilds == []
+
+
+def test_writes_by_another_worker_trigger_a_rebuild(application):
+    client = application.app.test_client()
+    create(client, 'A')
+    with application.app.test_request_context():
+        application.hospitals_within(40.7, -74.0, 1000)
+        # Another worker's insert: committed with a bump, but not applied to this worker's index
+        db = application.db
+        db.session.add(application.Hospital(name='Remote', type='hospital', latitude=40.7, longitude=-74.0))
+        application.bump_version('hospital')
+        db.session.commit()
+        assert sorted(h.name for h in application.hospitals_within(40.7, -74.0, 1000)) == ['A', 'Remote']
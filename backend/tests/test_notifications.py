@@ -0,0 +1,72 @@
+from types import SimpleNamespace
+
+import pytest
+
+from notifications import FirebaseProvider
+from ratelimit import TokenBucket
+
+
+class FakeMessaging:
+    """Stands in for firebase_admin.messaging; topics named 'bad' fail"""
+
+    def __init__(self):
+        self.calls = []
+
+    def Message(self, topic, notification):
+        return topic
+
+    def Notification(self, title, body):
+        return None
+
+    def send_each(self, batch, app=None):
+        self.calls.append(len(batch))
+        return SimpleNamespace(responses=[
+            SimpleNamespace(success=topic != 'bad', exception=ValueError(f'{topic} rejected')) for topic in batch
+        ])
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def firebase(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr('ratelimit.time', clock)
+    provider = FirebaseProvider('project', rate_per_second=2)
+    messaging = FakeMessaging()
+    monkeypatch.setattr(provider, '_messaging', lambda: messaging)
+    return provider, messaging, clock
+
+
+def message(recipient):
+    return SimpleNamespace(recipient=recipient, subject='Alert', body='Help')
+
+
+def test_firebase_batches_stay_within_the_rate(firebase):
+    provider, messaging, clock = firebase
+
+    errors = provider.send_batch([message('ok')] * 4 + [message('bad')])
+
+    assert messaging.calls == [2, 2, 1]
+    assert clock.now == pytest.approx(1.5)  # a full bucket of 2, then 3 more at 2 per second
+    assert errors == [None] * 4 + ['bad rejected']
+
+
+def test_firebase_send_raises_when_the_message_failed(firebase):
+    provider, _, _ = firebase
+    provider.send(message('ok'))
+    with pytest.raises(RuntimeError, match='bad rejected'):
+        provider.send(message('bad'))
+
+
+def test_bucket_refuses_more_tokens_than_it_holds():
+    with pytest.raises(ValueError):
+        TokenBucket(2).acquire(3)
@@ -0,0 +1,114 @@
+from datetime import datetime, timezone
+
+import pytest
+
+from opening_hours import (
+    ALWAYS_OPEN, MINUTES_PER_DAY, MINUTES_PER_WEEK, OpeningHoursError, ScheduleCache, compile_schedule, is_open,
+    minute_of_week, parse
+)
+
+MO, TU, WE, TH, FR, SA, SU = range(7)
+
+
+def at(day, clock):
+    hours, minutes = map(int, clock.split(':'))
+    return day * MINUTES_PER_DAY + hours * 60 + minutes
+
+
+def test_always_open():
+    assert parse('24/7') == [(0, MINUTES_PER_WEEK)]
+    assert compile_schedule('24/7') == ALWAYS_OPEN
+    # Whole days back to back merge into one week-long interval
+    assert compile_schedule('Mo-Su 00:00-24:00') == ALWAYS_OPEN
+
+
+def test_day_range_wraps_around_the_week():
+    bitmap = compile_schedule('Fr-Mo 09:00-17:00')
+    for day in (FR, SA, SU, MO):
+        assert is_open(bitmap, at(day, '12:00'))
+    for day in (TU, WE, TH):
+        assert not is_open(bitmap, at(day, '12:00'))
+
+
+def test_span_past_midnight_carries_into_next_day():
+    bitmap = compile_schedule('Sa 22:00-06:00')
+    assert not is_open(bitmap, at(SA, '21:55'))
+    assert is_open(bitmap, at(SA, '22:00'))
+    assert is_open(bitmap, at(SU, '05:55'))
+    assert not is_open(bitmap, at(SU, '06:00'))
+
+
+def test_span_past_midnight_wraps_sunday_into_monday():
+    assert parse('Su 22:00-06:00') == [(at(MO, '00:00'), at(MO, '06:00')), (at(SU, '22:00'), MINUTES_PER_WEEK)]
+    bitmap = compile_schedule('Su 22:00-06:00')
+    assert is_open(bitmap, at(SU, '23:59'))
+    assert is_open(bitmap, at(MO, '05:59'))
+    assert not is_open(bitmap, at(MO, '06:00'))
+    assert not is_open(bitmap, at(SA, '23:00'))
+
+
+def test_later_rule_replaces_earlier_days():
+    bitmap = compile_schedule('Mo-Fr 08:00-18:00; Fr off; Sa 10:00-12:00,13:00-14:00')
+    assert is_open(bitmap, at(TH, '17:55'))
+    assert not is_open(bitmap, at(TH, '18:00'))
+    assert not is_open(bitmap, at(FR, '12:00'))
+    assert is_open(bitmap, at(SA, '11:00'))
+    assert not is_open(bitmap, at(SA, '12:30'))
+
+
+@pytest.mark.parametrize('value', ['', 'PH off', 'Mo-Fr 08:00-25:00', 'Mo 8am-5pm', 'Jan-Mar 10:00-12:00'])
+def test_unsupported_values_are_unknown(value):
+    with pytest.raises(OpeningHoursError):
+        parse(value)
+    assert compile_schedule(value) is None
+    assert not is_open(None, at(MO, '12:00'))
+
+
+def test_minute_of_week_uses_wall_clock_time():
+    assert minute_of_week(datetime(2025, 10, 26, 23, 30)) == at(SU, '23:30')  # a Sunday
+    assert minute_of_week(datetime(2025, 10, 27, 0, 0)) == 0
+
+
+def test_schedule_cache_recompiles_on_change():
+    cache = ScheduleCache(max_entries=2)
+    first = cache.get('custom_1', '24/7')
+    assert cache.get('custom_1', '24/7') is first
+    assert cache.compiled == 1
+    assert not is_open(cache.get('custom_1', 'Mo 08:00-09:00'), at(TU, '08:30'))
+    assert cache.compiled == 2
+    cache.get('custom_2', '24/7')
+    cache.get('custom_3', '24/7')
+    assert len(cache) == 2
+
+
+def test_open_now_reads_the_clock_in_the_client_time_zone(tmp_path, monkeypatch):
+    import app as application
+    from config import Config
+
+    class FixedClock(datetime):
+        @classmethod
+        def now(cls, tz=None):
+            instant = datetime(2025, 10, 27, 7, 30, tzinfo=timezone.utc)  # Monday 07:30 UTC
+            return instant.astimezone(tz) if tz is not None else instant.replace(tzinfo=None)
+
+    overrides = {'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + str(tmp_path / 'test.db'), 'RATE_LIMIT_PER_IP': 0,
+                 'OPENING_HOURS_TIMEZONE': 'America/New_York'}
+    monkeypatch.setattr(application, 'app', application.create_app(type('TestConfig', (Config,), overrides)))
+    monkeypatch.setattr(application, 'datetime', FixedClock)
+    try:
+        client = application.app.test_client()
+        client.post('/api/hospitals', json={'name': 'Clinic', 'type': 'clinic', 'latitude': 52.5, 'longitude': 13.4,
+                                            'opening_hours': 'Mo-Fr 08:00-18:00'})
+
+        def open_names(**args):
+            response = client.get('/api/hospitals', query_string={'open_now': 'true', **args})
+            assert response.status_code == 200
+            return [hospital['name'] for hospital in response.json['hospitals']]
+
+        assert open_names(tz='Europe/Berlin') == ['Clinic']  # 08:30 in Berlin
+        assert open_names(tz='+01:00') == ['Clinic']
+        assert open_names(tz='UTC') == []
+        assert open_names() == []  # 03:30 in OPENING_HOURS_TIMEZONE
+        assert client.get('/api/hospitals?open_now=true&tz=Mars/Base').status_code == 400
+    finally:
+        application.notification_dispatcher.stop()
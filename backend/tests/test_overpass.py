@@ -0,0 +1,44 @@
+import socket
+
+import pytest
+
+from overpass import OverpassClient, OverpassError, OverpassUnavailable
+
+
+@pytest.fixture
+def refused_url():
+    # A port that was just free: nothing listens there, so connecting is refused
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+    return f'http://127.0.0.1:{port}/api/interpreter'
+
+
+def test_refused_connection_raises_overpass_error(refused_url):
+    client = OverpassClient([refused_url], timeout=2, max_retries=1, backoff_base=0.01)
+    with pytest.raises(OverpassUnavailable) as raised:
+        client.query('[out:json];node(1);out;')
+    assert isinstance(raised.value, OverpassError)
+
+
+def test_nearby_degrades_when_overpass_is_unreachable(tmp_path, refused_url):
+    import app as application
+    from config import Config
+
+    overrides = {
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + str(tmp_path / 'test.db'),
+        'OVERPASS_API_URL': refused_url,
+        'OVERPASS_MIRRORS': [],
+        'OVERPASS_MAX_RETRIES': 0,
+        'NEARBY_SNAPSHOT_PATH': '',
+        'RATE_LIMIT_PER_IP': 0
+    }
+    app = application.create_app(type('TestConfig', (Config,), overrides))
+    client = app.test_client()
+    client.post('/api/hospitals', json={'name': 'Local', 'type': 'hospital', 'latitude': 40.7, 'longitude': -74.0})
+
+    response = client.get('/api/nearby?lat=40.7&lon=-74.0&radius=5000')
+    assert response.status_code == 200
+    assert response.json['degraded'] is True
+    assert [facility['name'] for facility in response.json['facilities']] == ['Local']
+    application.notification_dispatcher.stop()
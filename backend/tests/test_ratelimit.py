@@ -0,0 +1,17 @@
+from ratelimit import ConcurrencyLimiter
+
+
+def test_reserved_slots_are_left_for_priority_callers():
+    limiter = ConcurrencyLimiter(4, reserved=1)
+
+    assert all(limiter.try_acquire(timeout=0) for _ in range(3))
+    assert not limiter.try_acquire(timeout=0)
+    assert limiter.try_acquire(timeout=0, priority=True)
+    assert limiter.try_acquire(timeout=0, priority=True)  # priority callers are never turned away
+    assert limiter.stats()['active'] == 5
+
+    for _ in range(2):
+        limiter.release()
+    assert not limiter.try_acquire(timeout=0)  # priority holders still count towards the cap
+    limiter.release()
+    assert limiter.try_acquire(timeout=0)
@@ -0,0 +1,38 @@
+import time
+
+from routing import SpeedModel, nearest_facilities
+
+
+def facility(n, lat=40.7, lon=-74.0):
+    return {'id': n, 'name': f'H{n}', 'type': 'hospital', 'latitude': lat, 'longitude': lon}
+
+
+def test_nearest_first_and_stops_at_limit():
+    def source(lat, lon, radius):
+        return [facility(1, 40.71), facility(2, 40.701), facility(3, 40.72), facility(4, 41.5)]
+
+    routes, complete = nearest_facilities(40.7, -74.0, [source], lambda f: True, SpeedModel(),
+                                          limit=2, radii=[5000, 50000], budget=1.0)
+    assert complete
+    assert [route['id'] for route in routes] == [2, 1]
+    assert routes[0]['eta_seconds'] < routes[1]['eta_seconds']
+
+
+def test_budget_is_checked_inside_a_source():
+    calls = []
+
+    def slow_source(lat, lon, radius):
+        for n in range(100000):
+            time.sleep(0.0001)
+            yield facility(n, lat=41.0)  # outside every ring, so the search never has enough
+
+    def never_reached(lat, lon, radius):
+        calls.append(radius)
+        return []
+
+    started = time.monotonic()
+    routes, complete = nearest_facilities(40.7, -74.0, [slow_source, never_reached], lambda f: True, SpeedModel(),
+                                          limit=3, radii=[5000, 15000], budget=0.05)
+    assert time.monotonic() - started < 0.5
+    assert not complete
+    assert routes == [] and calls == []
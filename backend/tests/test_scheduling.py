@@ -0,0 +1,79 @@
+from datetime import date, datetime
+from types import SimpleNamespace
+
+import pytest
+
+from scheduling import SchedulingError, booked_per_slot, iter_slots, parse_rules, slot_for
+
+MONDAY = date(2025, 10, 27)
+
+
+def rules(*items):
+    return [SimpleNamespace(**rule) for rule in parse_rules(list(items), max_duration_minutes=240)]
+
+
+def test_overlapping_windows_on_the_same_day_are_rejected():
+    with pytest.raises(SchedulingError):
+        parse_rules([{'opens_at': '08:00', 'closes_at': '12:00'}, {'opens_at': '11:00', 'closes_at': '14:00'}], 240)
+    # Back to back is fine, and so is a weekday rule over an every-day rule
+    parse_rules([{'opens_at': '08:00', 'closes_at': '12:00'}, {'opens_at': '12:00', 'closes_at': '14:00'},
+                 {'weekday': 0, 'opens_at': '09:00', 'closes_at': '10:00'}], 240)
+
+
+def test_weekday_rules_replace_every_day_rules():
+    schedule = rules({'opens_at': '08:00', 'closes_at': '10:00', 'slot_minutes': 60},
+                     {'weekday': 0, 'opens_at': '14:00', 'closes_at': '15:00', 'slot_minutes': 30})
+    starts = [start for start, _, _ in iter_slots(schedule, MONDAY, date(2025, 10, 28))]
+    assert starts == [datetime(2025, 10, 27, 14, 0), datetime(2025, 10, 27, 14, 30),
+                      datetime(2025, 10, 28, 8, 0), datetime(2025, 10, 28, 9, 0)]
+
+
+def test_slot_for_accepts_only_slot_starts_inside_the_window():
+    schedule = rules({'opens_at': '08:00', 'closes_at': '09:45', 'slot_minutes': 30, 'capacity': 3})
+    assert slot_for(schedule, datetime(2025, 10, 27, 8, 0)) == (datetime(2025, 10, 27, 8, 30), 3)
+    assert slot_for(schedule, datetime(2025, 10, 27, 9, 0)) == (datetime(2025, 10, 27, 9, 30), 3)
+    assert slot_for(schedule, datetime(2025, 10, 27, 8, 15)) is None  # not on the slot grid
+    assert slot_for(schedule, datetime(2025, 10, 27, 9, 30)) is None  # would end after closing
+    assert slot_for(schedule, datetime(2025, 10, 27, 7, 30)) is None
+
+
+def test_booked_per_slot_counts_half_open_overlaps():
+    slots = [(datetime(2025, 10, 27, hour, 0), datetime(2025, 10, 27, hour + 1, 0), 2) for hour in (8, 9, 10)]
+    intervals = [
+        (datetime(2025, 10, 27, 7, 0), datetime(2025, 10, 27, 8, 0)),    # ends as the first slot starts
+        (datetime(2025, 10, 27, 8, 30), datetime(2025, 10, 27, 10, 0)),  # spans two slots
+        (datetime(2025, 10, 27, 9, 0), datetime(2025, 10, 27, 10, 0)),
+        (datetime(2025, 10, 27, 11, 0), datetime(2025, 10, 27, 12, 0)),  # starts as the last slot ends
+    ]
+    booked = [count for _, _, _, count in booked_per_slot(slots, intervals)]
+    assert booked == [1, 2, 0]
+
+
+@pytest.fixture
+def client(tmp_path):
+    import app as application
+    from config import Config
+
+    overrides = {'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + str(tmp_path / 'test.db'), 'RATE_LIMIT_PER_IP': 0}
+    app = application.create_app(type('TestConfig', (Config,), overrides))
+    yield app.test_client()
+    application.notification_dispatcher.stop()
+
+
+def test_booking_up_to_capacity_then_409(client):
+    hospital = client.post('/api/hospitals', json={'name': 'H', 'type': 'hospital', 'latitude': 1, 'longitude': 2})
+    hospital_id = int(hospital.json['hospital']['id'].split('_')[1])
+    response = client.put(f'/api/hospitals/{hospital_id}/capacity',
+                          json={'rules': [{'opens_at': '08:00', 'closes_at': '12:00', 'capacity': 2}]})
+    assert response.status_code == 200
+
+    def book(start_at):
+        return client.post('/api/appointments', json={
+            'name': 'A', 'phone': '1', 'reason': 'Checkup', 'hospital_id': hospital_id, 'start_at': start_at
+        }).status_code
+
+    assert book('2025-10-27T09:00') == 201
+    assert book('2025-10-27T09:00') == 201  # exactly at capacity
+    assert book('2025-10-27T09:00') == 409
+    assert book('2025-10-27T09:30') == 201  # the next slot is unaffected
+    assert book('2025-10-27T09:10') == 400  # not a slot start
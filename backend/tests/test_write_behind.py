@@ -0,0 +1,161 @@
+import json
+import os
+import threading
+import time
+
+import pytest
+
+
+@pytest.fixture
+def start_app(tmp_path, monkeypatch):
+    """Start the app with write-behind on; a second call is a restart on the same database and journal"""
+    import app as application
+    from config import Config
+
+    overrides = {
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + str(tmp_path / 'test.db'),
+        'RATE_LIMIT_PER_IP': 0,
+        'NEARBY_SNAPSHOT_PATH': '',
+        'WRITE_BEHIND_ENABLED': True,
+        'WRITE_BEHIND_JOURNAL_DIR': str(tmp_path / 'journal'),
+        'WRITE_BEHIND_INTERVAL': 0.3,
+        'WRITE_BEHIND_FSYNC': False
+    }
+
+    def start():
+        if application.write_behind is not None:
+            application.write_behind.stop()
+        monkeypatch.setattr(application, 'app', application.create_app(type('TestConfig', (Config,), overrides)))
+        with application.app.app_context():
+            application.schema.ensure()
+        application.app.test_client().get('/api/health')  # the first request starts the flusher
+        return application
+
+    yield start
+    application.write_behind.stop()
+    application.notification_dispatcher.stop()
+
+
+@pytest.fixture
+def application(start_app):
+    return start_app()
+
+
+def write_segment(directory, records, name='segment-00000001.log'):
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, name), 'w') as f:
+        for record in records:
+            f.write(json.dumps(record) + '\n')
+
+
+def appointment_record(segment, row_id, name):
+    values = {'id': row_id, 'name': name, 'phone': '1', 'date': 'x', 'reason': 'r', 'facility_name': None,
+              'hospital_id': None, 'start_at': None, 'end_at': None, 'created_at': '2025-10-27T09:00:00'}
+    return {'table': 'appointment', 'segment': segment, 'values': values}
+
+
+def book(client, **fields):
+    body = {'name': 'A', 'phone': '1', 'reason': 'Checkup', 'date': '2025-10-27T09:00'}
+    body.update(fields)
+    response = client.post('/api/appointments', json=body)
+    assert response.status_code == 201
+    return response.json['appointment']['id']
+
+
+def wait_for_flush(application):
+    deadline = time.monotonic() + 5
+    while application.write_behind.pending() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    time.sleep(0.05)
+
+
+def wait_for_rows(application, count):
+    deadline = time.monotonic() + 5
+    while len(names(application)) < count and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return names(application)
+
+
+def test_listing_etag_changes_when_a_lower_id_is_flushed(application):
+    client = application.app.test_client()
+    hospital = client.post('/api/hospitals', json={'name': 'H', 'type': 'hospital', 'latitude': 1, 'longitude': 2})
+    hospital_id = int(hospital.json['hospital']['id'].split('_')[1])
+    wait_for_flush(application)
+
+    journaled = book(client)
+    booked = book(client, hospital_id=hospital_id, start_at='2025-10-27T09:00')
+    assert journaled < booked
+    first = client.get('/api/admin/appointments')
+    assert first.json['count'] == 1
+
+    wait_for_flush(application)
+    second = client.get('/api/admin/appointments', headers={'If-None-Match': first.headers['ETag']})
+    assert second.status_code == 200
+    assert second.json['count'] == 2
+
+
+def names(application):
+    with application.app.app_context():
+        return sorted((row.id, row.name) for row in application.Appointment.query)
+
+
+def test_replay_skips_applied_segments_and_keeps_colliding_rows(start_app, tmp_path):
+    application = start_app()
+    client = application.app.test_client()
+    first = book(client, name='Acknowledged')
+    wait_for_flush(application)
+    application.write_behind.stop()
+
+    slot = str(tmp_path / 'journal' / 'slot-0')
+    with application.app.app_context():
+        applied = application.JournalSegment.query.one().token
+    write_segment(slot, [
+        appointment_record(applied, first, 'Acknowledged'),      # committed before the crash
+        appointment_record('f' * 32, first, 'Never applied')     # same id, a different row
+    ], name='segment-00000099.log')
+
+    application = start_app()
+    rows = wait_for_rows(application, 2)
+    assert [name for _, name in rows] == ['Acknowledged', 'Never applied']
+    assert rows[0][0] == first and rows[1][0] != first
+
+
+def test_segments_of_dead_workers_are_replayed(start_app, tmp_path):
+    write_segment(str(tmp_path / 'journal' / 'slot-3'), [appointment_record('a' * 32, 5000, 'Orphaned')])
+    application = start_app()
+    assert wait_for_rows(application, 1) == [(5000, 'Orphaned')]
+    application.write_behind.stop()
+    assert not [name for name in os.listdir(tmp_path / 'journal' / 'slot-3') if name.startswith('segment-')]
+
+
+def test_background_threads_start_on_the_first_request(tmp_path, monkeypatch):
+    import app as application
+    from config import Config
+
+    def threads():
+        return {thread.name for thread in threading.enumerate()} & {'write-behind', 'notification-dispatcher'}
+
+    overrides = {'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + str(tmp_path / 'test.db'), 'NOTIFICATIONS_FAKE': True,
+                 'WRITE_BEHIND_ENABLED': True, 'WRITE_BEHIND_JOURNAL_DIR': str(tmp_path / 'journal')}
+    monkeypatch.setattr(application, 'app', application.create_app(type('TestConfig', (Config,), overrides)))
+    try:
+        assert threads() == set()
+        application.app.test_client().get('/api/health')
+        assert threads() == {'write-behind', 'notification-dispatcher'}
+    finally:
+        application.write_behind.stop()
+        application.notification_dispatcher.stop()
+
+    overrides['BACKGROUND_THREADS'] = False
+    monkeypatch.setattr(application, 'app', application.create_app(type('TestConfig', (Config,), overrides)))
+    try:
+        client = application.app.test_client()
+        client.get('/api/health')
+        assert application.write_behind is None
+        # Without a dispatcher thread the alert's notifications go out inside the request
+        assert client.post('/api/emergency', json={'latitude': 40.7, 'longitude': -74.0}).status_code == 201
+        assert threads() == set()
+        with application.app.app_context():
+            assert {row.status for row in application.NotificationOutbox.query} == {'sent'}
+    finally:
+        application.notification_dispatcher.stop()
@@ -0,0 +1,359 @@
+"""
+Write-behind group commit for appointment inserts
+
+With WRITE_BEHIND_ENABLED, a request does not insert its row itself. It
+takes an id from a block reserved in advance, appends the row to a local
+journal and returns once the journal is fsynced. Concurrent requests share
+one fsync: whoever syncs first flushes every line written before it. A
+background thread inserts the pending rows in one transaction every
+WRITE_BEHIND_INTERVAL seconds, or as soon as WRITE_BEHIND_BATCH_SIZE rows
+are waiting.
+
+The journal is a directory of segment files of JSON lines. Before each
+flush the active segment is closed and a new one started, and the closed
+segments are deleted once their rows are committed. Every record carries
+the random token of its segment, and the flush records the tokens it
+applied in the same transaction as the rows, so replaying a segment that
+did commit (a crash between commit and delete) inserts nothing twice. On
+startup, segments left by a crash are replayed first. Each process locks
+its own slot directory under the journal directory, so several workers can
+share one WRITE_BEHIND_JOURNAL_DIR; a starting worker replays its own slot
+and every other slot whose owner has died.
+
+Ids come from IdAllocator, which reserves blocks of WRITE_BEHIND_ID_BLOCK ids
+per table in the id_block table (starting past the table's current maximum),
+so workers never hand out the same id. Every insert into a journaled table
+must then take its id from the allocator.
+"""
+import atexit
+import glob
+import json
+import logging
+import os
+import threading
+import uuid
+from datetime import datetime
+
+from sqlalchemy import DateTime, case, func, insert, select, update
+from sqlalchemy.exc import IntegrityError
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+def _try_lock(path):
+    """An exclusive flock on a slot directory's lock file, or None if another process holds it"""
+    lock_file = open(os.path.join(path, 'lock'), 'a')
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
+        return None
+    return lock_file
+
+
+def encode_row(values):
+    """Row values as JSON-safe values; datetimes become ISO strings"""
+    return {key: value.isoformat() if isinstance(value, datetime) else value for key, value in values.items()}
+
+
+def decode_row(table, values):
+    """Inverse of encode_row for the columns of a table"""
+    row = dict(values)
+    for column in table.columns:
+        value = row.get(column.name)
+        if isinstance(value, str) and isinstance(column.type, DateTime):
+            row[column.name] = datetime.fromisoformat(value)
+    return row
+
+
+class IdAllocator:
+    """Hands out ids for a table from blocks reserved in the id_block table"""
+
+    def __init__(self, db, table, block_table, block_size=1000):
+        self.db = db
+        self.table = table
+        self.block_table = block_table
+        self.block_size = block_size
+        self._next = 0
+        self._end = 0
+        self._lock = threading.Lock()
+
+    def next_id(self):
+        """The next id; reserving a new block needs an app context"""
+        with self._lock:
+            if self._next >= self._end:
+                self._next, self._end = self._reserve()
+            value = self._next
+            self._next += 1
+            return value
+
+    def _reserve(self):
+        blocks = self.block_table
+        name = self.table.name
+        # Past both the last reservation and any row inserted without the allocator
+        floor = select(func.coalesce(func.max(self.table.c.id), 0) + 1).scalar_subquery()
+        for _ in range(3):
+            try:
+                with self.db.engine.begin() as connection:
+                    result = connection.execute(
+                        update(blocks).where(blocks.c.name == name).values(
+                            next_id=case((blocks.c.next_id > floor, blocks.c.next_id), else_=floor) + self.block_size)
+                    )
+                    if result.rowcount == 0:
+                        connection.execute(insert(blocks).values(name=name, next_id=floor + self.block_size))
+                    end = connection.execute(select(blocks.c.next_id).where(blocks.c.name == name)).scalar_one()
+                return end - self.block_size, end
+            except IntegrityError:
+                # Another process created the row first; update it instead
+                continue
+        raise RuntimeError(f'Could not reserve ids for {name}')
+
+
+class WriteJournal:
+    """Append-only segment files in a slot directory owned by this process"""
+
+    def __init__(self, directory, fsync=True):
+        self.fsync = fsync
+        self._orphan_locks = []
+        self.directory = self._claim_slot(directory)
+        own = sorted(glob.glob(os.path.join(self.directory, 'segment-*.log')))
+        self._segment = int(os.path.basename(own[-1])[8:-4]) if own else 0
+        self.recovered = self._claim_orphans(directory) + own
+        self._file = None
+        self.closed = False
+        self._written = 0
+        self._synced = 0
+        self._sync_lock = threading.Lock()
+        self._open_segment()
+
+    def _claim_slot(self, directory):
+        """Lock the first free slot-N subdirectory for the life of the process"""
+        slot = 0
+        while True:
+            path = os.path.join(directory, f'slot-{slot}')
+            os.makedirs(path, exist_ok=True)
+            if fcntl is None:  # no flock: one process per journal directory
+                return path
+            lock_file = _try_lock(path)
+            if lock_file is not None:
+                self._lock_file = lock_file
+                return path
+            slot += 1
+
+    def _claim_orphans(self, directory):
+        """Lock the other slots whose owner is gone and return their segments, to replay with ours"""
+        segments = []
+        if fcntl is None:
+            return segments
+        for path in sorted(glob.glob(os.path.join(directory, 'slot-*'))):
+            if path == self.directory:
+                continue
+            lock_file = _try_lock(path)
+            if lock_file is None:
+                continue  # a live worker owns it
+            orphaned = sorted(glob.glob(os.path.join(path, 'segment-*.log')))
+            if orphaned:
+                logger.warning('Replaying %d journal segments left in %s', len(orphaned), path)
+                segments.extend(orphaned)
+                self._orphan_locks.append(lock_file)
+            else:
+                lock_file.close()
+        return segments
+
+    def release_orphans(self):
+        """Unlock the slots of dead workers once their segments are replayed"""
+        for lock_file in self._orphan_locks:
+            lock_file.close()
+        self._orphan_locks = []
+
+    def _open_segment(self):
+        self._segment += 1
+        self.segment_token = uuid.uuid4().hex
+        self._path = os.path.join(self.directory, f'segment-{self._segment:08d}.log')
+        self._file = open(self._path, 'ab')
+
+    def read_recovered(self):
+        """Records of the segments left over from a previous run, oldest first"""
+        records = []
+        for path in self.recovered:
+            with open(path, 'rb') as f:
+                lines = f.read().split(b'\n')
+            for n, line in enumerate(lines):
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # Only the last line can be torn by a crash mid-write
+                    if n != len(lines) - 1:
+                        raise
+                    logger.warning('Ignoring torn journal line at the end of %s', path)
+                    continue
+                records.append(record)
+        return records
+
+    def write(self, record):
+        """Append one record and return its sequence number; the caller serializes writers"""
+        self._file.write(json.dumps(record, separators=(',', ':')).encode('utf-8') + b'\n')
+        self._written += 1
+        return self._written
+
+    def sync(self, seq):
+        """Return once record seq is on disk, fsyncing everything written so far if needed"""
+        with self._sync_lock:
+            if self._synced >= seq:
+                return
+            target = self._written
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+            self._synced = max(self._synced, target)
+
+    def rotate(self):
+        """Close the active segment (synced) and start a new one; returns the closed segment path"""
+        with self._sync_lock:
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+            self._synced = self._written
+            self._file.close()
+            closed = self._path
+            self._open_segment()
+        return closed
+
+    def close(self):
+        """Close the active segment and unlock the slot, so another journal can take it over"""
+        with self._sync_lock:
+            self._file.close()
+            self.closed = True
+        self.release_orphans()
+        lock_file = getattr(self, '_lock_file', None)
+        if lock_file is not None:
+            lock_file.close()
+
+    def discard(self, paths):
+        for path in paths:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+class WriteBehindQueue:
+    """Journals rows on submit and inserts them in batches on a background thread"""
+
+    def __init__(self, app, journal, flush, interval=0.05, batch_size=500, retry_interval=1.0):
+        self.app = app
+        self.journal = journal
+        # callable(records) inserting them in one transaction, inside an app context, together with
+        # their segment tokens; records of segments whose token is already recorded must be skipped
+        self.flush = flush
+        self.interval = interval
+        self.batch_size = batch_size
+        self.retry_interval = retry_interval
+        self.flushed = 0
+        self.batches = 0
+        self.failures = 0
+        self._pending = []
+        self._lock = threading.Lock()
+        self._ready = threading.Condition(self._lock)
+        self._stop = threading.Event()
+        self._thread = None
+
+    def pending(self):
+        return len(self._pending)
+
+    def start(self):
+        """Start the flusher; it replays recovered segments before anything new"""
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name='write-behind', daemon=True)
+                self._thread.start()
+                atexit.register(self.stop)
+
+    def submit(self, table, values):
+        """Journal a row for `table`; durable when this returns"""
+        with self._lock:
+            # Rotation happens under the same lock, so the token names the segment the record lands in
+            record = {'table': table, 'segment': self.journal.segment_token, 'values': encode_row(values)}
+            seq = self.journal.write(record)
+            self._pending.append(record)
+            if len(self._pending) == 1 or len(self._pending) >= self.batch_size:
+                self._ready.notify()
+        self.journal.sync(seq)
+
+    def stop(self, timeout=10):
+        """Flush what is pending, stop the flusher and close the journal"""
+        self._stop.set()
+        with self._lock:
+            self._ready.notify()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            if self._thread.is_alive():
+                return  # still retrying a flush; leave the journal to it
+        with self._lock:
+            if not self.journal.closed:
+                self.journal.close()
+
+    def _run(self):
+        recovered = self.journal.read_recovered()
+        if recovered:
+            logger.info('Replaying %d journaled writes', len(recovered))
+            self._flush_until_done(recovered, self.journal.recovered)
+        self.journal.release_orphans()
+        while True:
+            with self._lock:
+                # Sleep until the first row arrives, then give others up to `interval` to join it
+                self._ready.wait_for(lambda: self._pending or self._stop.is_set())
+                self._ready.wait_for(lambda: len(self._pending) >= self.batch_size or self._stop.is_set(),
+                                     self.interval)
+                batch, self._pending = self._pending, []
+                # Everything in the batch is in the segments closed here, and nothing else is
+                segments = [self.journal.rotate()] if batch else []
+            if batch:
+                self._flush_until_done(batch, segments)
+            elif self._stop.is_set():
+                return
+
+    def _flush_until_done(self, batch, segments):
+        """Insert a batch, retrying until it commits; the journal keeps it safe meanwhile"""
+        while True:
+            try:
+                with self.app.app_context():
+                    self.flush(batch)
+                break
+            except Exception:
+                self.failures += 1
+                logger.exception('Write-behind flush of %d rows failed; retrying', len(batch))
+                if self._stop.wait(self.retry_interval):
+                    # Shutting down: the rows stay in the journal and are replayed on the next start
+                    return
+        self.journal.discard(segments)
+        self.flushed += len(batch)
+        self.batches += 1
+
+
+def create_write_behind(app, db, flush, block_table, tables):
+    """
+    Build (queue, {table name: IdAllocator}) from Flask config values, or
+    (None, {}) when write-behind is disabled
+    """
+    config = app.config
+    if not config.get('WRITE_BEHIND_ENABLED', False):
+        return None, {}
+    journal = WriteJournal(config.get('WRITE_BEHIND_JOURNAL_DIR', 'write_journal'),
+                           fsync=config.get('WRITE_BEHIND_FSYNC', True))
+    queue = WriteBehindQueue(
+        app, journal, flush,
+        interval=config.get('WRITE_BEHIND_INTERVAL', 0.05),
+        batch_size=config.get('WRITE_BEHIND_BATCH_SIZE', 500)
+    )
+    block_size = config.get('WRITE_BEHIND_ID_BLOCK', 1000)
+    allocators = {table.name: IdAllocator(db, table, block_table, block_size) for table in tables}
+    return queue, allocators
@@ -5,6 +5,8 @@ import axios from 'axios'
 const Admin = () => {
   const [appointments, setAppointments] = useState([])
   const [emergencies, setEmergencies] = useState([])
+  const [appointmentsCursor, setAppointmentsCursor] = useState(null)
+  const [emergenciesCursor, setEmergenciesCursor] = useState(null)
   const [loading, setLoading] = useState(true)
   const [activeTab, setActiveTab] = useState('appointments')
 
@@ -12,6 +14,16 @@ const Admin = () => {
     fetchData()
   }, [])
 
+  // Receive new emergency alerts as they happen instead of re-polling
+  useEffect(() => {
+    const source = new EventSource('/api/admin/emergencies/stream')
+    source.addEventListener('emergency', (event) => {
+      const alert = JSON.parse(event.data)
+      setEmergencies((prev) => (prev.some((a) => a.id === alert.id) ? prev : [alert, ...prev]))
+    })
+    return () => source.close()
+  }, [])
+
   const fetchData = async () => {
     setLoading(true)
     try {
@@ -22,10 +34,12 @@ const Admin = () => {
 
       if (appointmentsRes.data.success) {
         setAppointments(appointmentsRes.data.appointments)
+        setAppointmentsCursor(appointmentsRes.data.next_cursor)
       }
 
       if (emergenciesRes.data.success) {
         setEmergencies(emergenciesRes.data.alerts)
+        setEmergenciesCursor(emergenciesRes.data.next_cursor)
       }
     } catch (error) {
       console.error('Failed to fetch admin data:', error)
@@ -34,6 +48,30 @@ const Admin = () => {
     }
   }
 
+  const loadMoreAppointments = async () => {
+    try {
+      const res = await axios.get('/api/admin/appointments', { params: { cursor: appointmentsCursor } })
+      if (res.data.success) {
+        setAppointments((prev) => [...prev, ...res.data.appointments])
+        setAppointmentsCursor(res.data.next_cursor)
+      }
+    } catch (error) {
+      console.error('Failed to load more appointments:', error)
+    }
+  }
+
+  const loadMoreEmergencies = async () => {
+    try {
+      const res = await axios.get('/api/admin/emergencies', { params: { cursor: emergenciesCursor } })
+      if (res.data.success) {
+        setEmergencies((prev) => [...prev, ...res.data.alerts])
+        setEmergenciesCursor(res.data.next_cursor)
+      }
+    } catch (error) {
+      console.error('Failed to load more emergencies:', error)
+    }
+  }
+
   const formatDate = (dateString) => {
     try {
       const date = new Date(dateString)
@@ -167,6 +205,16 @@ const Admin = () => {
                         </div>
                       ))
                     )}
+                    {appointmentsCursor && (
+                      <div className="text-center">
+                        <button
+                          onClick={loadMoreAppointments}
+                          className="text-blue-600 font-semibold hover:underline"
+                        >
+                          Load more appointments
+                        </button>
+                      </div>
+                    )}
                   </div>
                 )}
 
@@ -219,6 +267,16 @@ const Admin = () => {
                         </div>
                       ))
                     )}
+                    {emergenciesCursor && (
+                      <div className="text-center">
+                        <button
+                          onClick={loadMoreEmergencies}
+                          className="text-red-600 font-semibold hover:underline"
+                        >
+                          Load more alerts
+                        </button>
+                      </div>
+                    )}
                   </div>
                 )}
               </>